@@ -49,6 +49,8 @@ DEFAULT_RENAME_MAP: Dict[str, str] = {
 class ExtractorConfig:
     allowed_sizes: Set[Tuple[int, int]] = field(default_factory=lambda: set(DEFAULT_ALLOWED_SIZES))
     rename_map: Dict[str, str] = field(default_factory=lambda: dict(DEFAULT_RENAME_MAP))
+    # True: 画像抽出時の to_markdown 結果をテキスト抽出にも流用（PDF解析を1回で済ませる）
+    single_pass: bool = True
 
 
 # =========================
@@ -107,8 +109,8 @@ class PdfExtractor:
         filtered_dir = os.path.join(out_root, "filtered_images")
         json_path = os.path.join(out_root, "report_metadata.json")
 
-        # 1) 画像抽出
-        self._extract_all_images(pdf_path, raw_img_dir)
+        # 1) 画像抽出（同じ解析結果の Markdown も受け取る）
+        md_text = self._extract_all_images(pdf_path, raw_img_dir)
 
         # 2) 画像フィルタ
         n_filtered = self._filter_images_by_size(raw_img_dir, filtered_dir, self.config.allowed_sizes)
@@ -116,8 +118,9 @@ class PdfExtractor:
         # 3) リネーム
         n_renamed = self._rename_filtered_images(filtered_dir, self.config.rename_map)
 
-        # 4) テキスト→JSON
-        md_text = self._convert_pdf_to_markdown_string(pdf_path)
+        # 4) テキスト→JSON（single_pass=False の場合のみ再解析）
+        if not self.config.single_pass:
+            md_text = self._convert_pdf_to_markdown_string(pdf_path)
         report_data = self._extract_and_format_report_data(md_text)
         self._write_json(json_path, report_data)
 
@@ -133,11 +136,15 @@ class PdfExtractor:
         return info
 
     # --- 内部処理 ---
-    def _extract_all_images(self, pdf_path: str, output_dir: str) -> None:
+    def _extract_all_images(self, pdf_path: str, output_dir: str) -> str:
+        """
+        画像を output_dir に書き出し、同じ解析で得た Markdown 文字列を返す。
+        画像リンク行 (![](...)) が混ざる以外はテキスト専用変換と同じ内容。
+        """
         pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
         self.logger.info("画像抽出: %s -> %s", pdf_path, output_dir)
         try:
-            pymupdf4llm.to_markdown(
+            md = pymupdf4llm.to_markdown(
                 doc=pdf_path,
                 write_images=True,
                 image_path=output_dir,
@@ -145,6 +152,7 @@ class PdfExtractor:
                 dpi=300,
             )
             self.logger.info("画像抽出完了")
+            return md
         except Exception as e:
             self.logger.exception("画像抽出に失敗しました: %s", e)
             raise
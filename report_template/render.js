@@ -1,6 +1,7 @@
 // render.js (ESM)
 import fs from "node:fs/promises";
 import path from "node:path";
+import readline from "node:readline";
 import { fileURLToPath, pathToFileURL } from "node:url";
 import puppeteer from "puppeteer";
 
@@ -25,7 +26,7 @@ function toBaseUrl(dirPath) {
 }
 
 function parseArgs(argv) {
-  const flags = { html: null };
+  const flags = { html: null, server: false, batch: null, pool: 4 };
   const positional = [];
   for (let i = 0; i < argv.length; i++) {
     const a = argv[i];
@@ -33,6 +34,18 @@ function parseArgs(argv) {
       flags.html = argv[++i];
       continue;
     }
+    if (a === "--batch") {
+      flags.batch = argv[++i];
+      continue;
+    }
+    if (a === "--pool") {
+      flags.pool = Math.max(1, parseInt(argv[++i], 10) || 1);
+      continue;
+    }
+    if (a === "--server") {
+      flags.server = true;
+      continue;
+    }
     positional.push(a);
   }
   return { flags, positional };
@@ -43,11 +56,20 @@ async function readTrichoData(tempDir) {
   const raw = await fs.readFile(p, "utf8");
   const json = JSON.parse(raw);
 
-  // 期待構造: { report_metadata: {...}, tricho_analysis: [...] }
+  // 期待構造: { report_metadata: {...}, tricho_analysis: [...], trend?: {...}, norms?: {...} }
   const meta = json.report_metadata || {};
   const arr = Array.isArray(json.tricho_analysis) ? json.tricho_analysis : [];
+  const trend = json.trend || null;
+  const norms = json.norms || null;
+
+  return { meta, arr, trend, norms };
+}
 
-  return { meta, arr };
+// filtered_images の拡張子（xref 抽出ではネイティブの jpeg になる）
+async function detectImageExt(dirPath, fallback = "png") {
+  const names = await fs.readdir(dirPath).catch(() => []);
+  const hit = names.find((n) => /\.(png|jpe?g)$/i.test(n));
+  return hit ? path.extname(hit).slice(1).toLowerCase() : fallback;
 }
 
 function safeMeta(meta, key, fallback) {
@@ -57,105 +79,97 @@ function safeMeta(meta, key, fallback) {
   return s ? s : fallback;
 }
 
-async function main() {
-  const [, , ...raw] = process.argv;
-  const { flags, positional } = parseArgs(raw);
-
-  if (positional.length < 1) {
-    console.error(
-      "Usage:\n" +
-        "  node render.js <temp_dir> [out.pdf] [--html /path/to/report.html]\n\n" +
-        "Assumptions:\n" +
-        "  <temp_dir>/tricho_data.json\n" +
-        "  <temp_dir>/filtered_images/*.png            # 本人（B）\n" +
-        "Output:\n" +
-        "  PDF => parent(<temp_dir>)/report-YYYYMMDD-HHMMSS.pdf  (or specified name)"
-    );
-    process.exit(1);
-  }
-
-  const tempDir = path.resolve(positional[0]);
-  const outNameMaybe = positional[1];
-  const htmlPath = flags.html ? path.resolve(flags.html) : DEFAULT_HTML_PATH;
+// ログ出力先（--server では STDOUT を応答専用にするため STDERR へ切り替える）
+let log = (...a) => console.log(...a);
 
+// ジョブ（temp_dir / out_pdf / html）を絶対パスに解決
+function resolveJob({ temp_dir, out_pdf, html }) {
+  const tempDir = path.resolve(temp_dir);
+  const htmlPath = html ? path.resolve(html) : DEFAULT_HTML_PATH;
   // 出力は temp 親ディレクトリ
   const parentDir = path.dirname(tempDir);
   const outPath = path.join(
     parentDir,
-    outNameMaybe && path.extname(outNameMaybe).toLowerCase() === ".pdf"
-      ? outNameMaybe
+    out_pdf && path.extname(out_pdf).toLowerCase() === ".pdf"
+      ? out_pdf
       : `report-${ts()}.pdf`
   );
+  return { tempDir, htmlPath, outPath, htmlOverride: Boolean(html) };
+}
 
-  // 進行ログ
-  console.log("=== Tricho Report Render ===");
-  console.log("temp_dir        :", tempDir);
-  console.log(
-    "html            :",
-    htmlPath,
-    flags.html ? "(override)" : "(default)"
-  );
-  console.log("pdf_out         :", outPath);
+async function launchBrowser() {
+  return puppeteer.launch({
+    args: ["--no-sandbox", "--disable-setuid-sandbox"],
+    headless: "new",
+  });
+}
+
+// テンプレートを読み込んだページを用意（renderReportFromJson は #page を作り直すので使い回せる）
+async function openTemplatePage(browser, htmlPath) {
+  await fs.access(htmlPath).catch(() => {
+    throw new Error(`Missing HTML: ${htmlPath}`);
+  });
+  const page = await browser.newPage();
+  // 同じ temp_dir を再描画したときに古い画像を掴まないようキャッシュを切る
+  await page.setCacheEnabled(false);
+
+  // ページ側 console をターミナルに中継
+  page.on("console", (msg) => {
+    const type = msg.type();
+    const text = msg.text();
+    // 長い dataURL を抑制したい場合は適宜短縮
+    log(`[page:${type}]`, text);
+  });
+
+  log("▶ Loading HTML ...");
+  await page.goto(pathToFileURL(htmlPath).href, {
+    waitUntil: "domcontentloaded",
+  });
+  return page;
+}
+
+// 読み込み済みテンプレートページに 1 件描画して PDF を書き出す
+async function renderJob(page, job) {
+  const { tempDir, outPath } = job;
+  const ms = {};
+  let t = Date.now();
 
   // 入力の存在チェック
-  console.log("▶ Checking inputs...");
+  log("▶ Checking inputs...");
   const dataJsonPath = path.join(tempDir, "tricho_data.json");
   await fs.access(dataJsonPath).catch(() => {
-    console.error("✗ Missing file:", dataJsonPath);
-    process.exit(1);
-  });
-  await fs.access(htmlPath).catch(() => {
-    console.error("✗ Missing HTML:", htmlPath);
-    process.exit(1);
+    throw new Error(`Missing file: ${dataJsonPath}`);
   });
 
   // データ読込
-  console.log("▶ Reading tricho_data.json ...");
-  const { meta, arr } = await readTrichoData(tempDir);
+  log("▶ Reading tricho_data.json ...");
+  const { meta, arr, trend, norms } = await readTrichoData(tempDir);
   const patientId = safeMeta(meta, "name", "-");
   const examDate = safeMeta(
     meta,
     "appointment_date",
     new Date().toLocaleString("ja-JP")
   );
-  console.log("  patientId     :", patientId);
-  console.log("  examDate      :", examDate);
-  console.log("  regions(count):", arr.length);
+  log("  patientId     :", patientId);
+  log("  examDate      :", examDate);
+  log("  regions(count):", arr.length);
 
   // 画像ディレクトリ
   const patientImagesDir = path.join(tempDir, "filtered_images");
   const normalImagesDir = path.join(__dirname, "normal_images");
-  console.log("  images.A(normal):", normalImagesDir);
-  console.log("  images.B(patient):", patientImagesDir);
-
-  // Puppeteer
-  console.log("▶ Launching browser...");
-  const browser = await puppeteer.launch({
-    args: ["--no-sandbox", "--disable-setuid-sandbox"],
-    headless: "new",
-  });
-  const page = await browser.newPage();
-
-  // ページ側 console をターミナルに中継
-  page.on("console", (msg) => {
-    const type = msg.type();
-    const text = msg.text();
-    // 長い dataURL を抑制したい場合は適宜短縮
-    console.log(`[page:${type}]`, text);
-  });
-
-  console.log("▶ Loading HTML ...");
-  const url = pathToFileURL(htmlPath).href;
-  await page.goto(url, { waitUntil: "domcontentloaded" });
+  log("  images.A(normal):", normalImagesDir);
+  log("  images.B(patient):", patientImagesDir);
 
   // 画像ベースURL
   const images = {
     normalBaseUrl: toBaseUrl(normalImagesDir),
     patientBaseUrl: toBaseUrl(patientImagesDir),
+    patientExt: await detectImageExt(patientImagesDir),
   };
+  ms.read = Date.now() - t;
 
-  console.log("▶ Injecting data & rendering ...");
-  console.time("render:evaluate");
+  log("▶ Injecting data & rendering ...");
+  t = Date.now();
   await page.evaluate(
     (payload) => {
       if (typeof window.renderReportFromJson !== "function") {
@@ -170,32 +184,216 @@ async function main() {
         examDate,
         thresholds: { thin60: 0.3, ratio_max: 1.8, ultra30: 0.15 },
         images,
+        trend,
+        norms,
       },
     }
   );
-  console.timeEnd("render:evaluate");
+  ms.evaluate = Date.now() - t;
 
-  console.log("▶ Waiting for DOM to settle (logic table) ...");
+  log("▶ Waiting for DOM to settle (logic table) ...");
+  t = Date.now();
   await page
     .waitForSelector("#mini tbody tr", { timeout: 8000 })
     .catch(() => {});
-  const cardCount = await page
-    .$$eval(".card", (els) => els.length)
-    .catch(() => 0);
-  console.log("  cards rendered:", cardCount);
+  // 差し替えた画像の読み込み完了を待つ
+  await page
+    .evaluate(() =>
+      Promise.all(
+        Array.from(document.images, (img) =>
+          img.complete ? null : img.decode().catch(() => null)
+        )
+      )
+    )
+    .catch(() => {});
+  const cards = await page.$$eval(".card", (els) => els.length).catch(() => 0);
+  log("  cards rendered:", cards);
+  ms.settle = Date.now() - t;
 
-  console.log("▶ Exporting PDF ...");
-  console.time("pdf:write");
+  log("▶ Exporting PDF ...");
+  t = Date.now();
   await page.emulateMediaType("screen");
   await page.pdf({
     path: outPath,
     printBackground: true,
     preferCSSPageSize: true, // HTMLの@page（横向きA4）を尊重
   });
-  console.timeEnd("pdf:write");
+  ms.pdf = Date.now() - t;
+
+  return { pdf_out: outPath, cards, ms };
+}
 
+async function runOnce(flags, positional) {
+  const job = resolveJob({
+    temp_dir: positional[0],
+    out_pdf: positional[1],
+    html: flags.html,
+  });
+
+  // 進行ログ
+  log("=== Tricho Report Render ===");
+  log("temp_dir        :", job.tempDir);
+  log(
+    "html            :",
+    job.htmlPath,
+    job.htmlOverride ? "(override)" : "(default)"
+  );
+  log("pdf_out         :", job.outPath);
+
+  log("▶ Launching browser...");
+  const browser = await launchBrowser();
+  try {
+    const page = await openTemplatePage(browser, job.htmlPath);
+    const res = await renderJob(page, job);
+    log("  timings(ms)   :", JSON.stringify(res.ms));
+  } finally {
+    await browser.close();
+  }
+  log("✔ Done. Saved:", job.outPath);
+}
+
+// 常駐モード: ブラウザとテンプレートページを温めたまま、STDIN の JSON Lines でジョブを受け付ける。
+//   入力: {"id": ..., "temp_dir": "...", "out_pdf": "...", "html": "..."}   （out_pdf / html は省略可）
+//   出力: {"id": ..., "ok": true, "pdf_out": "...", "cards": n, "ms": {...}} または {"id": ..., "ok": false, "error": "..."}
+//   起動完了時に {"event": "ready"} を 1 行出す。STDIN が閉じられたら終了。
+async function runServer() {
+  log = (...a) => console.error(...a);
+  const send = (obj) => process.stdout.write(JSON.stringify(obj) + "\n");
+
+  const browser = await launchBrowser();
+  // ブラウザが落ちたらプロセスごと終了し、クライアント側で再起動させる
+  browser.on("disconnected", () => {
+    log("✗ Browser disconnected");
+    process.exit(2);
+  });
+  const pages = new Map(); // htmlPath -> 読み込み済みページ
+  const pageFor = async (htmlPath) => {
+    let page = pages.get(htmlPath);
+    if (!page || page.isClosed()) {
+      page = await openTemplatePage(browser, htmlPath);
+      pages.set(htmlPath, page);
+    }
+    return page;
+  };
+  await pageFor(DEFAULT_HTML_PATH);
+  send({ event: "ready" });
+
+  const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+  for await (const line of rl) {
+    if (!line.trim()) continue;
+    let id = null;
+    let job = null;
+    try {
+      const req = JSON.parse(line);
+      id = req.id ?? null;
+      job = resolveJob(req);
+      log(`=== job ${id}: ${job.tempDir} -> ${job.outPath}`);
+      const page = await pageFor(job.htmlPath);
+      send({ id, ok: true, ...(await renderJob(page, job)) });
+    } catch (e) {
+      log("✗ Error:", e);
+      // 失敗したページは状態が不明なので捨てて次回作り直す
+      if (job && pages.has(job.htmlPath)) {
+        await pages.get(job.htmlPath).close().catch(() => {});
+        pages.delete(job.htmlPath);
+      }
+      send({ id, ok: false, error: String(e?.message ?? e) });
+    }
+  }
+  browser.removeAllListeners("disconnected");
   await browser.close();
-  console.log("✔ Done. Saved:", outPath);
+}
+
+// バッチモード: 1 つのブラウザと最大 pool 枚のページで manifest の全ジョブを描画する。
+//   manifest: [{"temp_dir": "...", "out_pdf": "...", "html": "..."}, ...]  または {"jobs": [...], "pool": n}
+//   出力: 1 ジョブ終わるごとに {"index": i, "ok": ..., "pdf_out"/"error", "ms": {...}} を 1 行、
+//         最後に {"event": "done", "ok": n, "failed": m, "ms": total}。1 件の失敗でバッチは止めない。
+async function runBatch(manifestPath, pool) {
+  log = (...a) => console.error(...a);
+  const send = (obj) => process.stdout.write(JSON.stringify(obj) + "\n");
+
+  const manifest = JSON.parse(await fs.readFile(manifestPath, "utf8"));
+  const jobs = Array.isArray(manifest) ? manifest : manifest.jobs || [];
+  if (!Array.isArray(manifest) && manifest.pool) pool = Math.max(1, manifest.pool);
+  const started = Date.now();
+
+  // 同じ親ディレクトリ・同じ秒の既定名がぶつからないよう連番を付ける
+  const used = new Set();
+  const resolve = (j) => {
+    const job = resolveJob(j);
+    let out = job.outPath;
+    for (let n = 2; used.has(out); n++) {
+      out = job.outPath.replace(/\.pdf$/i, `-${n}.pdf`);
+    }
+    used.add(out);
+    return { ...job, outPath: out };
+  };
+
+  const browser = await launchBrowser();
+  let next = 0;
+  let ok = 0;
+  let failed = 0;
+  // ワーカー 1 つが 1 枚のページ（html ごと）を持ち、空いたら次のジョブを取る。
+  // manifest の 1 件が壊れていても（temp_dir が無いなど）その index の失敗として返し、他は続ける
+  const worker = async () => {
+    const pages = new Map();
+    while (next < jobs.length) {
+      const index = next++;
+      const t = Date.now();
+      let job = null;
+      try {
+        job = resolve(jobs[index]);
+        let page = pages.get(job.htmlPath);
+        if (!page || page.isClosed()) {
+          page = await openTemplatePage(browser, job.htmlPath);
+          pages.set(job.htmlPath, page);
+        }
+        const res = await renderJob(page, job);
+        ok++;
+        send({ index, ok: true, temp_dir: job.tempDir, ...res, ms: { ...res.ms, total: Date.now() - t } });
+      } catch (e) {
+        failed++;
+        const tempDir = job ? job.tempDir : jobs[index]?.temp_dir ?? null;
+        log(`✗ job ${index} (${tempDir}):`, e);
+        if (job && pages.has(job.htmlPath)) {
+          await pages.get(job.htmlPath).close().catch(() => {});
+          pages.delete(job.htmlPath);
+        }
+        send({ index, ok: false, temp_dir: tempDir, error: String(e?.message ?? e), ms: { total: Date.now() - t } });
+      }
+    }
+    await Promise.all([...pages.values()].map((p) => p.close().catch(() => {})));
+  };
+  try {
+    await Promise.all(Array.from({ length: Math.min(pool, jobs.length) }, worker));
+  } finally {
+    await browser.close();
+  }
+  send({ event: "done", ok, failed, pool, ms: Date.now() - started });
+}
+
+async function main() {
+  const [, , ...raw] = process.argv;
+  const { flags, positional } = parseArgs(raw);
+
+  if (flags.server) return runServer();
+  if (flags.batch) return runBatch(path.resolve(flags.batch), flags.pool);
+
+  if (positional.length < 1) {
+    console.error(
+      "Usage:\n" +
+        "  node render.js <temp_dir> [out.pdf] [--html /path/to/report.html]\n" +
+        "  node render.js --server      # STDIN/STDOUT JSON Lines で常駐\n" +
+        "  node render.js --batch manifest.json [--pool N]\n\n" +
+        "Assumptions:\n" +
+        "  <temp_dir>/tricho_data.json\n" +
+        "  <temp_dir>/filtered_images/*.png            # 本人（B）\n" +
+        "Output:\n" +
+        "  PDF => parent(<temp_dir>)/report-YYYYMMDD-HHMMSS.pdf  (or specified name)"
+    );
+    process.exit(1);
+  }
+  return runOnce(flags, positional);
 }
 
 main().catch((e) => {
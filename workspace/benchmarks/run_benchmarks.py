@@ -0,0 +1,244 @@
+"""
+tricho_pipeline のマイクロベンチマーク。
+
+  python benchmarks/run_benchmarks.py                      # 全ベンチ → benchmarks/results/latest.json
+  python benchmarks/run_benchmarks.py --quick              # 小さいサイズのみ
+  python benchmarks/run_benchmarks.py -k analyze -k newest # 名前に部分一致するものだけ
+  python benchmarks/run_benchmarks.py --save-baseline benchmarks/results/baseline.json
+  python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json --tolerance 0.25
+
+--compare では中央値が baseline の (1 + tolerance) 倍を超えたものを回帰として表示し、終了コード 1 を返す。
+import チェック（`newest` 系サブコマンドが numpy / pandas / pymupdf を読み込まないこと）は常に実行し、違反も回帰扱い。
+"""
+from __future__ import annotations
+import os, sys, json, time, shutil, argparse, platform, statistics, subprocess, tempfile
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), "src")
+sys.path.insert(0, SRC)
+sys.path.insert(0, HERE)
+
+import synth  # noqa: E402
+
+HAIR_SIZES = [100, 1_000, 10_000, 100_000]
+QUICK_HAIR_SIZES = [100, 1_000]
+# `newest` 系で読み込まれてはいけないモジュール
+HEAVY_MODULES = ("numpy", "pandas", "pymupdf", "pymupdf4llm", "PIL")
+
+def measure(fn: Callable[[], Any], *, repeat: int = 5, warmup: int = 1, setup: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {"min_s": min(times), "median_s": statistics.median(times), "repeat": repeat}
+
+class Suite:
+    def __init__(self, work: str, quick: bool, filters: List[str]) -> None:
+        self.work = work
+        self.quick = quick
+        self.filters = filters
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.failures: List[str] = []
+
+    def wants(self, name: str) -> bool:
+        return not self.filters or any(f in name for f in self.filters)
+
+    def add(self, name: str, fn: Callable[[], Any], *, params: Optional[Dict[str, Any]] = None, **kw) -> None:
+        if not self.wants(name):
+            return
+        r = measure(fn, **kw)
+        r["params"] = params or {}
+        self.results[name] = r
+        print(f"  {name:<48} median {r['median_s'] * 1000:9.2f} ms   min {r['min_s'] * 1000:9.2f} ms", flush=True)
+
+    def sizes(self) -> List[int]:
+        return QUICK_HAIR_SIZES if self.quick else HAIR_SIZES
+
+# --- 各ベンチ ---
+def bench_analyzer(s: Suite) -> None:
+    from tricho_pipeline.analysis.tricho_analyzer import TrichoAnalyzer, analyze_tricho_file
+    from tricho_pipeline.analysis.tricho_loader import loads_tricho
+    from tricho_pipeline.analysis.schemes import build_schemes
+
+    an = TrichoAnalyzer()
+    multi = TrichoAnalyzer(schemes=build_schemes(["fine_10um", "vellus_terminal", "thickness:valid,score>=0.8"]))
+    extras = TrichoAnalyzer(follicle_units=True, heatmap_cell_mm=1.0)  # 既定では出さない毛包単位・密度マップ込み
+    for n in s.sizes():
+        d = synth.make_tricho(n, seed=n)
+        text = json.dumps(d)
+        rec = loads_tricho(text)
+        path = os.path.join(s.work, f"analyze_{n}", "tricho_0.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        rep = 3 if n >= 100_000 else 7
+        s.add(f"analyze.dict[{n}]", lambda: an.analyze(d), params={"hairs": n}, repeat=rep)
+        s.add(f"analyze.record[{n}]", lambda: an.analyze(rec), params={"hairs": n}, repeat=rep)
+        s.add(f"analyze.record.4schemes[{n}]", lambda: multi.analyze(rec), params={"hairs": n, "schemes": 4}, repeat=rep)
+        s.add(f"analyze.record.units+heatmap[{n}]", lambda: extras.analyze(rec), params={"hairs": n}, repeat=rep)
+        s.add(f"load_tricho[{n}]", lambda: loads_tricho(text), params={"hairs": n}, repeat=rep)
+        s.add(f"analyze_tricho_file[{n}]", lambda: analyze_tricho_file(path, an), params={"hairs": n}, repeat=rep)
+    recs = [loads_tricho(json.dumps(synth.make_tricho(1_000, seed=i))) for i in range(64)]
+    s.add("analyze_many[64x1000]", lambda: an.analyze_many(recs), params={"rois": 64, "hairs": 1000})
+
+def bench_run_on_dir(s: Suite) -> None:
+    from tricho_pipeline.analysis.tricho_analyzer import run_on_dir
+
+    n = 10_000 if s.quick else 100_000
+    d = os.path.join(s.work, f"run_on_dir_{n}")
+    synth.write_tricho_dir(d, n, n_files=4)
+    for workers, executor in [(1, "thread"), (4, "thread"), (4, "process")]:
+        s.add(f"run_on_dir[4x{n},{executor}x{workers}]", lambda: run_on_dir(d, workers=workers, executor=executor),
+              params={"files": 4, "hairs": n, "workers": workers, "executor": executor}, repeat=3)
+
+def bench_newest(s: Suite) -> None:
+    from tricho_pipeline.core.io_utils import newest_path_in, newest_path_and_pdf
+    from tricho_pipeline.core.mtime_index import MtimeIndex
+
+    for n in ([1_000] if s.quick else [1_000, 10_000]):
+        root = synth.make_db_tree(os.path.join(s.work, f"db_{n}"), n)
+        s.add(f"newest_path_in[{n}]", lambda: newest_path_in(root), params={"entries": n})
+        s.add(f"newest_path_and_pdf[{n}]", lambda: newest_path_and_pdf(root), params={"entries": n})
+        idx = MtimeIndex(os.path.join(s.work, f"db_{n}.sqlite"), root)
+        idx.refresh()
+        s.add(f"mtime_index.refresh[{n}]", idx.refresh, params={"entries": n})
+        s.add(f"mtime_index.newest_with_pdf[{n}]", idx.newest_with_pdf, params={"entries": n})
+        idx.close()
+
+def bench_extractor(s: Suite) -> None:
+    import logging
+    from tricho_pipeline.core.config import ExtractorConfig
+    from tricho_pipeline.extraction.pdf_extractor import PdfExtractor
+    from tricho_pipeline.extraction.report_metadata import extract_report_metadata
+
+    logger = logging.getLogger("bench_extractor")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    pages = [(3, 1)] if s.quick else [(3, 1), (6, 6)]
+    for layout in pages:
+        pdf = synth.make_report_pdf(os.path.join(s.work, f"report_{layout[0]}_{layout[1]}.pdf"), images_per_page=layout)
+        tag = f"{sum(layout)}img"
+        s.add(f"extract_report_metadata[{tag}]", lambda: extract_report_metadata(pdf), params={"images": layout})
+        configs = {
+            "render": ExtractorConfig(),
+            "render+direct": ExtractorConfig(direct_output=True),
+            "xref+direct+header": ExtractorConfig(image_engine="xref", direct_output=True, metadata_source="header"),
+        }
+        for label, cfg in configs.items():
+            out = os.path.join(s.work, f"extract_{label}_{tag}")
+            ex = PdfExtractor(config=cfg, logger=logger)
+            s.add(f"pdf_extractor[{label},{tag}]", lambda: ex.extract_pdf_assets(pdf, out),
+                  setup=lambda: shutil.rmtree(out, ignore_errors=True), params={"images": layout}, repeat=3)
+
+def bench_orchestrator(s: Suite) -> None:
+    from tricho_pipeline.core.config import PipelineConfig, ExtractorConfig
+    from tricho_pipeline.core.orchestrator import Orchestrator
+
+    n = 1_000 if s.quick else 10_000
+    jdir = os.path.join(s.work, f"orch_json_{n}")
+    synth.write_tricho_dir(jdir, n, n_files=4)
+    pdf = synth.make_report_pdf(os.path.join(s.work, "orch_report.pdf"))
+    configs = {
+        "default": PipelineConfig(log_console=False),
+        "xref+direct": PipelineConfig(
+            log_console=False, extractor=ExtractorConfig(image_engine="xref", direct_output=True, metadata_source="header")),
+    }
+    for label, cfg in configs.items():
+        out = os.path.join(s.work, f"orch_out_{label}")
+        orch = Orchestrator(cfg)
+        def run() -> None:
+            orch.run(jdir, pdf, out)
+            orch.wait_background()
+        s.add(f"orchestrator.run[{label},4x{n}]", run, setup=lambda: shutil.rmtree(out, ignore_errors=True),
+              params={"files": 4, "hairs": n}, repeat=3)
+
+def bench_cli_import(s: Suite) -> None:
+    """`newest` 系の起動コスト（別プロセスで import のみ）。重いモジュールを読み込んでいたら失敗扱い"""
+    code = (
+        "import sys, time; t = time.perf_counter(); import tricho_pipeline.cli.main; "
+        "print(time.perf_counter() - t); print(','.join(m for m in %r if m in sys.modules))" % (HEAVY_MODULES,)
+    )
+    env = dict(os.environ, PYTHONPATH=SRC + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    def run() -> None:
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True).stdout.split("\n")
+        loaded = [m for m in out[1].split(",") if m]
+        if loaded and "cli.import: " + ",".join(loaded) not in s.failures:
+            s.failures.append("cli.import: " + ",".join(loaded))
+    s.add("cli.import", run, repeat=5)
+
+BENCHES = [bench_cli_import, bench_analyzer, bench_run_on_dir, bench_newest, bench_extractor, bench_orchestrator]
+
+# --- baseline ---
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    print(f"\n{'benchmark':<48} {'baseline':>11} {'current':>11} {'ratio':>7}")
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:<48} {'-':>11} {cur['median_s'] * 1000:9.2f}ms {'new':>7}")
+            continue
+        ratio = cur["median_s"] / base["median_s"] if base["median_s"] > 0 else float("inf")
+        flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{name:<48} {base['median_s'] * 1000:9.2f}ms {cur['median_s'] * 1000:9.2f}ms {ratio:7.2f}{flag}")
+        if flag:
+            regressions.append(f"{name}: {ratio:.2f}x")
+    return regressions
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="tricho_pipeline microbenchmarks")
+    p.add_argument("--quick", action="store_true", help="Small sizes only")
+    p.add_argument("-k", dest="filters", action="append", default=[], help="Run benchmarks whose name contains this")
+    p.add_argument("--out", default=os.path.join(HERE, "results", "latest.json"))
+    p.add_argument("--save-baseline", metavar="PATH", help="Also write the results as a baseline")
+    p.add_argument("--compare", metavar="BASELINE", help="Compare medians against a baseline JSON")
+    p.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown ratio for --compare (0.25 = +25%%)")
+    p.add_argument("--work-dir", help="Where to write synthetic data (default: temp dir, removed afterwards)")
+    args = p.parse_args()
+
+    work = args.work_dir or tempfile.mkdtemp(prefix="tricho-bench-")
+    suite = Suite(work, args.quick, args.filters)
+    try:
+        for bench in BENCHES:
+            print(f"[{bench.__name__}]", flush=True)
+            bench(suite)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    import numpy
+    current = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": numpy.__version__,
+            "quick": args.quick,
+        },
+        "results": suite.results,
+    }
+    for path in filter(None, [args.out, args.save_baseline]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+
+    problems = list(suite.failures)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            problems += compare(current, json.load(f), args.tolerance)
+    if problems:
+        print("\nFAILED:\n  " + "\n  ".join(problems))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+ベンチマーク用の合成データ生成。
+- tricho_N.json: sample_data/json/tricho_0.json と同じスキーマ（hairs / follicle_units / roi / ppmm ...）
+- HairReport 風 PDF: 1ページ目上部のヘッダ行 + 126pt 角（300 dpi で 525 px）の画像 + 判定対象外の画像
+"""
+from __future__ import annotations
+import os, io, json, uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+LOCATIONS = ["Frontal 1 left", "Frontal 2", "Vertex center", "Occiput 3 right"]
+# 実データと同じ ROI（3024 px 高・約 1005 px 幅）と ppmm
+ROI = [[1009.6485677640017, 3024.0], [1009.648567764002, 0.0], [2014.3514322359983, 0.0], [2014.3514322359983, 3024.0]]
+PPMM = 188.0
+
+def _uuids(rng: np.random.Generator, n: int) -> List[str]:
+    return [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n)]
+
+def make_tricho(n_hairs: int, n_follicles: Optional[int] = None, *, seed: int = 0, location: str = LOCATIONS[0]) -> Dict[str, Any]:
+    """毛 n_hairs 本・毛包 n_follicles 個（既定: 毛の約 3/4）の tricho_N.json 相当の dict"""
+    rng = np.random.default_rng(seed)
+    n_follicles = n_follicles if n_follicles is not None else max(1, n_hairs * 3 // 4)
+    fol_uuids = _uuids(rng, n_follicles)
+    fx = rng.uniform(ROI[0][0], ROI[2][0], n_follicles).round()
+    fy = rng.uniform(0, ROI[0][1], n_follicles).round()
+    # 太さ(px): 実データ同様 <30µm〜>90µm に広がるよう ppmm=188 で 2〜25 px
+    w = rng.gamma(4.0, 2.5, n_hairs) + 1.5
+    h = rng.uniform(30, 300, n_hairs)
+    owner = rng.integers(0, n_follicles, n_hairs)
+    hairs = [
+        {
+            "a": float(w[i] * h[i] * 0.8), "cx": float(fx[owner[i]] + rng.normal(0, 20)), "cy": float(fy[owner[i]] + rng.normal(0, 20)),
+            "follicle_uuid": fol_uuids[owner[i]], "h": float(h[i]), "score": float(rng.uniform(0.5, 1.0)),
+            "uuid": u, "valid": bool(rng.random() > 0.02), "w": float(w[i]),
+        }
+        for i, u in enumerate(_uuids(rng, n_hairs))
+    ]
+    return {
+        "evaluator": "UnclippedHairEvaluator",
+        "follicle_units": [{"uuid": u, "x": float(x), "y": float(y)} for u, x, y in zip(fol_uuids, fx, fy)],
+        "guid": str(uuid.UUID(bytes=rng.bytes(16), version=4)),
+        "hairs": hairs,
+        "image_path": f"/mnt/samba/tricho_synthetic-{seed}.jpg",
+        "location": location,
+        "mean_hair_intensity": 92.977,
+        "message": "success",
+        "ppmm": PPMM,
+        "roi": ROI,
+        "status": 0,
+        "version": "1.9.0",
+    }
+
+def write_tricho_dir(out_dir: str, n_hairs: int, n_files: int = 4, *, seed: int = 0) -> List[str]:
+    """out_dir に tricho_0.json 〜 tricho_{n_files-1}.json を書く"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(n_files):
+        p = os.path.join(out_dir, f"tricho_{i}.json")
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump(make_tricho(n_hairs, seed=seed + i, location=LOCATIONS[i % len(LOCATIONS)]), f)
+        paths.append(p)
+    return paths
+
+def _jpeg(rng: np.random.Generator, px: int) -> bytes:
+    from PIL import Image
+
+    arr = rng.integers(0, 255, (px // 8, px // 8, 3), dtype=np.uint8)
+    img = Image.fromarray(arr).resize((px, px))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+def make_report_pdf(
+    path: str,
+    *,
+    images_per_page: tuple = (3, 1),
+    decoys_per_page: int = 1,
+    image_px: int = 1014,
+    name: str = "山田 太郎",
+    date_of_birth: str = "1980/01/02",
+    appointment_date: str = "2025/10/05",
+    seed: int = 0,
+) -> str:
+    """
+    HairReport_*.pdf を模した PDF。各ページに 126pt 角の画像（allowed_sizes に入る）を images_per_page 枚、
+    それより大きい判定対象外の画像を decoys_per_page 枚、上から順に並べる。
+    """
+    import pymupdf
+
+    rng = np.random.default_rng(seed)
+    doc = pymupdf.open()
+    side, gap = 126.0, 14.0
+    for pno, n_img in enumerate(images_per_page):
+        page = doc.new_page(width=612, height=792)
+        if pno == 0:
+            page.insert_text((40, 81), f"HairMetrix のレポート {name}、{date_of_birth} • 診察： {appointment_date}",
+                             fontname="japan", fontsize=10)
+        y = 110.0
+        for i in range(n_img):
+            x = 40 + (i % 3) * (side + gap)
+            if i and i % 3 == 0:
+                y += side + gap
+            page.insert_image(pymupdf.Rect(x, y, x + side, y + side), stream=_jpeg(rng, image_px))
+        y += side + gap
+        for _ in range(decoys_per_page):
+            page.insert_image(pymupdf.Rect(40, y, 40 + 200, y + 150), stream=_jpeg(rng, 400))
+            y += 150 + gap
+        page.insert_text((40, 770), f"page {pno + 1}", fontsize=8)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    doc.save(path)
+    doc.close()
+    return path
+
+def make_db_tree(root: str, n_patients: int, *, visits_per_patient: int = 1) -> str:
+    """HairMetrixDB 風のフォルダ（患者フォルダ × 来院フォルダ）を空ファイルで作る（newest_path_in 用）"""
+    for i in range(n_patients):
+        patient = os.path.join(root, f"P{i:06d}")
+        for v in range(visits_per_patient):
+            os.makedirs(os.path.join(patient, f"visit_{v}"), exist_ok=True)
+    return root
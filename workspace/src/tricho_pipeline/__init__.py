@@ -1,8 +1,33 @@
 # src/tricho_pipeline/__init__.py
-from .core.config import PipelineConfig, ExtractorConfig
-from .core.orchestrator import Orchestrator
-from .extraction.pdf_extractor import PdfExtractor
-from .analysis.tricho_analyzer import TrichoAnalyzer
+# 重い依存（pymupdf / numpy など）は属性に初めて触れたときに読み込む（CLI の起動を速くするため）
+from __future__ import annotations
+import importlib
+from typing import TYPE_CHECKING, Any
+
+_LAZY = {
+    "PipelineConfig": "tricho_pipeline.core.config",
+    "ExtractorConfig": "tricho_pipeline.core.config",
+    "Orchestrator": "tricho_pipeline.core.orchestrator",
+    "PdfExtractor": "tricho_pipeline.extraction.pdf_extractor",
+    "TrichoAnalyzer": "tricho_pipeline.analysis.tricho_analyzer",
+}
+
+if TYPE_CHECKING:
+    from .core.config import PipelineConfig, ExtractorConfig
+    from .core.orchestrator import Orchestrator
+    from .extraction.pdf_extractor import PdfExtractor
+    from .analysis.tricho_analyzer import TrichoAnalyzer
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+def __dir__() -> list:
+    return sorted(list(globals()) + list(_LAZY))
 
 __all__ = [
     "PipelineConfig",
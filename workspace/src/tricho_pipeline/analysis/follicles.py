@@ -0,0 +1,94 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from tricho_pipeline.analysis.tricho_loader import TrichoRecord
+
+# 毛包単位の本数区分（最後は「以上」）
+UNIT_SIZES = ("1", "2", "3", "4+")
+
+def hair_follicle_rows(d: Union[Dict[str, Any], TrichoRecord]) -> Tuple[np.ndarray, int]:
+    """
+    各毛の follicle_units 上の行番号（対応なしは -1）と毛包数。
+    dict 入力は follicle_units[].uuid と hairs[].follicle_uuid を np.unique でまとめて整数コード化して突き合わせる
+    （TrichoRecord は読み込み時に同じ対応を hairs.follicle に持っている）。
+    """
+    if isinstance(d, TrichoRecord):
+        return d.hairs.follicle, len(d.follicles)
+    fus, hairs = d.get('follicle_units', []), d.get('hairs', [])
+    if not fus or not hairs:
+        return np.full(len(hairs), -1, dtype=np.int64), len(fus)
+    keys = [f['uuid'] for f in fus] + [h.get('follicle_uuid') or "" for h in hairs]
+    try:
+        arr = np.array(keys, dtype="S")  # UUID は ASCII なのでバイト列の方が比較・ソートが速い
+    except UnicodeEncodeError:
+        arr = np.array(keys)
+    uniq, codes = np.unique(arr, return_inverse=True)
+    codes = codes.reshape(-1)
+    row_of_code = np.full(len(uniq), -1, dtype=np.int64)
+    row_of_code[codes[:len(fus)]] = np.arange(len(fus))
+    return row_of_code[codes[len(fus):]], len(fus)
+
+def follicle_unit_stats(
+    thickness_um: np.ndarray,
+    hair_rows: np.ndarray,
+    hair_offsets: Sequence[int],
+    unit_counts: Sequence[int],
+) -> List[Dict[str, Any]]:
+    """
+    複数 ROI をまとめて毛包単位の集計を行う。毛包に ROI ごとの通し番号を振り、
+    本数・太さの合計を bincount 1 回ずつで求める（dict でのグループ化はしない）。
+    hair_rows は各毛の ROI 内の毛包行番号（-1 は対応なし）、hair_offsets / unit_counts は ROI ごとの境界と毛包数。
+    """
+    hair_offsets = np.asarray(hair_offsets, dtype=np.int64)
+    unit_counts = np.asarray(unit_counts, dtype=np.int64)
+    n_roi = len(unit_counts)
+    unit_offsets = np.zeros(n_roi + 1, dtype=np.int64)
+    np.cumsum(unit_counts, out=unit_offsets[1:])
+    n_units = int(unit_offsets[-1])
+    hair_roi = np.repeat(np.arange(n_roi), np.diff(hair_offsets))
+    rows = np.asarray(hair_rows, dtype=np.int64)
+    linked = rows >= 0
+    unit_id = rows[linked] + unit_offsets[hair_roi[linked]]
+    t = np.asarray(thickness_um, dtype="float64")[linked]
+    finite = np.isfinite(t)
+
+    hairs_per_unit = np.bincount(unit_id, minlength=n_units)
+    t_sum = np.bincount(unit_id[finite], weights=t[finite], minlength=n_units)
+    t_cnt = np.bincount(unit_id[finite], minlength=n_units)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        unit_mean_t = t_sum / t_cnt  # 太さの無い毛包は NaN
+
+    unit_roi = np.repeat(np.arange(n_roi), unit_counts)
+    size = np.minimum(hairs_per_unit, len(UNIT_SIZES))  # 0=毛なし, 1..3, 4=4本以上
+    n_sizes = len(UNIT_SIZES) + 1
+    by_size = np.bincount(unit_roi * n_sizes + size, minlength=n_roi * n_sizes).reshape(n_roi, n_sizes)
+    has_t = ~np.isnan(unit_mean_t)
+    t_by_size = np.bincount(
+        unit_roi[has_t] * n_sizes + size[has_t], weights=unit_mean_t[has_t], minlength=n_roi * n_sizes
+    ).reshape(n_roi, n_sizes)
+    n_t_by_size = np.bincount(unit_roi[has_t] * n_sizes + size[has_t], minlength=n_roi * n_sizes).reshape(n_roi, n_sizes)
+    linked_per_roi = np.bincount(hair_roi[linked], minlength=n_roi)
+    orphans = np.diff(hair_offsets) - linked_per_roi
+
+    def mean(total: float, n: int) -> Any:
+        return round(float(total) / n, 2) if n else None
+
+    out = []
+    for r in range(n_roi):
+        occupied = int(by_size[r, 1:].sum())
+        out.append({
+            "units": int(unit_counts[r]),
+            "with_hairs": occupied,
+            "empty": int(by_size[r, 0]),
+            "orphan_hairs": int(orphans[r]),
+            "distribution": {k: int(by_size[r, i + 1]) for i, k in enumerate(UNIT_SIZES)},
+            # 毛のある毛包あたりの本数 / 毛包ごとの平均太さの平均
+            "mean_hairs_per_unit": mean(linked_per_roi[r], occupied),
+            "mean_thickness_um": mean(t_by_size[r, 1:].sum(), int(n_t_by_size[r, 1:].sum())),
+            "mean_thickness_um_by_size": {
+                k: mean(t_by_size[r, i + 1], int(n_t_by_size[r, i + 1])) for i, k in enumerate(UNIT_SIZES)
+            },
+        })
+    return out
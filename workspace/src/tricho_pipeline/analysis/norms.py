@@ -0,0 +1,189 @@
+from __future__ import annotations
+import re, math
+from datetime import date
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from tricho_pipeline.analysis.trend import ULTRA_LABEL, THIN_LABELS
+
+# 指標名 -> ヒストグラム（分位点スケッチ）の範囲。範囲外の値は両端のあふれビンに入る
+METRIC_RANGES: Dict[str, tuple] = {
+    "density_per_cm2": (0.0, 400.0),
+    "thin60": (0.0, 1.0),
+    "ultra30": (0.0, 1.0),
+    "hair_per_follicle": (0.0, 5.0),
+}
+N_BINS = 200
+AGE_BAND_YEARS = 10
+# region_metrics の指標の定義を変えたら上げる
+METRICS_VERSION = 1
+QUANTILES = (0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95)
+ALL_AGES = "all"
+_YMD = re.compile(r"(\d{4})[/-](\d{2})[/-](\d{2})")
+
+class RunningStat:
+    """
+    1 指標の逐次統計。Welford 法の件数・平均・偏差平方和と、[lo, hi) を N_BINS 等分した固定ビンの
+    ヒストグラム（先頭・末尾は範囲外のあふれビン）を持つ。来院数に依らずメモリは一定で、
+    分位点・パーセンタイルはビン内を線形補間して求める（誤差はビン幅 (hi - lo) / N_BINS 以内）。
+    """
+    __slots__ = ("lo", "hi", "n", "mean", "m2", "min", "max", "hist")
+
+    def __init__(self, lo: float, hi: float, bins: int = N_BINS) -> None:
+        self.lo, self.hi = float(lo), float(hi)
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+        self.min, self.max = math.inf, -math.inf
+        self.hist = np.zeros(bins + 2, dtype=np.int64)
+
+    @property
+    def bins(self) -> int:
+        return len(self.hist) - 2
+
+    def _bin(self, x: float) -> int:
+        if x < self.lo:
+            return 0
+        if x >= self.hi:
+            return self.bins + 1
+        return 1 + int((x - self.lo) / (self.hi - self.lo) * self.bins)
+
+    def _edges(self, b: int) -> tuple:
+        """ビン b の [左端, 右端) を観測した最小・最大値で切り詰めたもの（あふれビンもこれで幅が決まる）"""
+        w = (self.hi - self.lo) / self.bins
+        left = -math.inf if b == 0 else self.lo + (b - 1) * w
+        right = math.inf if b == self.bins + 1 else self.lo + b * w
+        return max(left, self.min), min(right, self.max)
+
+    def add(self, x: float) -> None:
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+        self.min, self.max = min(self.min, x), max(self.max, x)
+        self.hist[self._bin(x)] += 1
+
+    @property
+    def sd(self) -> Optional[float]:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n >= 2 else None
+
+    def percentile_of(self, x: float) -> Optional[float]:
+        """x 未満の割合 [%]（x と同じビンの分はビン内の位置で按分）"""
+        if not self.n:
+            return None
+        b = self._bin(x)
+        left, right = self._edges(b)
+        frac = min(max((x - left) / (right - left), 0.0), 1.0) if right > left else 0.5
+        below = int(self.hist[:b].sum()) + frac * int(self.hist[b])
+        return 100.0 * below / self.n
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.n:
+            return None
+        cum = np.cumsum(self.hist)
+        target = q * self.n
+        b = int(np.searchsorted(cum, target, side="left"))
+        b = min(b, len(cum) - 1)
+        left, right = self._edges(b)
+        before = int(cum[b - 1]) if b else 0
+        frac = (target - before) / self.hist[b] if self.hist[b] else 0.0
+        return float(min(max(left + frac * (right - left), self.min), self.max))
+
+    def summary(self, ndigits: int = 4) -> Dict[str, Any]:
+        r = lambda v: None if v is None else round(v, ndigits)
+        return {
+            "n": self.n,
+            "mean": r(self.mean) if self.n else None,
+            "sd": r(self.sd),
+            "quantiles": {f"p{round(q * 100)}": r(self.quantile(q)) for q in QUANTILES},
+        }
+
+    # --- 永続化（NormStore の 1 行） ---
+    def to_row(self) -> tuple:
+        return (self.n, self.mean, self.m2, self.min, self.max, self.lo, self.hi, self.hist.tobytes())
+
+    @classmethod
+    def from_row(cls, n: int, mean: float, m2: float, lo_obs: float, hi_obs: float,
+                 lo: float, hi: float, hist: bytes) -> "RunningStat":
+        st = cls(lo, hi)
+        st.hist = np.frombuffer(hist, dtype=np.int64).copy()
+        st.n, st.mean, st.m2, st.min, st.max = n, mean, m2, lo_obs, hi_obs
+        return st
+
+    @classmethod
+    def for_metric(cls, metric: str) -> "RunningStat":
+        return cls(*METRIC_RANGES[metric])
+
+def norms_spec() -> str:
+    """
+    集計の区切り方（指標の定義・年齢帯の幅・ヒストグラムの範囲とビン数）を表す文字列。
+    NormStore はこれごとに分布と畳み込み済みの来院を分けて持つので、区切り方を変えると新しい分布に数え直される。
+    """
+    ranges = ",".join(f"{m}:{lo:g}-{hi:g}" for m, (lo, hi) in sorted(METRIC_RANGES.items()))
+    return f"v{METRICS_VERSION}|age{AGE_BAND_YEARS}|bins{N_BINS}|{ranges}"
+
+def age_band(date_of_birth: Optional[str], on: Optional[str], width: int = AGE_BAND_YEARS) -> Optional[str]:
+    """生年月日（YYYY/MM/DD など）と診察日（YYYY-MM-DD）から "40-49" 形式の年齢帯。読めなければ None"""
+    mb, md = _YMD.search(date_of_birth or ""), _YMD.search(on or "")
+    if not mb or not md:
+        return None
+    b, d = (date(*map(int, m.groups())) for m in (mb, md))
+    age = d.year - b.year - ((d.month, d.day) < (b.month, b.day))
+    if age < 0:
+        return None
+    lo = age // width * width
+    return f"{lo}-{lo + width - 1}"
+
+def region_metrics(item: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """
+    tricho_analysis の 1 要素から正規統計に使う指標。比率は trend.build_series / render.js と同じく
+    total = max(hairs, Σクラス) で割る。エラーや毛 0 本の部位は None（その指標だけ欠ける場合は省く）
+    """
+    data = item.get("data")
+    if not data:
+        return None
+    cls = data.get("classification") or {}
+    c = data.get("counts") or {}
+    hairs, follicles = c.get("hairs") or 0, c.get("follicles") or 0
+    total = max(hairs, sum(cls.values()))
+    if total <= 0:
+        return None
+    out = {
+        "thin60": sum(cls.get(k, 0) for k in THIN_LABELS) / total,
+        "ultra30": cls.get(ULTRA_LABEL, 0) / total,
+    }
+    dens = [x for x in (data.get("density_per_cm2") or {}).values() if x is not None]
+    if dens:
+        out["density_per_cm2"] = float(sum(dens))
+    if follicles > 0:
+        out["hair_per_follicle"] = hairs / follicles
+    return out
+
+def norms_block(
+    stats: Dict[tuple, RunningStat],
+    tricho_analysis: Sequence[Dict[str, Any]],
+    band: Optional[str],
+    min_n: int = 20,
+) -> Dict[str, Any]:
+    """
+    今回の各部位・各指標の値を、同じ部位・年齢帯の分布（件数が min_n 未満なら全年齢）の中の
+    パーセンタイルにして tricho_data.json の "norms" 形式で返す。stats は {(部位, 年齢帯, 指標): RunningStat}。
+    """
+    regions: Dict[str, Any] = {}
+    for it in tricho_analysis:
+        loc, values = it.get("location"), region_metrics(it)
+        if values is None or loc in regions:
+            continue
+        reg: Dict[str, Any] = {}
+        for metric, x in values.items():
+            st, used = None, None
+            for b in ((band, ALL_AGES) if band else (ALL_AGES,)):
+                st, used = stats.get((loc, b, metric)), b
+                if st is not None and st.n >= min_n:
+                    break
+            entry: Dict[str, Any] = {"value": round(x, 4), "band": used, "percentile": None}
+            entry.update(st.summary() if st is not None else {"n": 0})
+            if st is not None and st.n >= min_n:
+                entry["percentile"] = round(st.percentile_of(x), 1)
+            reg[metric] = entry
+        regions[loc] = reg
+    return {"age_band": band, "min_n": min_n, "regions": regions}
@@ -0,0 +1,90 @@
+from __future__ import annotations
+import math, dataclasses
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+# numpy は読み込まない（PipelineConfig 経由で CLI 起動時にも参照されるため）。mask() は渡された配列の演算だけを使う
+
+@dataclass(frozen=True)
+class HairFilter:
+    """hairs[] の品質フィルタ。valid_only: valid=false を除く / min_score: score がこれ未満（欠測含む）を除く"""
+    valid_only: bool = False
+    min_score: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.valid_only or self.min_score is not None
+
+    def mask(self, score: Any, valid: Any) -> Any:
+        """残す毛の bool 配列（フィルタ無しなら None）"""
+        if not self.active:
+            return None
+        keep = valid.astype(bool) if self.valid_only else None
+        if self.min_score is not None:
+            ok = score >= self.min_score  # NaN は False
+            keep = ok if keep is None else keep & ok
+        return keep
+
+    def spec(self) -> str:
+        parts = (["valid"] if self.valid_only else []) + ([f"score>={self.min_score:g}"] if self.min_score is not None else [])
+        return ",".join(parts) or "all"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"valid_only": self.valid_only, "min_score": self.min_score}
+
+    @classmethod
+    def parse(cls, text: str) -> "HairFilter":
+        """"all" / "valid" / "score>=0.8" / "valid,score>=0.8" """
+        valid_only, min_score = False, None
+        for tok in filter(None, (t.strip() for t in (text or "").split(","))):
+            if tok == "all":
+                continue
+            if tok == "valid":
+                valid_only = True
+            elif tok.startswith("score>="):
+                min_score = float(tok[len("score>="):])
+            else:
+                raise ValueError(f"不明なフィルタ指定: {tok!r}（valid / score>=X）")
+        return cls(valid_only=valid_only, min_score=min_score)
+
+@dataclass(frozen=True)
+class ThicknessScheme:
+    """名前付きの太さ分類。bins は µm の境界（左閉右開）、labels はクラス名（len(bins) - 1 個）"""
+    name: str
+    bins: Tuple[float, ...]
+    labels: Tuple[str, ...]
+    filter: HairFilter = HairFilter()
+
+    def __post_init__(self) -> None:
+        if len(self.labels) != len(self.bins) - 1:
+            raise ValueError(f"{self.name}: labels は bins より 1 つ少なくしてください")
+        if any(b <= a for a, b in zip(self.bins, self.bins[1:])):
+            raise ValueError(f"{self.name}: bins は昇順にしてください")
+
+DEFAULT_SCHEME = ThicknessScheme("thickness", (0, 30, 60, 90, math.inf), ("<30 μm", "30-60 μm", "60-90 μm", ">90 μm"))
+FINE_10UM = ThicknessScheme(
+    "fine_10um",
+    tuple(range(0, 160, 10)) + (math.inf,),
+    tuple(f"{a}-{a + 10} μm" for a in range(0, 150, 10)) + (">150 μm",),
+)
+VELLUS_TERMINAL = ThicknessScheme("vellus_terminal", (0, 30, math.inf), ("vellus <30 μm", "terminal ≥30 μm"))
+PRESET_SCHEMES: Dict[str, ThicknessScheme] = {s.name: s for s in (DEFAULT_SCHEME, FINE_10UM, VELLUS_TERMINAL)}
+
+def parse_scheme(spec: str) -> ThicknessScheme:
+    """"<preset>[:<filter>]"（例: "fine_10um", "vellus_terminal:valid,score>=0.8"）。フィルタ付きは名前にも付ける"""
+    name, _, filt = spec.partition(":")
+    base = PRESET_SCHEMES.get(name.strip())
+    if base is None:
+        raise ValueError(f"不明な分類スキーム: {name!r}（{', '.join(PRESET_SCHEMES)}）")
+    if not filt:
+        return base
+    f = HairFilter.parse(filt)
+    return dataclasses.replace(base, name=f"{base.name}:{f.spec()}", filter=f)
+
+def build_schemes(specs: Sequence[str]) -> List[ThicknessScheme]:
+    """既定の分類（tricho_data.json の classification）を先頭に、指定スキームを重複なく続ける"""
+    out = [DEFAULT_SCHEME]
+    for spec in specs:
+        s = parse_scheme(spec)
+        if all(s.name != x.name for x in out):
+            out.append(s)
+    return out
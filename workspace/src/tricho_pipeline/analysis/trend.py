@@ -0,0 +1,148 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# render.js / report_template.html の p30 / p60 と同じ定義に使うクラス
+ULTRA_LABEL = "<30 μm"
+THIN_LABELS = ("<30 μm", "30-60 μm")
+
+@dataclass
+class TrendSeries:
+    """来院 V × 部位 L（× クラス C）の時系列。欠測は NaN"""
+    dates: List[str]
+    locations: List[str]
+    labels: List[str]
+    density: np.ndarray       # (V, L, C) 本/cm²
+    thin60: np.ndarray        # (V, L) <60µm 比率
+    ultra30: np.ndarray       # (V, L) <30µm 比率
+    hair_per_follicle: np.ndarray  # (V, L)
+
+def build_series(visits: Sequence[tuple], labels: Sequence[str]) -> TrendSeries:
+    """
+    visits: [(appointment_date, tricho_analysis の要素の列), ...]（日付順）。
+    部位・クラスの和集合で配列を作り、各比率は render.js と同じく total = max(hairs, Σクラス) で割る。
+    """
+    dates = [d for d, _ in visits]
+    locations: List[str] = []
+    for _, items in visits:
+        for it in items:
+            loc = it.get("location")
+            if "data" in it and loc not in locations:
+                locations.append(loc)
+    labels = list(labels)
+    V, L, C = len(dates), len(locations), len(labels)
+    counts = np.full((V, L, C), np.nan)
+    density = np.full((V, L, C), np.nan)
+    hairs = np.full((V, L), np.nan)
+    follicles = np.full((V, L), np.nan)
+    loc_idx = {loc: i for i, loc in enumerate(locations)}
+    lab_idx = {lab: i for i, lab in enumerate(labels)}
+    for v, (_, items) in enumerate(visits):
+        for it in items:
+            data = it.get("data")
+            if not data:
+                continue
+            l = loc_idx[it.get("location")]
+            for lab, n in (data.get("classification") or {}).items():
+                if lab in lab_idx:
+                    counts[v, l, lab_idx[lab]] = n
+            for lab, x in (data.get("density_per_cm2") or {}).items():
+                if lab in lab_idx and x is not None:
+                    density[v, l, lab_idx[lab]] = x
+            c = data.get("counts") or {}
+            hairs[v, l] = c.get("hairs", np.nan)
+            follicles[v, l] = c.get("follicles", np.nan)
+
+    total = np.fmax(hairs, np.nansum(counts, axis=2))
+    total = np.where(total > 0, total, 1.0)
+    def share(labs) -> np.ndarray:
+        cols = [lab_idx[x] for x in labs if x in lab_idx]
+        if not cols:
+            return np.full((V, L), np.nan)
+        return counts[:, :, cols].sum(axis=2) / total
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hpf = np.where(follicles > 0, hairs / follicles, np.nan)
+    return TrendSeries(
+        dates=dates, locations=locations, labels=labels, density=density,
+        thin60=share(THIN_LABELS), ultra30=share((ULTRA_LABEL,)), hair_per_follicle=hpf,
+    )
+
+def _slope_per_year(t: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """欠測を除いた最小二乗の傾き（先頭軸が時間）。有効点が 2 未満・同日のみなら NaN"""
+    tt = t.reshape((-1,) + (1,) * (y.ndim - 1))
+    m = ~np.isnan(y)
+    n = m.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_mean = np.where(m, tt, 0.0).sum(axis=0) / n
+        y_mean = np.where(m, y, 0.0).sum(axis=0) / n
+        dt = np.where(m, tt - t_mean, 0.0)
+        cov = (dt * np.where(m, y - y_mean, 0.0)).sum(axis=0)
+        var = (dt * dt).sum(axis=0)
+        return np.where((n >= 2) & (var > 0), cov / var, np.nan)
+
+def _clean(a: np.ndarray, ndigits: int) -> Any:
+    """NaN → None にして丸めた list / float"""
+    if np.ndim(a) == 0:
+        return None if np.isnan(a) else round(float(a), ndigits)
+    return [_clean(x, ndigits) for x in a]
+
+def compute_trend(series: TrendSeries) -> Dict[str, Any]:
+    """
+    全部位・全クラスの 前回比 / 初回比 / 年あたりの傾き をまとめて計算し、tricho_data.json の "trend" 形式で返す。
+    """
+    V = len(series.dates)
+    t = np.array([(date.fromisoformat(d) - date.fromisoformat(series.dates[0])).days / 365.25 for d in series.dates])
+    # 指標名 -> (配列, 丸め桁, クラス軸の有無)
+    metrics = {
+        "density_per_cm2": (series.density, 2, True),
+        "thin60": (series.thin60, 4, False),
+        "ultra30": (series.ultra30, 4, False),
+        "hair_per_follicle": (series.hair_per_follicle, 3, False),
+    }
+    nan = lambda a: np.full(a.shape[1:], np.nan)
+    computed = {}
+    for key, (y, _, _) in metrics.items():
+        computed[key] = {
+            "values": y,
+            "delta_prev": y[-1] - y[-2] if V >= 2 else nan(y),
+            "delta_first": y[-1] - y[0] if V >= 2 else nan(y),
+            "slope_per_year": _slope_per_year(t, y) if V >= 2 else nan(y),
+        }
+
+    def pick(key: str, part: str, l: int) -> Any:
+        # 部位 l の値。クラス軸があればラベルごとの dict にする
+        _, nd, per_class = metrics[key]
+        a = computed[key][part]
+        if per_class:
+            return {lab: _clean(a[..., l, k], nd) for k, lab in enumerate(series.labels)}
+        return _clean(a[..., l], nd)
+
+    regions: Dict[str, Any] = {}
+    for l, loc in enumerate(series.locations):
+        reg: Dict[str, Any] = {key: pick(key, "values", l) for key in metrics}
+        for part in ("delta_prev", "delta_first", "slope_per_year"):
+            reg[part] = {key: pick(key, part, l) for key in metrics}
+        regions[loc] = reg
+    return {"visits": series.dates, "labels": series.labels, "regions": regions}
+
+def trend_block(
+    history: Sequence[Dict[str, Any]],
+    current: Sequence[Dict[str, Any]],
+    current_date: str,
+    labels: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """
+    ResultsStore.history() の行（過去来院分）と今回の tricho_analysis から trend ブロックを作る。
+    labels 省略時は今回の classification のラベル順。
+    """
+    by_date: Dict[str, List[Dict[str, Any]]] = {}
+    for row in history:
+        if row["appointment_date"] < current_date:
+            by_date.setdefault(row["appointment_date"], []).append(row)
+    visits = sorted(by_date.items()) + [(current_date, list(current))]
+    if labels is None:
+        labels = next((list(it["data"]["classification"]) for it in current if "data" in it), [])
+    return compute_trend(build_series(visits, labels))
@@ -1,57 +1,244 @@
 from __future__ import annotations
-import os, json
+import os, re, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
-import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+
+from tricho_pipeline.analysis.tricho_loader import TrichoRecord, load_tricho
+from tricho_pipeline.analysis.schemes import DEFAULT_SCHEME, ThicknessScheme
+from tricho_pipeline.analysis.follicles import follicle_unit_stats, hair_follicle_rows
+from tricho_pipeline.analysis.heatmap import density_heatmaps
+
+TrichoInput = Union[Dict[str, Any], TrichoRecord]
 
 class TrichoAnalyzer:
-    def __init__(self, bins: List[float] = None, labels: List[str] = None):
-        import numpy as _np
-        self.bins = bins if bins is not None else [0, 30, 60, 90, _np.inf]
-        self.labels = labels if labels is not None else ["<30 μm", "30-60 μm", "60-90 μm", ">90 μm"]
-
-    def analyze(self, json_data: Dict[str, Any]) -> Dict[str, Any]:
-        roi = np.array(json_data['roi'])
-        ppmm = float(json_data['ppmm'])
-        location = json_data['location']
+    def __init__(
+        self,
+        bins: List[float] = None,
+        labels: List[str] = None,
+        schemes: Optional[Sequence[ThicknessScheme]] = None,
+        follicle_units: bool = False,
+        heatmap_cell_mm: Optional[float] = None,
+    ):
+        """
+        schemes を渡すと複数の分類（フィルタ付き可）を同時に数える。先頭が classification / density_per_cm2 になり、
+        全スキームの結果は data["schemes"] に入る。省略時は bins / labels の 1 スキームのみ。
+        follicle_units=True なら毛包単位の本数分布・平均太さを data["follicular_units"] に入れる。
+        heatmap_cell_mm を与えると、先頭スキームのクラス別に約 heatmap_cell_mm 角の密度マップを data["heatmap"] に入れる。
+        """
+        self.follicle_units = follicle_units
+        self.heatmap_cell_mm = heatmap_cell_mm
+        if schemes:
+            self.schemes = list(schemes)
+        elif bins is not None or labels is not None:
+            self.schemes = [ThicknessScheme(
+                DEFAULT_SCHEME.name,
+                tuple(bins if bins is not None else DEFAULT_SCHEME.bins),
+                tuple(labels if labels is not None else DEFAULT_SCHEME.labels),
+            )]
+        else:
+            self.schemes = [DEFAULT_SCHEME]
+        names = [sc.name for sc in self.schemes]
+        if len(set(names)) != len(names):
+            raise ValueError(f"分類スキーム名が重複しています: {names}")
+        self.bins = list(self.schemes[0].bins)
+        self.labels = list(self.schemes[0].labels)
+        self._edges = np.asarray(self.bins, dtype="float64")
+        # 先頭スキームのみ・フィルタ無しなら従来の bincount 1 回で済む
+        self._report_schemes = len(self.schemes) > 1 or any(sc.filter.active for sc in self.schemes)
+        self._needs_quality = any(sc.filter.active for sc in self.schemes)
+
+    def class_index(self, thickness_um: np.ndarray) -> np.ndarray:
+        """
+        太さ(µm)ごとのクラス番号（左閉右開 [bins[i], bins[i+1])、pd.cut(right=False) と同じ）。
+        範囲外・NaN は -1。
+        """
+        idx = np.searchsorted(self._edges, thickness_um, side="right") - 1
+        idx[(idx >= len(self._edges) - 1) | np.isnan(thickness_um)] = -1
+        return idx
+
+    def count_classes(
+        self, thickness_um: np.ndarray, offsets: Sequence[int], idx: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        複数 ROI を連結した太さ配列を 1 回で分類する。
+        offsets は各 ROI の開始位置と末尾（len = ROI 数 + 1）。戻り値は (ROI 数, クラス数) の件数。
+        idx に class_index() の結果を渡せば分類し直さない。
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        n_roi, n_cls = len(offsets) - 1, len(self.labels)
+        roi_id = np.repeat(np.arange(n_roi), np.diff(offsets))
+        if idx is None:
+            idx = self.class_index(np.asarray(thickness_um, dtype="float64"))
+        ok = idx >= 0
+        flat = np.bincount(roi_id[ok] * n_cls + idx[ok], minlength=n_roi * n_cls)
+        return flat.reshape(n_roi, n_cls)
+
+    def analyze(self, json_data: TrichoInput) -> Dict[str, Any]:
+        return self.analyze_many([json_data])[0]
+
+    def analyze_many(self, json_datas: Sequence[TrichoInput]) -> List[Dict[str, Any]]:
+        """
+        複数 ROI（複数来院分でも可）の hairs[].w を 1 本の配列に積んで一括分類する。
+        各要素は tricho_N.json の dict か load_tricho() の TrichoRecord。
+        """
+        widths, offsets, ppmms = stack_hair_widths(json_datas)
+        thickness_um = (widths / np.repeat(ppmms, np.diff(offsets))) * 1000.0
+        idx = self.class_index(thickness_um) if self.heatmap_cell_mm or not self._report_schemes else None
+        if not self._report_schemes:
+            counts = self.count_classes(thickness_um, offsets, idx=idx)
+            out = [self._summarize(d, counts[i]) for i, d in enumerate(json_datas)]
+        else:
+            score = valid = None
+            if self._needs_quality:
+                score = np.concatenate([_hair_column(d, "score") for d in json_datas]) if json_datas else np.zeros(0)
+                valid = np.concatenate([_hair_column(d, "valid") for d in json_datas]) if json_datas else np.zeros(0, bool)
+            per_scheme = self.count_schemes(thickness_um, offsets, score, valid)
+            out = []
+            for i, d in enumerate(json_datas):
+                res = self._summarize(d, per_scheme[0][0][i])
+                area_cm2 = self._area_cm2(d)
+                res["data"]["schemes"] = {
+                    sc.name: self._scheme_block(sc, counts[i], filtered[i], out_of_range[i], area_cm2)
+                    for sc, (counts, filtered, out_of_range) in zip(self.schemes, per_scheme)
+                }
+                out.append(res)
+        if self.follicle_units and json_datas:
+            rows, n_units = zip(*(hair_follicle_rows(d) for d in json_datas))
+            stats = follicle_unit_stats(thickness_um, np.concatenate(rows), offsets, n_units)
+            for res, st in zip(out, stats):
+                res["data"]["follicular_units"] = st
+        if self.heatmap_cell_mm and json_datas:
+            cx = np.concatenate([_hair_column(d, "cx") for d in json_datas])
+            cy = np.concatenate([_hair_column(d, "cy") for d in json_datas])
+            rois = [d.roi if isinstance(d, TrichoRecord) else np.array(d['roi'], dtype="float64") for d in json_datas]
+            maps = density_heatmaps(cx, cy, idx, offsets, rois, ppmms, self.labels, self.heatmap_cell_mm)
+            for res, hm in zip(out, maps):
+                res["data"]["heatmap"] = hm
+        return out
+
+    def count_schemes(
+        self,
+        thickness_um: np.ndarray,
+        offsets: Sequence[int],
+        score: Optional[np.ndarray] = None,
+        valid: Optional[np.ndarray] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        全スキームの件数を 1 回のソートから数える。ROI ごとに太さを昇順に並べておけば、各スキームは
+        境界の searchsorted（境界数 × log n）だけで済むので、スキームを増やしてもデータ全体を走査し直さない。
+        フィルタはソート済み配列の部分列（順序は保たれる）として、異なるフィルタごとに 1 回だけ作る。
+        区間は class_index と同じ左閉右開。NaN・範囲外は out_of_range。
+        戻り値: self.schemes 順に (counts (ROI, クラス), filtered (ROI,), out_of_range (ROI,))
+        """
+        thickness_um = np.asarray(thickness_um, dtype="float64")
+        offsets = np.asarray(offsets, dtype=np.int64)
+        n_roi = len(offsets) - 1
+        bounds = list(zip(offsets[:-1], offsets[1:]))
+        # ROI は連続しているので区間ごとに並べる（NaN は各 ROI の末尾）
+        order = np.concatenate([np.argsort(thickness_um[a:b]) + a for a, b in bounds]) if n_roi else np.zeros(0, np.int64)
+        t_sorted = thickness_um[order]
+
+        segments: Dict[Any, Tuple[List[np.ndarray], np.ndarray]] = {}
+        for f in dict.fromkeys(sc.filter for sc in self.schemes):
+            keep = f.mask(score, valid)
+            if keep is None:
+                segments[f] = ([t_sorted[a:b] for a, b in bounds], np.zeros(n_roi, dtype=np.int64))
+            else:
+                keep = keep[order]
+                segs = [t_sorted[a:b][keep[a:b]] for a, b in bounds]
+                segments[f] = (segs, np.array([(b - a) - len(sg) for (a, b), sg in zip(bounds, segs)], dtype=np.int64))
+
+        results = []
+        for sc in self.schemes:
+            segs, filtered = segments[sc.filter]
+            edges = np.asarray(sc.bins, dtype="float64")
+            counts = np.zeros((n_roi, len(sc.labels)), dtype=np.int64)
+            for r, sg in enumerate(segs):
+                counts[r] = np.diff(np.searchsorted(sg, edges, side="left"))
+            out_of_range = np.array([len(sg) for sg in segs], dtype=np.int64) - counts.sum(axis=1)
+            results.append((counts, filtered, out_of_range))
+        return results
+
+    @staticmethod
+    def _area_cm2(json_data: TrichoInput) -> float:
+        roi = json_data.roi if isinstance(json_data, TrichoRecord) else np.array(json_data['roi'])
+        ppmm = json_data.ppmm if isinstance(json_data, TrichoRecord) else float(json_data['ppmm'])
+        width_mm = float(np.max(roi[:, 0]) - np.min(roi[:, 0])) / ppmm
+        height_mm = float(np.max(roi[:, 1]) - np.min(roi[:, 1])) / ppmm
+        return (width_mm * height_mm) / 100.0
+
+    @staticmethod
+    def _density(cls_counts: np.ndarray, area_cm2: float) -> List[Optional[float]]:
+        if area_cm2 > 0:
+            return [float(v) for v in np.round(cls_counts / area_cm2, 2)]
+        return [None] * len(cls_counts)
+
+    def _scheme_block(
+        self, scheme: ThicknessScheme, cls_counts: np.ndarray, filtered: int, out_of_range: int, area_cm2: float
+    ) -> Dict[str, Any]:
+        return {
+            "filter": scheme.filter.to_dict(),
+            "classification": {label: int(c) for label, c in zip(scheme.labels, cls_counts)},
+            "density_per_cm2": dict(zip(scheme.labels, self._density(cls_counts, area_cm2))),
+            "excluded": {"filtered": int(filtered), "out_of_range": int(out_of_range)},
+        }
+
+    def _summarize(self, json_data: TrichoInput, cls_counts: np.ndarray) -> Dict[str, Any]:
+        if isinstance(json_data, TrichoRecord):
+            roi, ppmm, location = json_data.roi, json_data.ppmm, json_data.location
+            num_follicles, num_hairs = len(json_data.follicles), len(json_data.hairs)
+        else:
+            roi = np.array(json_data['roi'])
+            ppmm = float(json_data['ppmm'])
+            location = json_data['location']
+            num_follicles = len(json_data.get('follicle_units', []))
+            num_hairs = len(json_data.get('hairs', []))
         width_px  = float(np.max(roi[:, 0]) - np.min(roi[:, 0]))
         height_px = float(np.max(roi[:, 1]) - np.min(roi[:, 1]))
         width_mm  = width_px / ppmm
         height_mm = height_px / ppmm
         area_cm2  = (width_mm * height_mm) / 100.0
-        num_follicles = len(json_data.get('follicle_units', []))
-        hairs = json_data.get('hairs', [])
-        num_hairs = len(hairs)
-        hair_widths_px = [h['w'] for h in hairs]
-        hair_thickness_um = [(w / ppmm) * 1000.0 for w in hair_widths_px]
-
-        if len(hair_thickness_um) > 0:
-            ser = pd.Series(hair_thickness_um, dtype="float64")
-            classified = pd.cut(ser, bins=self.bins, labels=self.labels, right=False)
-            cls_counts = classified.value_counts().sort_index()
-        else:
-            cls_counts = pd.Series({label: 0 for label in self.labels})
 
-        if area_cm2 > 0:
-            density = (cls_counts / area_cm2).round(2)
-        else:
-            density = pd.Series({label: None for label in self.labels})
+        density = self._density(cls_counts, area_cm2)
 
         return {
             "location": location,
             "data":{
                 "roi": {"width_mm": round(width_mm, 2), "height_mm": round(height_mm, 2), "area_cm2": round(area_cm2, 2)},
                 "counts": {"follicles": int(num_follicles), "hairs": int(num_hairs)},
-                "classification": {label: int(cls_counts.get(label, 0)) for label in self.labels},
-                "density_per_cm2": {label: (None if density.get(label, None) is None else float(density.get(label))) for label in self.labels}
+                "classification": {label: int(c) for label, c in zip(self.labels, cls_counts)},
+                "density_per_cm2": dict(zip(self.labels, density))
             }
         }
 
+def _hair_widths(d: TrichoInput) -> np.ndarray:
+    if isinstance(d, TrichoRecord):
+        return d.hairs.w
+    hairs = d.get('hairs', [])
+    return np.fromiter((h['w'] for h in hairs), dtype="float64", count=len(hairs))
+
+def _hair_column(d: TrichoInput, name: str) -> np.ndarray:
+    """hairs[].score（欠測 NaN）/ hairs[].valid（欠測 True）の列"""
+    if isinstance(d, TrichoRecord):
+        return getattr(d.hairs, name)
+    hairs = d.get('hairs', [])
+    if name == "valid":
+        return np.fromiter((bool(h.get('valid', True)) for h in hairs), dtype=bool, count=len(hairs))
+    return np.fromiter((h.get(name, np.nan) for h in hairs), dtype="float64", count=len(hairs))
+
+def stack_hair_widths(json_datas: Sequence[TrichoInput]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """各 ROI の hairs[].w を連結した配列、ROI 境界の offsets、ROI ごとの ppmm を返す"""
+    parts = [_hair_widths(d) for d in json_datas]
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in parts], out=offsets[1:])
+    widths = np.concatenate(parts) if parts else np.zeros(0, dtype="float64")
+    ppmms = np.array([d.ppmm if isinstance(d, TrichoRecord) else float(d['ppmm']) for d in json_datas], dtype="float64")
+    return widths, offsets, ppmms
+
 def analyze_tricho_file(file_path: str, analyzer: TrichoAnalyzer) -> Dict[str, Any]:
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        result = analyzer.analyze(data)
+        result = analyzer.analyze(load_tricho(file_path))
         result["file"] = os.path.basename(file_path)
         return result
     except FileNotFoundError:
@@ -59,10 +246,52 @@ def analyze_tricho_file(file_path: str, analyzer: TrichoAnalyzer) -> Dict[str, A
     except Exception as e:
         return {"file": os.path.basename(file_path), "error": f"解析エラー: {e}"}
 
-def run_on_dir(input_dir: str):
-    analyzer = TrichoAnalyzer()
-    outputs = []
-    for i in range(4):
-        file_path = os.path.join(input_dir, f"tricho_{i}.json")
-        outputs.append(analyze_tricho_file(file_path, analyzer))
-    return outputs
+def _timed_analyze_tricho_file(file_path: str, analyzer: TrichoAnalyzer) -> Tuple[Dict[str, Any], float, float]:
+    """analyze_tricho_file と (wall 秒, 実行したスレッド/プロセスの CPU 秒)"""
+    t0, c0 = time.perf_counter(), time.thread_time()
+    result = analyze_tricho_file(file_path, analyzer)
+    return result, time.perf_counter() - t0, time.thread_time() - c0
+
+_TRICHO_NAME = re.compile(r"^tricho_(.*)\.json$", re.IGNORECASE)
+
+def discover_tricho_files(input_dir: str) -> List[str]:
+    """input_dir 直下の tricho_*.json を番号順（tricho_2 < tricho_10、番号以外は後ろに名前順）で返す"""
+    if not os.path.isdir(input_dir):
+        return []
+    found = []
+    with os.scandir(input_dir) as it:
+        for e in it:
+            m = _TRICHO_NAME.match(e.name)
+            if m and e.is_file():
+                suffix = m.group(1)
+                found.append(((0, int(suffix), "") if suffix.isdigit() else (1, 0, suffix), e.path))
+    return [p for _, p in sorted(found)]
+
+def run_on_dir(
+    input_dir: str,
+    *,
+    workers: int = 1,
+    executor: str = "thread",
+    analyzer: Optional[TrichoAnalyzer] = None,
+    timings: Optional[List[Tuple[str, float, float]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    input_dir 内の tricho_*.json をすべて解析する（件数・番号は問わない）。
+    workers > 1 なら executor ("thread" | "process") のプールで並列実行。結果は常にファイル番号順。
+    executor="process" なら workers=1 でも子プロセスで解析する（呼び出し側の GIL を塞がない）。
+    timings にリストを渡すと、ファイルごとの (ファイル名, wall 秒, CPU 秒) を番号順に追記する。
+    """
+    analyzer = analyzer or TrichoAnalyzer()
+    files = discover_tricho_files(input_dir)
+    n = min(max(workers, 1), len(files))
+    fn = _timed_analyze_tricho_file if timings is not None else analyze_tricho_file
+    if n == 0 or (n == 1 and executor != "process"):
+        out = [fn(p, analyzer) for p in files]
+    else:
+        pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+        with pool_cls(max_workers=n) as pool:
+            out = list(pool.map(fn, files, [analyzer] * len(files)))
+    if timings is None:
+        return out
+    timings.extend((os.path.basename(p), wall, cpu) for p, (_, wall, cpu) in zip(files, out))
+    return [r for r, _, _ in out]
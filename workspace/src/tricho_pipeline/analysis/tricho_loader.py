@@ -0,0 +1,140 @@
+from __future__ import annotations
+import json
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+HAIR_FLOAT_COLUMNS = ("w", "h", "a", "cx", "cy", "score")
+
+@dataclass
+class HairColumns:
+    w: np.ndarray
+    h: np.ndarray
+    a: np.ndarray
+    cx: np.ndarray
+    cy: np.ndarray
+    score: np.ndarray
+    valid: np.ndarray
+    follicle: np.ndarray           # follicles の行番号（対応なしは -1）
+    uuid: Optional[np.ndarray]     # uuid_table への添字（keep_hair_uuids=True のときのみ）
+
+    def __len__(self) -> int:
+        return len(self.w)
+
+@dataclass
+class FollicleColumns:
+    x: np.ndarray
+    y: np.ndarray
+    uuid: np.ndarray               # uuid_table への添字
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+@dataclass
+class TrichoRecord:
+    """tricho_N.json の列指向表現。解析に使わないトップレベル項目は meta に残す"""
+    location: str
+    ppmm: float
+    roi: np.ndarray
+    hairs: HairColumns
+    follicles: FollicleColumns
+    uuid_table: List[str] = field(default_factory=list)
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+class _Row(int):
+    """hook が行として積んだオブジェクトの代わりに返す行番号"""
+    __slots__ = ()
+
+class _ColumnBuilder:
+    """
+    json の object_pairs_hook としてオブジェクトを受け取り、w / cx / x / uuid / follicle_uuid のどれかを持つもの
+    （毛・毛包の要素）は dict を残さず行として列に積み、代わりに行番号を返す。
+    毛か毛包かは鍵ではなく、トップレベルの hairs / follicle_units のどちらに入っていたかで決める
+    （欠けた項目は NaN。鍵が 1 つも無い要素は dict のまま届くので build で行にする）。
+    """
+
+    def __init__(self, keep_hair_uuids: bool) -> None:
+        self.keep_hair_uuids = keep_hair_uuids
+        self.codes: Dict[str, int] = {}
+        self.uuids: List[str] = []
+        self.cols = {k: array("d") for k in HAIR_FLOAT_COLUMNS + ("x", "y")}
+        self.valid = array("b")
+        self.follicle_code = array("l")
+        self.row_uuid: List[Optional[str]] = []  # 符号化は build で必要な行だけ
+        self.top: Dict[str, Any] = {}
+
+    def code(self, uuid: Optional[str]) -> int:
+        if uuid is None:
+            return -1
+        c = self.codes.get(uuid)
+        if c is None:
+            c = self.codes[uuid] = len(self.uuids)
+            self.uuids.append(uuid)
+        return c
+
+    def _append(self, obj: Dict[str, Any]) -> _Row:
+        get, nan = obj.get, np.nan
+        c = self.cols
+        c["w"].append(get("w", nan)); c["h"].append(get("h", nan)); c["a"].append(get("a", nan))
+        c["cx"].append(get("cx", nan)); c["cy"].append(get("cy", nan)); c["score"].append(get("score", nan))
+        c["x"].append(get("x", nan)); c["y"].append(get("y", nan))
+        self.valid.append(bool(get("valid", True)))
+        self.follicle_code.append(self.code(get("follicle_uuid")))
+        self.row_uuid.append(get("uuid"))
+        return _Row(len(self.row_uuid) - 1)
+
+    def hook(self, pairs: List[tuple]) -> Any:
+        obj = dict(pairs)
+        if ("w" in obj or "x" in obj or "cx" in obj or "uuid" in obj or "follicle_uuid" in obj) \
+                and "hairs" not in obj and "follicle_units" not in obj:
+            return self._append(obj)
+        self.top = obj  # 最後に呼ばれるのがトップレベル
+        return obj
+
+    def _rows(self, items: Any) -> np.ndarray:
+        rows = [it if isinstance(it, _Row) else self._append(it) for it in items or () if isinstance(it, (_Row, dict))]
+        return np.array(rows, dtype=np.int64)
+
+    def build(self) -> TrichoRecord:
+        top = self.top
+        hair_rows = self._rows(top.get("hairs"))
+        fol_rows = self._rows(top.get("follicle_units"))
+        cols = {k: np.frombuffer(v, dtype="float64") for k, v in self.cols.items()}
+        fol_uuid = np.array([self.code(self.row_uuid[r]) for r in fol_rows], dtype=np.int32)
+        hair_codes = np.frombuffer(self.follicle_code, dtype=self.follicle_code.typecode)[hair_rows]
+        # follicle_uuid のコード → follicles の行番号（uuid の無い毛包には辿れない）
+        row_of_code = np.full(len(self.uuids) + 1, -1, dtype=np.int32)
+        known = fol_uuid >= 0
+        row_of_code[fol_uuid[known]] = np.arange(len(fol_uuid), dtype=np.int32)[known]
+        hairs = HairColumns(
+            **{k: cols[k][hair_rows] for k in HAIR_FLOAT_COLUMNS},
+            valid=np.frombuffer(self.valid, dtype=np.int8)[hair_rows].astype(bool),
+            follicle=row_of_code[hair_codes],  # -1 は末尾の番兵 (-1) を指す
+            uuid=np.array([self.code(self.row_uuid[r]) for r in hair_rows], dtype=np.int32) if self.keep_hair_uuids else None,
+        )
+        follicles = FollicleColumns(x=cols["x"][fol_rows], y=cols["y"][fol_rows], uuid=fol_uuid)
+        meta = {k: v for k, v in top.items() if k not in ("hairs", "follicle_units", "roi", "ppmm", "location")}
+        return TrichoRecord(
+            location=top["location"],
+            ppmm=float(top["ppmm"]),
+            roi=np.array(top["roi"], dtype="float64"),
+            hairs=hairs,
+            follicles=follicles,
+            uuid_table=self.uuids,
+            meta=meta,
+        )
+
+def loads_tricho(text: str, *, keep_hair_uuids: bool = False) -> TrichoRecord:
+    builder = _ColumnBuilder(keep_hair_uuids)
+    json.loads(text, object_pairs_hook=builder.hook)
+    return builder.build()
+
+def load_tricho(path: str, *, keep_hair_uuids: bool = False) -> TrichoRecord:
+    """
+    tricho_N.json を読み、hairs / follicle_units を dict 木を作らずに型付き配列へ流し込む。
+    UUID は uuid_table への整数添字で保持（hairs[].uuid は解析で使わないので既定では捨てる）。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return loads_tricho(f.read(), keep_hair_uuids=keep_hair_uuids)
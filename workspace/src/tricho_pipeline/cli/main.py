@@ -1,49 +1,269 @@
 from __future__ import annotations
 import argparse, json, sys
-from tricho_pipeline.core.config import PipelineConfig
-from tricho_pipeline.core.orchestrator import Orchestrator
+from tricho_pipeline.core.config import PipelineConfig, ExtractorConfig
 from tricho_pipeline.core.io_utils import newest_path_in, newest_path_and_pdf
+# Orchestrator（pymupdf / numpy）などの重いモジュールは各サブコマンド内で読み込む
+
+def _open_index(args):
+    """--index があれば永続索引、無ければ一時索引（全走査）を開いて必要なら差分更新する"""
+    from tricho_pipeline.core.mtime_index import MtimeIndex
+
+    idx = MtimeIndex(args.index or ":memory:", args.path)
+    if not (args.index and args.no_refresh):
+        idx.refresh()
+    return idx
 
 def _cmd_newest(args) -> int:
-    p = newest_path_in(args.path, dirs_only=args.dirs_only, files_only=args.files_only)
+    if args.index:
+        with _open_index(args) as idx:
+            p = idx.newest(dirs_only=args.dirs_only, files_only=args.files_only)
+    else:
+        p = newest_path_in(args.path, dirs_only=args.dirs_only, files_only=args.files_only)
     print(p or "")
     return 0
 
 def _cmd_newest_with_pdf(args) -> int:
-    newest, pdfp = newest_path_and_pdf(args.path)
+    if args.index:
+        with _open_index(args) as idx:
+            newest, pdfp = idx.newest_with_pdf()
+    else:
+        newest, pdfp = newest_path_and_pdf(args.path)
     print(json.dumps({"newest": newest, "pdf": pdfp}, ensure_ascii=False, indent=2))
     return 0
 
+def _cmd_today(args) -> int:
+    from datetime import date
+
+    day = date.fromisoformat(args.date) if args.date else None
+    with _open_index(args) as idx:
+        visits = idx.visits_on(day)
+    print(json.dumps(visits, ensure_ascii=False, indent=2))
+    return 0
+
+def _cmd_history(args) -> int:
+    from tricho_pipeline.core.results_store import ResultsStore
+
+    with ResultsStore(args.results_db) as store:
+        dob = args.dob
+        if dob is None:
+            # 生年月日を省いたら氏名だけで引く。同姓同名がいれば混ぜずに候補を示して止める
+            dobs = store.patients(args.patient)
+            if len(dobs) > 1:
+                print(f"several patients named {args.patient!r}; pass --dob one of: "
+                      + ", ".join(d or "(unknown)" for d in dobs), file=sys.stderr)
+                return 2
+            dob = dobs[0] if dobs else ""
+        if args.visits:
+            out = store.visits(args.patient, dob)
+        else:
+            out = store.history(args.patient, dob, location=args.location, all_runs=args.all_runs)
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+    return 0
+
+def _cmd_norms(args) -> int:
+    from tricho_pipeline.core.norm_store import NormStore
+
+    with NormStore(args.results_db) as norms:
+        if args.rebuild:
+            from tricho_pipeline.core.results_store import ResultsStore
+
+            with ResultsStore(args.results_db) as store:
+                n = norms.rebuild(store.latest_visits())
+            print(f"rebuilt from {n} visit(s)", file=sys.stderr)
+        out = norms.table(location=args.location, band=args.band)
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+    return 0
+
+def _pipeline_config(args) -> PipelineConfig:
+    return PipelineConfig(
+        out_root=args.out_root,
+        remove_raw_images=not args.keep_raw,
+        cache_dir=args.cache_dir,
+        cache_max_mb=args.cache_max_mb,
+        analysis_workers=args.workers,
+        analysis_executor=args.executor,
+        concurrent_stages=not args.sequential,
+        results_db=args.results_db,
+        norms_min_n=args.norms_min_n,
+        analysis_schemes=tuple(args.scheme),
+        follicle_units=args.follicle_units,
+        heatmap_cell_mm=args.heatmap_cell_mm,
+        extractor=ExtractorConfig(
+            image_engine=args.image_engine,
+            direct_output=args.direct_output,
+            metadata_source=args.metadata_source,
+        ),
+    )
+
+def _cmd_meta(args) -> int:
+    from tricho_pipeline.extraction.report_metadata import extract_report_metadata
+
+    if len(args.pdf_paths) == 1:
+        print(json.dumps(extract_report_metadata(args.pdf_paths[0]), ensure_ascii=False, indent=2))
+        return 0
+    # 複数指定時は 1 行 1 PDF の JSON Lines（索引付け用）
+    for pdf in args.pdf_paths:
+        try:
+            meta = extract_report_metadata(pdf)
+        except Exception as e:
+            meta = {"error": f"読み込みエラー: {e}"}
+        print(json.dumps({"pdf": pdf, **meta}, ensure_ascii=False), flush=True)
+    return 0
+
+def _print_timings(args, summary) -> None:
+    """--timings 指定時、summary.json と同じ span ツリーを stderr に表形式で出す（stdout の JSON は汚さない）"""
+    if not args.timings or not summary.timings:
+        return
+    from tricho_pipeline.core.timing import format_spans
+
+    print("\n".join(format_spans(summary.timings)), file=sys.stderr, flush=True)
+
 def _cmd_run(args) -> int:
-    cfg = PipelineConfig(out_root=args.out_root, remove_raw_images=not args.keep_raw)
+    from tricho_pipeline.core.orchestrator import Orchestrator
+
+    cfg = _pipeline_config(args)
     orch = Orchestrator(cfg)
     summary = orch.run(args.json_dir, args.pdf_path, args.out_root)
-    print(json.dumps({
-        "temp_root": summary.temp_root,
-        "filtered_images_dir": summary.filtered_images_dir,
-        "final_report_json": summary.final_report_json,
-        "image_counts": summary.image_counts,
-        "notes": summary.notes
-    }, ensure_ascii=False, indent=2))
+    print(json.dumps(summary.to_dict(), ensure_ascii=False, indent=2))
+    _print_timings(args, summary)
+    return 0
+
+def _cmd_watch(args) -> int:
+    import logging
+    from tricho_pipeline.core.orchestrator import Orchestrator
+    from tricho_pipeline.core.watcher import VisitWatcher
+
+    logger = logging.getLogger("tricho_watch")
+    if not logger.handlers:
+        h = logging.StreamHandler()
+        h.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+        logger.addHandler(h)
+        logger.setLevel(logging.INFO)
+    cfg = _pipeline_config(args)
+
+    def on_ready(job) -> None:
+        orch = Orchestrator(cfg)
+        if args.render_js:
+            summary, out_pdf = orch.run_and_render(
+                job.json_dir, job.pdf_path, args.out_root,
+                render_js=args.render_js, html=args.html, node_bin=args.node_bin,
+                warm=not args.one_shot_render,
+            )
+        else:
+            summary, out_pdf = orch.run(job.json_dir, job.pdf_path, args.out_root), None
+        orch.wait_background()
+        print(json.dumps({"pdf": job.pdf_path, "pdf_out": out_pdf, **summary.to_dict()}, ensure_ascii=False), flush=True)
+        _print_timings(args, summary)
+
+    index = None
+    if args.index:
+        from tricho_pipeline.core.mtime_index import MtimeIndex
+        index = MtimeIndex(args.index, args.root)
+        index.refresh()
+    try:
+        VisitWatcher(
+            args.root, on_ready,
+            settle_seconds=args.settle, poll_interval=args.interval, native=not args.polling, logger=logger,
+            index=index,
+        ).run_forever()
+    finally:
+        if index is not None:
+            index.close()
     return 0
 
+def _cmd_render_batch(args) -> int:
+    from tricho_pipeline.core.node_render import render_many
+
+    def on_result(r) -> None:
+        print(json.dumps(r, ensure_ascii=False), flush=True)
+
+    results = render_many(
+        args.temp_dirs, args.render_js, pool=args.pool, html=args.html, node_bin=args.node_bin, on_result=on_result
+    )
+    return 0 if all(r["ok"] for r in results) else 1
+
+def _cmd_backfill(args) -> int:
+    import dataclasses, logging
+    from tricho_pipeline.core.backfill import backfill
+
+    logger = logging.getLogger("tricho_backfill")
+    if not logger.handlers:
+        h = logging.StreamHandler()
+        h.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+        logger.addHandler(h)
+        logger.setLevel(logging.INFO)
+    # --out-root は来院ごとの出力先の親（<out-root>/<患者>/temp_YYYYMMDD）として使う
+    cfg = dataclasses.replace(_pipeline_config(args), out_root=None)
+    result = backfill(
+        args.root, cfg,
+        checkpoint_path=args.checkpoint, workers=args.jobs, out_base=args.out_root,
+        max_days_apart=args.max_days_apart, retry_failed=not args.skip_failed, limit=args.limit, logger=logger,
+    )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result["failed"] == 0 else 1
+
 def _cmd_run_render(args) -> int:
-    cfg = PipelineConfig(out_root=args.out_root, remove_raw_images=not args.keep_raw)
+    from tricho_pipeline.core.orchestrator import Orchestrator
+
+    cfg = _pipeline_config(args)
     orch = Orchestrator(cfg)
     summary, out_pdf = orch.run_and_render(
         args.json_dir, args.pdf_path, args.out_root,
-        render_js=args.render_js, out_pdf=args.out_pdf, html=args.html, node_bin=args.node_bin
+        render_js=args.render_js, out_pdf=args.out_pdf, html=args.html, node_bin=args.node_bin,
+        warm=not args.one_shot_render,
     )
-    print(json.dumps({
-        "temp_root": summary.temp_root,
-        "pdf_out": out_pdf,
-        "filtered_images_dir": summary.filtered_images_dir,
-        "final_report_json": summary.final_report_json,
-        "image_counts": summary.image_counts,
-        "notes": summary.notes
-    }, ensure_ascii=False, indent=2))
+    d = summary.to_dict()
+    print(json.dumps({"temp_root": d.pop("temp_root"), "pdf_out": out_pdf, **d}, ensure_ascii=False, indent=2))
+    _print_timings(args, summary)
     return 0
 
+def _add_index_args(sp) -> None:
+    sp.add_argument("--index", metavar="DB", help="SQLite mtime index of the tree (refreshed incrementally)")
+    sp.add_argument("--no-refresh", action="store_true", help="Answer from --index as is (kept fresh by watch --index)")
+
+def _scheme_arg(spec: str) -> str:
+    from tricho_pipeline.analysis.schemes import parse_scheme
+
+    try:
+        parse_scheme(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+def _positive_float(text: str) -> float:
+    v = float(text)
+    if v <= 0:
+        raise argparse.ArgumentTypeError(f"must be > 0: {text}")
+    return v
+
+def _add_timings_arg(sp) -> None:
+    sp.add_argument("--timings", action="store_true", help="Print per-stage wall/CPU timings to stderr")
+
+def _add_pipeline_args(sp) -> None:
+    sp.add_argument("--out-root")
+    sp.add_argument("--keep-raw", action="store_true")
+    sp.add_argument("--image-engine", choices=["render", "xref"], default="render",
+                    help='"xref": extract embedded images natively instead of rendering at 300 dpi')
+    sp.add_argument("--direct-output", action="store_true",
+                    help="Write kept images once under their final names (no temp dir/copy/rename)")
+    sp.add_argument("--metadata-source", choices=["markdown", "header"], default="markdown",
+                    help='"header": read name/DOB/date from page-1 header spans only')
+    sp.add_argument("--cache-dir", help="Persistent extraction cache directory (disabled if omitted)")
+    sp.add_argument("--cache-max-mb", type=int, default=512, help="Cache size cap in MB (LRU eviction)")
+    sp.add_argument("--workers", type=int, default=1, help="Parallel workers for tricho_*.json analysis")
+    sp.add_argument("--executor", choices=["thread", "process"], default="thread")
+    sp.add_argument("--sequential", action="store_true", help="Run PDF extraction and tricho analysis one after another")
+    sp.add_argument("--results-db", help="SQLite results store to record every run into (disabled if omitted)")
+    sp.add_argument("--norms-min-n", type=int, default=20,
+                    help="Minimum clinic visits per region/age band for percentiles; smaller bands fall back to all ages "
+                         "(with --results-db)")
+    sp.add_argument("--scheme", action="append", default=[], type=_scheme_arg, metavar="NAME[:FILTER]",
+                    help='Extra thickness classification, e.g. "fine_10um" or "vellus_terminal:valid,score>=0.8" (repeatable)')
+    sp.add_argument("--follicle-units", action="store_true",
+                    help="Add the per-region follicular-unit distribution (hairs per unit, mean thickness by size)")
+    sp.add_argument("--heatmap-cell-mm", type=_positive_float, default=None, metavar="MM",
+                    help="Add a per-region spatial density map with cells of about MM mm (off unless given)")
+
 def main() -> int:
     p = argparse.ArgumentParser(prog="tricho-pipeline", description="Tricho pipeline utilities")
     sub = p.add_subparsers(dest="cmd", required=True)
@@ -54,33 +274,106 @@ def main() -> int:
     g = sp.add_mutually_exclusive_group()
     g.add_argument("--dirs-only", action="store_true")
     g.add_argument("--files-only", action="store_true")
+    _add_index_args(sp)
     sp.set_defaults(func=_cmd_newest)
 
     # newest-with-pdf
     sp = sub.add_parser("newest-with-pdf", help="Show newest entry and newest PDF under it")
     sp.add_argument("path")
+    _add_index_args(sp)
     sp.set_defaults(func=_cmd_newest_with_pdf)
 
+    # today
+    sp = sub.add_parser("today", help="List today's visit folders with their HairReport PDF")
+    sp.add_argument("path")
+    sp.add_argument("--date", help="YYYY-MM-DD instead of today")
+    _add_index_args(sp)
+    sp.set_defaults(func=_cmd_today)
+
+    # meta
+    sp = sub.add_parser("meta", help="Print report metadata (name/DOB/appointment date) from PDF header")
+    sp.add_argument("pdf_paths", nargs="+", metavar="pdf")
+    sp.set_defaults(func=_cmd_meta)
+
+    # history
+    sp = sub.add_parser("history", help="Show a patient's per-visit results from the results store")
+    sp.add_argument("patient", help="Patient name (report_metadata.name) or patient folder name")
+    sp.add_argument("--results-db", required=True)
+    sp.add_argument("--dob", help="Date of birth (YYYY/MM/DD); required when several patients share the name")
+    sp.add_argument("--location", help="Only this region (e.g. \"Frontal 1 left\")")
+    sp.add_argument("--all-runs", action="store_true", help="Include same-day reruns, not just the latest")
+    sp.add_argument("--visits", action="store_true", help="List visits (latest run per date) instead of results")
+    sp.set_defaults(func=_cmd_history)
+
+    # norms
+    sp = sub.add_parser("norms", help="Show clinic-wide per-region, per-age-band statistics from the results store")
+    sp.add_argument("--results-db", required=True)
+    sp.add_argument("--location", help="Only this region (e.g. \"Frontal 1 left\")")
+    sp.add_argument("--band", help='Only this age band (e.g. "40-49" or "all")')
+    sp.add_argument("--rebuild", action="store_true",
+                    help="First drop all statistics and refold every recorded visit with the current binning")
+    sp.set_defaults(func=_cmd_norms)
+
     # run
     sp = sub.add_parser("run", help="Run extraction+analysis pipeline")
     sp.add_argument("json_dir")
     sp.add_argument("pdf_path")
-    sp.add_argument("--out-root")
-    sp.add_argument("--keep-raw", action="store_true")
+    _add_pipeline_args(sp)
+    _add_timings_arg(sp)
     sp.set_defaults(func=_cmd_run)
 
     # run-render
     sp = sub.add_parser("run-render", help="Run pipeline then render PDF via Node.js")
     sp.add_argument("json_dir")
     sp.add_argument("pdf_path")
-    sp.add_argument("--out-root")
-    sp.add_argument("--keep-raw", action="store_true")
+    _add_pipeline_args(sp)
     sp.add_argument("--render-js", required=True, help="Path to Node render.js")
     sp.add_argument("--out-pdf", help="Output PDF name (optional)")
     sp.add_argument("--html", help="Override report.html path (optional)")
     sp.add_argument("--node-bin", default="node", help='Node binary (default: "node")')
+    sp.add_argument("--one-shot-render", action="store_true",
+                    help="Spawn render.js per report instead of reusing a warm render server")
+    _add_timings_arg(sp)
     sp.set_defaults(func=_cmd_run_render)
 
+    # render-batch
+    sp = sub.add_parser("render-batch", help="Render many temp dirs with one browser and a page pool")
+    sp.add_argument("temp_dirs", nargs="+", metavar="temp_dir")
+    sp.add_argument("--render-js", required=True, help="Path to Node render.js")
+    sp.add_argument("--pool", type=int, default=4, help="Number of concurrent pages")
+    sp.add_argument("--html", help="Override report.html path (optional)")
+    sp.add_argument("--node-bin", default="node", help='Node binary (default: "node")')
+    sp.set_defaults(func=_cmd_render_batch)
+
+    # backfill
+    sp = sub.add_parser("backfill", help="Run the pipeline for every visit under the database root (resumable)")
+    sp.add_argument("root", help="Database root (one folder per patient)")
+    _add_pipeline_args(sp)
+    sp.add_argument("--jobs", type=int, help="Worker processes (default: CPU count)")
+    sp.add_argument("--checkpoint", default="tricho_backfill.jsonl", help="JSON Lines checkpoint; rerun to resume")
+    sp.add_argument("--max-days-apart", type=int, default=0,
+                    help="Max days between visit folder mtime and HairReport_<date>.pdf when pairing "
+                         "(the folder mtime moves when it is copied or touched; unpaired visits are listed in the summary)")
+    sp.add_argument("--skip-failed", action="store_true", help="Do not retry visits that failed in a previous run")
+    sp.add_argument("--limit", type=int, help="Process at most this many visits in this run")
+    sp.set_defaults(func=_cmd_backfill)
+
+    # watch
+    sp = sub.add_parser("watch", help="Watch HairMetrixDB and run the pipeline for each new visit + HairReport PDF")
+    sp.add_argument("root", help="Database root (one folder per patient)")
+    _add_pipeline_args(sp)
+    sp.add_argument("--render-js", help="Path to Node render.js (omit to run without rendering)")
+    sp.add_argument("--html", help="Override report.html path (optional)")
+    sp.add_argument("--node-bin", default="node", help='Node binary (default: "node")')
+    sp.add_argument("--one-shot-render", action="store_true",
+                    help="Spawn render.js per report instead of reusing a warm render server")
+    sp.add_argument("--settle", type=float, default=5.0, help="Seconds files must stay unchanged before processing")
+    sp.add_argument("--interval", type=float, default=1.0, help="Check interval in seconds")
+    sp.add_argument("--polling", action="store_true", help="Force mtime polling even if watchdog is installed")
+    sp.add_argument("--index", metavar="DB", help="Keep this SQLite mtime index up to date with detected changes")
+    _add_timings_arg(sp)
+    sp.set_defaults(func=_cmd_watch)
+
     args = p.parse_args()
     return args.func(args)
 
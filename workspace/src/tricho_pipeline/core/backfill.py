@@ -0,0 +1,198 @@
+from __future__ import annotations
+import os, json, time, logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from tricho_pipeline.core.config import PipelineConfig
+from tricho_pipeline.core.io_utils import OUTPUT_DIR_PREFIX
+from tricho_pipeline.core.watcher import REPORT_PDF, VisitJob, is_visit_dir, report_pdf_date as _pdf_date
+
+def pair_visits(
+    patient_dir: str, max_days_apart: int = 0, unpaired: Optional[List[Dict[str, Any]]] = None
+) -> List[VisitJob]:
+    """
+    患者フォルダ内の来院フォルダ（tricho_<N>.json を含む）それぞれに、日付が最も近い HairReport_<日付>.pdf を対応付ける。
+    来院日は来院フォルダの mtime の日付。差が max_days_apart 日を超える、または PDF が無い来院は対象外。
+    1 つの PDF は 1 来院にしか使わない（日付差の小さい組から確定）。
+    unpaired にリストを渡すと、対象外になった来院を {visit, visit_date, nearest_pdf, days_apart} で追記する。
+    """
+    try:
+        with os.scandir(patient_dir) as it:
+            entries = list(it)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    pdfs = [(d, e.path) for e in entries if e.is_file() and REPORT_PDF.match(e.name) for d in [_pdf_date(e.name)] if d]
+    visits = [(date.fromtimestamp(e.stat().st_mtime), e.path) for e in entries if is_visit_dir(e)]
+    candidates = sorted(
+        (abs((vd - pd).days), v, p)
+        for vd, v in visits for pd, p in pdfs
+        if abs((vd - pd).days) <= max_days_apart
+    )
+    used_v: Set[str] = set()
+    used_p: Set[str] = set()
+    jobs = []
+    for _, v, p in candidates:
+        if v in used_v or p in used_p:
+            continue
+        used_v.add(v); used_p.add(p)
+        jobs.append(VisitJob(patient_dir=patient_dir, json_dir=v, pdf_path=p))
+    if unpaired is not None:
+        for vd, v in sorted(visits, key=lambda x: x[1]):
+            if v in used_v:
+                continue
+            near = min(((abs((vd - pd).days), p) for pd, p in pdfs), default=(None, None))
+            unpaired.append({"visit": v, "visit_date": vd.isoformat(), "nearest_pdf": near[1], "days_apart": near[0]})
+    return sorted(jobs, key=lambda j: j.pdf_path)
+
+def discover_visits(
+    root: str, max_days_apart: int = 0, unpaired: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[VisitJob]:
+    """root 直下の全患者フォルダを走査して (来院フォルダ, PDF) の組を順に返す（unpaired は pair_visits と同じ）"""
+    with os.scandir(root) as it:
+        patients = sorted(e.path for e in it if e.is_dir())
+    for patient in patients:
+        yield from pair_visits(patient, max_days_apart, unpaired)
+
+def out_root_for(job: VisitJob, out_base: Optional[str] = None) -> str:
+    """
+    来院ごとの出力先。make_default_out_root は実行日で名前を付けるため、
+    一括処理では PDF の日付を使う（<患者フォルダ or out_base/患者名>/temp_YYYYMMDD）。
+    """
+    d = _pdf_date(os.path.basename(job.pdf_path))
+    name = OUTPUT_DIR_PREFIX + (d.strftime("%Y%m%d") if d else os.path.splitext(os.path.basename(job.pdf_path))[0])
+    parent = os.path.join(out_base, os.path.basename(job.patient_dir)) if out_base else job.patient_dir
+    return os.path.join(parent, name)
+
+def _job_key(job: VisitJob) -> str:
+    return f"{os.path.abspath(job.json_dir)}|{os.path.abspath(job.pdf_path)}"
+
+class Checkpoint:
+    """
+    処理結果を 1 行 1 来院の JSON Lines で追記するチェックポイント。
+    再開時は ok の来院を飛ばす（retry_failed=False なら失敗した来院も飛ばす）。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.done: Dict[str, Dict[str, Any]] = {}
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # 中断時に書きかけた行
+                    self.done[rec["key"]] = rec
+        self._f = open(path, "a", encoding="utf-8")
+
+    def should_skip(self, job: VisitJob, retry_failed: bool = True) -> bool:
+        rec = self.done.get(_job_key(job))
+        return rec is not None and (rec["ok"] or not retry_failed)
+
+    def record(self, rec: Dict[str, Any]) -> None:
+        self.done[rec["key"]] = rec
+        self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self._f.close()
+
+def _run_one(config: PipelineConfig, job: VisitJob, out_root: str) -> Dict[str, Any]:
+    """ワーカープロセスで 1 来院を処理する（例外は結果に記録して返す）"""
+    from tricho_pipeline.core.orchestrator import Orchestrator
+
+    t0 = time.perf_counter()
+    rec: Dict[str, Any] = {"key": _job_key(job), "json_dir": job.json_dir, "pdf": job.pdf_path, "out_root": out_root}
+    try:
+        orch = Orchestrator(config)
+        summary = orch.run(job.json_dir, job.pdf_path, out_root)
+        orch.wait_background()
+        rec.update(ok=True, final_report_json=summary.final_report_json)
+    except Exception as e:
+        rec.update(ok=False, error=f"{type(e).__name__}: {e}")
+    rec["sec"] = round(time.perf_counter() - t0, 3)
+    rec["at"] = datetime.now().isoformat(timespec="seconds")
+    return rec
+
+def backfill(
+    root: str,
+    config: PipelineConfig,
+    *,
+    checkpoint_path: str,
+    workers: Optional[int] = None,
+    out_base: Optional[str] = None,
+    max_days_apart: int = 0,
+    retry_failed: bool = True,
+    limit: Optional[int] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    logger: Optional[logging.Logger] = None,
+) -> Dict[str, Any]:
+    """
+    root 配下の全来院に Orchestrator.run をプロセスプールで適用する。
+    同じ患者フォルダの来院は PDF の日付順に 1 件ずつ（前の来院が終わってから次を投入）、別の患者同士は並列に処理する。
+    --results-db の trend / norms は過去来院を読むので、後の来院が先に走ると結果が実行ごとに変わるため。
+    結果は 1 件ごとに checkpoint_path へ追記するので、中断しても同じ引数で再実行すれば続きから処理する。
+    PDF と組にできなかった来院は処理せず、件数と一覧を戻り値の unpaired / unpaired_visits で返す。
+    """
+    logger = logger or logging.getLogger("tricho_backfill")
+    ckpt = Checkpoint(checkpoint_path)
+    todo, skipped = [], 0
+    unpaired: List[Dict[str, Any]] = []
+    for job in discover_visits(root, max_days_apart, unpaired):
+        if ckpt.should_skip(job, retry_failed):
+            skipped += 1
+            continue
+        todo.append(job)
+        if limit is not None and len(todo) >= limit:
+            break
+    logger.info("対象 %d 件（チェックポイント済み %d 件をスキップ）", len(todo), skipped)
+    for u in unpaired:
+        logger.warning(
+            "PDF と組にできない来院: %s（%s、最も近い PDF: %s / %s 日差。--max-days-apart で許容幅を指定）",
+            u["visit"], u["visit_date"], u["nearest_pdf"] or "なし", "-" if u["days_apart"] is None else u["days_apart"],
+        )
+
+    queues: Dict[str, List[VisitJob]] = {}
+    for job in todo:
+        queues.setdefault(job.patient_dir, []).append(job)
+    for q in queues.values():
+        q.sort(key=lambda j: (_pdf_date(os.path.basename(j.pdf_path)) or date.max, j.pdf_path), reverse=True)
+
+    ok = failed = i = 0
+    t0 = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(patient: str):
+        job = queues[patient].pop()  # 日付の降順に並べてあるので末尾が最も古い来院
+        return pool.submit(_run_one, config, job, out_root_for(job, out_base))
+
+    try:
+        running = {submit(p): p for p in queues}
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                patient = running.pop(fut)
+                if queues[patient]:
+                    running[submit(patient)] = patient
+                rec = fut.result()
+                i += 1
+                ckpt.record(rec)
+                ok += rec["ok"]; failed += not rec["ok"]
+                logger.info("[%d/%d] %s %s (%.1fs)", i, len(todo), "ok" if rec["ok"] else "NG", rec["pdf"], rec["sec"])
+                if on_result:
+                    on_result(rec)
+    except BaseException:
+        # Ctrl-C など: 未着手のジョブは捨てる（実行中の分は記録されないので再開時にやり直す）
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    else:
+        pool.shutdown()
+    finally:
+        ckpt.close()
+    return {
+        "processed": ok + failed, "ok": ok, "failed": failed, "skipped": skipped,
+        "unpaired": len(unpaired), "unpaired_visits": unpaired,
+        "sec": round(time.perf_counter() - t0, 1), "checkpoint": checkpoint_path,
+    }
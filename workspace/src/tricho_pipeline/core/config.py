@@ -14,6 +14,17 @@ DEFAULT_RENAME_MAP = {
 class ExtractorConfig:
     allowed_sizes: Set[Tuple[int, int]] = field(default_factory=lambda: set(DEFAULT_ALLOWED_SIZES))
     rename_map: Dict[str, str] = field(default_factory=lambda: dict(DEFAULT_RENAME_MAP))
+    # True: 画像抽出の to_markdown 1 回でテキストも取得（レイアウト解析を 1 回に）
+    single_pass: bool = True
+    # 画像抽出エンジン: "render"=pymupdf4llm で dpi 描画 / "xref"=埋め込み画像をネイティブのまま取り出す
+    image_engine: str = "render"
+    # allowed_sizes を判定する解像度（xref でも配置 bbox をこの dpi に換算して判定）
+    dpi: int = 300
+    # True: rename_map をメモリ上で解決し、残す画像を最終名で 1 回だけ書き出す
+    #       （temp_extracted_images / コピー / リネームを行わない）
+    direct_output: bool = False
+    # 氏名/生年月日/診察日の取得元: "markdown"=全文 Markdown / "header"=1ページ目上部のテキストスパンのみ
+    metadata_source: str = "markdown"
 
 @dataclass(frozen=True)
 class PipelineConfig:
@@ -21,3 +32,25 @@ class PipelineConfig:
     out_root: str | None = None
     # 画像の一時生ファイルは消す
     remove_raw_images: bool = True
+    extractor: ExtractorConfig = field(default_factory=ExtractorConfig)
+    # PDF 抽出結果の永続キャッシュ（None なら無効）。上限を超えると LRU で削除
+    cache_dir: str | None = None
+    cache_max_mb: int = 512
+    # tricho_*.json 解析の並列度と方式（"thread" | "process"）
+    analysis_workers: int = 1
+    analysis_executor: str = "thread"
+    # 既定の分類に加えて数える太さ分類（"fine_10um" / "vellus_terminal:valid,score>=0.8" など。analysis/schemes.py）
+    analysis_schemes: Tuple[str, ...] = ()
+    # True: 毛包単位の本数分布・平均太さ（data["follicular_units"]）も出す
+    follicle_units: bool = False
+    # 部位ごとの空間密度マップのセル寸法 [mm]。None（既定）なら作らない（CLI: --heatmap-cell-mm を指定したときだけ作る）
+    heatmap_cell_mm: float | None = None
+    # True: PDF 抽出と tricho 解析を同時に走らせる（CPU を重ねるには analysis_executor="process"）
+    concurrent_stages: bool = True
+    # 解析結果を蓄積する SQLite（None なら無効）。患者・診察日・部位で索引付け
+    results_db: str | None = None
+    # results_db 有効時の院内正規統計（core/norm_store.py）: 年齢帯の件数がこれ未満なら全年齢の分布を使い、
+    # それも未満ならパーセンタイルを出さない
+    norms_min_n: int = 20
+    # run ごとのログ（pdf_extractor.log / .jsonl）に加えて stderr にも出す
+    log_console: bool = True
@@ -1,15 +1,18 @@
 from __future__ import annotations
-import os, json, shutil
+import os, json, shutil, threading, uuid
 from datetime import datetime
 from typing import Any, Dict, Optional, Tuple
 
+# make_default_out_root が患者フォルダ直下に作る出力先の接頭辞
+OUTPUT_DIR_PREFIX = "temp_"
+
 def ensure_dir(p: str) -> None:
     os.makedirs(p, exist_ok=True)
 
 def make_default_out_root(pdf_path: str) -> str:
     today = datetime.now().strftime("%Y%m%d")
     base = os.path.dirname(os.path.abspath(pdf_path))
-    out_root = os.path.join(base, f"temp_{today}")
+    out_root = os.path.join(base, f"{OUTPUT_DIR_PREFIX}{today}")
     ensure_dir(out_root)
     return out_root
 
@@ -30,6 +33,23 @@ def try_remove(path: str) -> None:
     except FileNotFoundError:
         pass
 
+def remove_in_background(path: str) -> threading.Thread | None:
+    """
+    path をバックグラウンドスレッドで削除する（呼び出し元を待たせない）。
+    先に一意な名前へ rename しておくので、直後に同じ path を作り直しても競合しない。
+    非デーモンスレッドなので、プロセス終了時には削除完了を待つ。
+    """
+    if not os.path.exists(path):
+        return None
+    target = f"{path}.del-{uuid.uuid4().hex[:8]}"
+    try:
+        os.rename(path, target)
+    except OSError:
+        target = path  # rename できない（ロック中など）場合はそのまま消す
+    t = threading.Thread(target=try_remove, args=(target,), name="tricho-cleanup")
+    t.start()
+    return t
+
 # === New: ① 指定パス内部で最も新しいパス（ファイル/フォルダ）を取得 ===
 def newest_path_in(root: str, *, dirs_only: bool=False, files_only: bool=False) -> Optional[str]:
     """
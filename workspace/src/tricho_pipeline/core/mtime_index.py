@@ -0,0 +1,205 @@
+from __future__ import annotations
+import os, sqlite3
+from datetime import date, datetime, timedelta, time as dtime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from tricho_pipeline.core.io_utils import OUTPUT_DIR_PREFIX
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS entries(
+    path   TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name   TEXT NOT NULL,
+    depth  INTEGER NOT NULL,   -- 1: root 直下（患者フォルダ等）, 2: その直下（来院フォルダ / PDF）
+    is_dir INTEGER NOT NULL,
+    mtime  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_parent_mtime ON entries(parent, mtime);
+CREATE INDEX IF NOT EXISTS entries_depth_mtime ON entries(depth, is_dir, mtime);
+-- 子を列挙した時点のディレクトリ mtime。変わっていなければ再走査しない
+CREATE TABLE IF NOT EXISTS scanned(path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL);
+"""
+
+Row = Tuple[str, str, str, int, int, float]
+
+class MtimeIndex:
+    """
+    HairMetrixDB の root 直下（患者フォルダ）とその直下（来院フォルダ / HairReport PDF）を mtime 付きで
+    SQLite に保持する索引。refresh() はディレクトリの mtime が変わったフォルダだけを列挙し直す。
+    来院フォルダ内のファイル更新は患者フォルダの mtime を変えないため、既存の来院フォルダの mtime は
+    作成時点の値のまま残りうる（refresh(patients=...) で明示した患者フォルダは常に列挙し直す）。
+    db_path に ":memory:" を渡すと一時索引（毎回全走査）になる。
+    """
+
+    def __init__(self, db_path: str, root: str) -> None:
+        self.root = os.path.abspath(root)
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+        with self.conn:
+            cur = self.conn.execute("SELECT value FROM meta WHERE key='root'").fetchone()
+            if cur is None:
+                self.conn.execute("INSERT INTO meta(key, value) VALUES('root', ?)", (self.root,))
+            elif cur[0] != self.root:
+                raise ValueError(f"index {db_path} is for {cur[0]}, not {self.root}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "MtimeIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # --- 更新 ---
+    @staticmethod
+    def _list(dir_path: str, depth: int) -> Dict[str, Tuple[Row, int]]:
+        """dir_path 直下を列挙して {path: (row, mtime_ns)}（消えたディレクトリなら空）"""
+        out: Dict[str, Tuple[Row, int]] = {}
+        try:
+            with os.scandir(dir_path) as it:
+                for e in it:
+                    try:
+                        st = e.stat()
+                        is_dir = e.is_dir()
+                    except FileNotFoundError:
+                        continue
+                    out[e.path] = ((e.path, dir_path, e.name, depth, int(is_dir), st.st_mtime), st.st_mtime_ns)
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        return out
+
+    def _sync_children(self, parent: str, depth: int, listing: Dict[str, Tuple[Row, int]], parent_ns: int) -> None:
+        known = dict(self.conn.execute("SELECT path, mtime FROM entries WHERE parent=?", (parent,)))
+        gone = known.keys() - listing.keys()
+        if gone:
+            self._forget(gone)
+        changed = [r for r, _ in listing.values() if known.get(r[0]) != r[5]]
+        self.conn.executemany("INSERT OR REPLACE INTO entries VALUES(?, ?, ?, ?, ?, ?)", changed)
+        self.conn.execute("INSERT OR REPLACE INTO scanned VALUES(?, ?)", (parent, parent_ns))
+
+    def _forget(self, paths: Iterable[str]) -> None:
+        paths = list(paths)
+        self.conn.executemany("DELETE FROM entries WHERE path=? OR parent=?", [(p, p) for p in paths])
+        self.conn.executemany("DELETE FROM scanned WHERE path=?", [(p,) for p in paths])
+
+    def _refresh_patient(self, row: Row, mtime_ns: int, scanned_ns: Optional[int] = None) -> bool:
+        path = row[0]
+        if not row[4] or scanned_ns == mtime_ns:
+            return False
+        self._sync_children(path, 2, self._list(path, 2), mtime_ns)
+        return True
+
+    def _refresh_known(self) -> int:
+        """
+        root の中身（名前の増減）が変わっていないときの refresh。root は列挙せず、配下を列挙済みの患者フォルダ
+        （scanned）と root 直下のファイルだけを stat し、mtime が変わったものの行を直してフォルダは列挙し直す
+        """
+        rescanned = 0
+        dirs = self.conn.execute("SELECT path, mtime_ns FROM scanned WHERE path != ?", (self.root,)).fetchall()
+        for path, scanned_ns in dirs:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue  # 消えていれば root の mtime も変わるので、次の refresh で root ごと列挙し直す
+            if st.st_mtime_ns != scanned_ns:
+                row = (path, self.root, os.path.basename(path), 1, 1, st.st_mtime)
+                self.conn.execute("INSERT OR REPLACE INTO entries VALUES(?, ?, ?, ?, ?, ?)", row)
+                rescanned += self._refresh_patient(row, st.st_mtime_ns, scanned_ns)
+        files = self.conn.execute("SELECT path, mtime FROM entries WHERE parent=? AND is_dir=0", (self.root,)).fetchall()
+        for path, mtime in files:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if st.st_mtime != mtime:
+                self.conn.execute("UPDATE entries SET mtime=? WHERE path=?", (st.st_mtime, path))
+        return rescanned
+
+    def refresh(self, patients: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        patients=None: root の mtime が変わっていれば root を列挙し直す。変わっていなければ列挙せず、
+        索引にある root 直下の項目を stat するだけにする。どちらでも mtime が変わった患者フォルダだけ配下を列挙し直す。
+        patients を与えた場合: その患者フォルダだけを（mtime に関係なく）列挙し直す（watch からの差分更新用）。
+        戻り値: {"entries": root 直下の件数, "rescanned": 列挙し直したフォルダ数}
+        """
+        rescanned = 0
+        with self.conn:
+            if patients is None:
+                root_ns = os.stat(self.root).st_mtime_ns
+                cur = self.conn.execute("SELECT mtime_ns FROM scanned WHERE path=?", (self.root,)).fetchone()
+                if cur is not None and cur[0] == root_ns:
+                    rescanned += self._refresh_known()
+                else:
+                    scanned = dict(self.conn.execute("SELECT path, mtime_ns FROM scanned"))
+                    listing = self._list(self.root, 1)
+                    self._sync_children(self.root, 1, listing, root_ns)
+                    for row, ns in listing.values():
+                        rescanned += self._refresh_patient(row, ns, scanned.get(row[0]))
+            else:
+                for p in patients:
+                    p = os.path.abspath(p)
+                    try:
+                        st = os.stat(p)
+                    except FileNotFoundError:
+                        self._forget([p])
+                        continue
+                    row = (p, self.root, os.path.basename(p), 1, int(os.path.isdir(p)), st.st_mtime)
+                    self.conn.execute("INSERT OR REPLACE INTO entries VALUES(?, ?, ?, ?, ?, ?)", row)
+                    rescanned += self._refresh_patient(row, st.st_mtime_ns)
+        n = self.conn.execute("SELECT COUNT(*) FROM entries WHERE depth=1").fetchone()[0]
+        return {"entries": n, "rescanned": rescanned}
+
+    # --- 参照 ---
+    def newest(self, *, dirs_only: bool = False, files_only: bool = False) -> Optional[str]:
+        """io_utils.newest_path_in と同じ意味（root 直下で mtime 最大）を索引から返す"""
+        cond = " AND is_dir=1" if dirs_only else " AND is_dir=0" if files_only else ""
+        row = self.conn.execute(
+            f"SELECT path FROM entries WHERE parent=?{cond} ORDER BY mtime DESC LIMIT 1", (self.root,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def newest_pdf_in(self, dir_path: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT path FROM entries WHERE parent=? AND is_dir=0 AND lower(name) LIKE '%.pdf' ORDER BY mtime DESC LIMIT 1",
+            (dir_path,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def newest_with_pdf(self) -> Tuple[Optional[str], Optional[str]]:
+        """io_utils.newest_path_and_pdf と同じ意味を索引から返す"""
+        newest = self.newest()
+        if newest is None:
+            return None, None
+        is_dir = self.conn.execute("SELECT is_dir FROM entries WHERE path=?", (newest,)).fetchone()[0]
+        if is_dir:
+            return newest, self.newest_pdf_in(newest)
+        return newest, newest if newest.lower().endswith(".pdf") else None
+
+    def visits_on(self, day: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        day（既定: 今日）当日に更新された来院フォルダを新しい順に返す。
+        pdf は同じ患者フォルダ直下の HairReport_{YYYY-MM-DD}.pdf（無ければ None）。
+        パイプラインの出力フォルダ（temp_*）は除く。
+        """
+        day = day or date.today()
+        start = datetime.combine(day, dtime.min).timestamp()
+        end = datetime.combine(day + timedelta(days=1), dtime.min).timestamp()
+        pdf_name = f"HairReport_{day.strftime('%Y-%m-%d')}.pdf"
+        rows = self.conn.execute(
+            """
+            SELECT v.parent, v.path, v.mtime, p.path
+            FROM entries v
+            LEFT JOIN entries p ON p.parent = v.parent AND p.name = ?
+            WHERE v.depth = 2 AND v.is_dir = 1 AND v.mtime >= ? AND v.mtime < ? AND v.name NOT LIKE ? ESCAPE '\\'
+            ORDER BY v.mtime DESC
+            """,
+            (pdf_name, start, end, OUTPUT_DIR_PREFIX.replace("_", "\\_") + "%"),
+        ).fetchall()
+        return [
+            {"patient": patient, "visit": visit, "pdf": pdf, "mtime": datetime.fromtimestamp(m).isoformat(timespec="seconds")}
+            for patient, visit, m, pdf in rows
+        ]
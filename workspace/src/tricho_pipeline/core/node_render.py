@@ -1,10 +1,35 @@
 from __future__ import annotations
-import os, json, subprocess
-from typing import Optional, Sequence
+import os, json, time, queue, atexit, asyncio, tempfile, itertools, threading, subprocess
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 class NodeRenderError(RuntimeError):
     pass
 
+def _node_command(
+    temp_dir: str, render_js: str, out_pdf: Optional[str], html: Optional[str], node_bin: str
+) -> List[str]:
+    if not os.path.isdir(temp_dir):
+        raise NodeRenderError(f"temp_dir not found: {temp_dir}")
+    if not os.path.isfile(render_js):
+        raise NodeRenderError(f"render_js not found: {render_js}")
+
+    cmd: list[str] = [node_bin, render_js, temp_dir]
+    if out_pdf:
+        cmd.append(out_pdf)
+    if html:
+        cmd.extend(["--html", html])
+    return cmd
+
+def _rendered_path(temp_dir: str, out_pdf: Optional[str]) -> str:
+    # render.js は実際の出力パスを STDOUT に出すので、ログから拾いたければここで解析してもよい。
+    # ただし out_pdf を明示していればそれを返す。指定が無ければ親ディレクトリに report-YYYYMMDD-HHMMSS.pdf の想定。
+    if out_pdf:
+        return out_pdf
+    # 親ディレクトリ推定 + 接頭辞推定（最後の行 "✔ Done. Saved: <path>" に合わせて抽出してもよい）
+    # ここでは簡潔に temp_dir の親を返す（実パスはログに出る）
+    return os.path.dirname(os.path.abspath(temp_dir))
+
 def render_pdf_with_node(
     temp_dir: str,
     render_js: str,
@@ -22,27 +47,263 @@ def render_pdf_with_node(
     - html を与えると --html フラグでテンプレートを差し替え
     戻り値: 想定される出力 PDF パス（render.js のログと一致するはず）
     """
-    if not os.path.isdir(temp_dir):
-        raise NodeRenderError(f"temp_dir not found: {temp_dir}")
-    if not os.path.isfile(render_js):
-        raise NodeRenderError(f"render_js not found: {render_js}")
-
-    cmd: list[str] = [node_bin, render_js, temp_dir]
-    if out_pdf:
-        cmd.append(out_pdf)
-    if html:
-        cmd.extend(["--html", html])
-
+    cmd = _node_command(temp_dir, render_js, out_pdf, html, node_bin)
     proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
     if check and proc.returncode != 0:
         raise NodeRenderError(
             f"render.js failed (code {proc.returncode}).\nSTDOUT:\n{proc.stdout}\nSTDERR:\n{proc.stderr}"
         )
+    return _rendered_path(temp_dir, out_pdf)
 
-    # render.js は実際の出力パスを STDOUT に出すので、ログから拾いたければここで解析してもよい。
-    # ただし out_pdf を明示していればそれを返す。指定が無ければ親ディレクトリに report-YYYYMMDD-HHMMSS.pdf の想定。
-    if out_pdf:
-        return out_pdf
-    # 親ディレクトリ推定 + 接頭辞推定（最後の行 "✔ Done. Saved: <path>" に合わせて抽出してもよい）
-    # ここでは簡潔に temp_dir の親を返す（実パスはログに出る）
-    return os.path.dirname(os.path.abspath(temp_dir))
+async def arender_pdf_with_node(
+    temp_dir: str,
+    render_js: str,
+    *,
+    out_pdf: Optional[str] = None,
+    html: Optional[str] = None,
+    node_bin: str = "node",
+    env: Optional[dict] = None,
+    check: bool = True,
+) -> str:
+    """
+    render_pdf_with_node の asyncio 版。node を asyncio.create_subprocess_exec で起動し、
+    待っている間もイベントループを塞がない。キャンセルされたら node（とブラウザ）を kill してから送出する。
+    """
+    cmd = _node_command(temp_dir, render_js, out_pdf, html, node_bin)
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    if check and proc.returncode != 0:
+        raise NodeRenderError(
+            f"render.js failed (code {proc.returncode}).\nSTDOUT:\n{stdout.decode('utf-8', 'replace')}"
+            f"\nSTDERR:\n{stderr.decode('utf-8', 'replace')}"
+        )
+    return _rendered_path(temp_dir, out_pdf)
+
+
+def _parse_message(line: str) -> Optional[Dict[str, Any]]:
+    """render.js の STDOUT 1 行を応答として読む。依存ライブラリの console.log など JSON オブジェクトでない行は None"""
+    try:
+        msg = json.loads(line)
+    except ValueError:
+        return None
+    return msg if isinstance(msg, dict) else None
+
+def render_many(
+    jobs: Sequence[Union[str, Dict[str, Any]]],
+    render_js: str,
+    *,
+    pool: int = 4,
+    html: Optional[str] = None,
+    node_bin: str = "node",
+    env: Optional[dict] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    render.js --batch で多数の temp_dir を 1 プロセス・1 ブラウザ・最大 pool ページで描画する。
+    jobs は temp_dir か {"temp_dir", "out_pdf", "html"} の列。
+    戻り値は jobs と同じ順の結果 {"ok", "temp_dir", "pdf_out" | "error", "ms"}。
+    個々の失敗は結果に記録するだけで例外にしない（node 自体が異常終了した場合のみ NodeRenderError）。
+    on_result を与えると 1 件終わるごとに呼ばれる（進捗表示用）。
+    """
+    if not os.path.isfile(render_js):
+        raise NodeRenderError(f"render_js not found: {render_js}")
+    manifest = []
+    for j in jobs:
+        job = {"temp_dir": j} if isinstance(j, str) else dict(j)
+        job["temp_dir"] = os.path.abspath(job["temp_dir"])
+        if html and not job.get("html"):
+            job["html"] = html
+        manifest.append(job)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(manifest)
+    if not manifest:
+        return []
+
+    fd, manifest_path = tempfile.mkstemp(prefix="render-batch-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        stderr: deque = deque(maxlen=200)
+        proc = subprocess.Popen(
+            [node_bin, render_js, "--batch", manifest_path, "--pool", str(max(1, pool))],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8", env=env,
+        )
+        drain = threading.Thread(target=lambda: stderr.extend(l.rstrip("\n") for l in proc.stderr), daemon=True)
+        drain.start()
+        done = None
+        for line in proc.stdout:
+            msg = _parse_message(line)
+            if msg is None or not (msg.get("event") == "done" or msg.get("index") in range(len(results))):
+                stderr.append(f"[stdout] {line.rstrip()}")  # 応答でない行はエラー時の出力に含めるだけ
+                continue
+            if msg.get("event") == "done":
+                done = msg
+                continue
+            results[msg.pop("index")] = msg
+            if on_result:
+                on_result(msg)
+        proc.wait()
+        drain.join()
+    finally:
+        os.remove(manifest_path)
+
+    if done is None:
+        tail = "\n".join(list(stderr)[-40:])
+        raise NodeRenderError(f"render.js --batch failed (code {proc.returncode}).\nSTDERR:\n{tail}")
+    return [r or {"ok": False, "temp_dir": m["temp_dir"], "error": "no result"} for r, m in zip(results, manifest)]
+
+class RenderServer:
+    """
+    render.js --server を常駐させ、ブラウザとテンプレートページを温めたまま JSON Lines でジョブを送る。
+    プロセスが落ちていれば次の render で起動し直し、送信中に落ちた場合は 1 回だけ再試行する。
+    スレッドセーフ（ジョブは 1 件ずつ直列に処理）。
+    """
+
+    def __init__(
+        self,
+        render_js: str,
+        *,
+        node_bin: str = "node",
+        env: Optional[dict] = None,
+        start_timeout: float = 60.0,
+        job_timeout: float = 120.0,
+    ) -> None:
+        self.render_js = render_js
+        self.node_bin = node_bin
+        self.env = env
+        self.start_timeout = start_timeout
+        self.job_timeout = job_timeout
+        self._proc: Optional[subprocess.Popen] = None
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._stderr: deque = deque(maxlen=200)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    # --- プロセス管理 ---
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    @staticmethod
+    def _pump(stream, sink, eof: bool = False) -> None:
+        for line in stream:
+            sink(line.rstrip("\n"))
+        if eof:
+            sink(None)  # プロセス終了を待ち手に知らせる
+
+    def _next_line(self, timeout: float) -> dict:
+        """次の応答（JSON オブジェクトの行）。それ以外の STDOUT の行は STDERR の記録に回して読み飛ばす"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self._kill()
+                raise NodeRenderError(f"render server timed out after {timeout}s.\nSTDERR:\n{self._stderr_tail()}")
+            if line is None:
+                raise NodeRenderError(f"render server exited (code {self._proc.poll()}).\nSTDERR:\n{self._stderr_tail()}")
+            msg = _parse_message(line)
+            if msg is not None:
+                return msg
+            self._stderr.append(f"[stdout] {line}")
+
+    def _stderr_tail(self) -> str:
+        return "\n".join(list(self._stderr)[-40:])
+
+    def start(self) -> None:
+        if self.alive():
+            return
+        if not os.path.isfile(self.render_js):
+            raise NodeRenderError(f"render_js not found: {self.render_js}")
+        if self._proc is not None:
+            self.restarts += 1
+        self._lines = queue.Queue()
+        self._stderr.clear()
+        self._proc = subprocess.Popen(
+            [self.node_bin, self.render_js, "--server"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", bufsize=1, env=self.env,
+        )
+        threading.Thread(target=self._pump, args=(self._proc.stdout, self._lines.put, True), daemon=True).start()
+        threading.Thread(target=self._pump, args=(self._proc.stderr, self._stderr.append), daemon=True).start()
+        msg = self._next_line(self.start_timeout)
+        if msg.get("event") != "ready":
+            self._kill()
+            raise NodeRenderError(f"unexpected render server greeting: {msg}")
+
+    def _kill(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+
+    def close(self) -> None:
+        """STDIN を閉じてブラウザを正常終了させる（応答が無ければ kill）"""
+        with self._lock:
+            if not self.alive():
+                return
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self._kill()
+
+    def __enter__(self) -> "RenderServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # --- ジョブ ---
+    def _send(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        self.start()
+        self._proc.stdin.write(json.dumps(job, ensure_ascii=False) + "\n")
+        self._proc.stdin.flush()
+        while True:
+            msg = self._next_line(self.job_timeout)
+            if msg.get("id") == job["id"]:
+                return msg
+
+    def render_job(self, temp_dir: str, *, out_pdf: Optional[str] = None, html: Optional[str] = None) -> Dict[str, Any]:
+        """1 件描画し、render.js の応答 {"pdf_out", "cards", "ms"} を返す"""
+        if not os.path.isdir(temp_dir):
+            raise NodeRenderError(f"temp_dir not found: {temp_dir}")
+        job = {"id": next(self._ids), "temp_dir": os.path.abspath(temp_dir), "out_pdf": out_pdf, "html": html}
+        with self._lock:
+            try:
+                res = self._send(job)
+            except (OSError, NodeRenderError):
+                # ブラウザ/プロセスのクラッシュ: 起動し直して 1 回だけ再試行
+                self._kill()
+                res = self._send(job)
+        if not res.get("ok"):
+            raise NodeRenderError(f"render failed: {res.get('error')}\nSTDERR:\n{self._stderr_tail()}")
+        return res
+
+    def render(self, temp_dir: str, *, out_pdf: Optional[str] = None, html: Optional[str] = None) -> str:
+        """render_pdf_with_node と同じ引数で描画し、実際の出力 PDF パスを返す"""
+        return self.render_job(temp_dir, out_pdf=out_pdf, html=html)["pdf_out"]
+
+_servers: Dict[Tuple[str, str], RenderServer] = {}
+_servers_lock = threading.Lock()
+
+def get_render_server(render_js: str, *, node_bin: str = "node", env: Optional[dict] = None) -> RenderServer:
+    """(render_js, node_bin) ごとにプロセス内で共有する RenderServer。終了時に自動で閉じる"""
+    key = (os.path.abspath(render_js), node_bin)
+    with _servers_lock:
+        srv = _servers.get(key)
+        if srv is None:
+            srv = _servers[key] = RenderServer(key[0], node_bin=node_bin, env=env)
+        return srv
+
+@atexit.register
+def _close_servers() -> None:
+    for srv in list(_servers.values()):
+        srv.close()
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import os, sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from tricho_pipeline.analysis.norms import RunningStat, ALL_AGES, age_band, norms_block, norms_spec, region_metrics
+from tricho_pipeline.core.results_store import normalize_dob
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS norms(
+    spec      TEXT NOT NULL,          -- analysis/norms.norms_spec()（区切り方が変われば別の分布）
+    location  TEXT NOT NULL,
+    age_band  TEXT NOT NULL,          -- "40-49" など / "all"
+    metric    TEXT NOT NULL,
+    n         INTEGER NOT NULL,
+    mean      REAL NOT NULL,
+    m2        REAL NOT NULL,          -- Welford の偏差平方和
+    min       REAL,
+    max       REAL,
+    lo        REAL NOT NULL,          -- ヒストグラムの範囲
+    hi        REAL NOT NULL,
+    hist      BLOB NOT NULL,          -- int64 × (ビン数 + 2)
+    PRIMARY KEY(spec, location, age_band, metric)
+);
+CREATE TABLE IF NOT EXISTS norms_folded(
+    spec             TEXT NOT NULL,
+    patient          TEXT NOT NULL,
+    date_of_birth    TEXT NOT NULL,   -- 患者は ResultsStore と同じく (氏名, 生年月日 YYYY-MM-DD / '') で区別
+    appointment_date TEXT NOT NULL,
+    PRIMARY KEY(spec, patient, date_of_birth, appointment_date)
+);
+"""
+
+class NormStore:
+    """
+    院内の正規統計。来院ごとに各部位の指標（analysis/norms.region_metrics）を
+    (部位, 年齢帯) と (部位, "all") の RunningStat に 1 件ずつ畳み込んで SQLite に置く。
+    行数は 部位 × 年齢帯 × 指標 で頭打ちになり、過去の JSON や results を読み直すことはない。
+    同じ (患者, 生年月日, 診察日) は区切り方（spec）ごとに 1 回だけ数える（再実行で分布が偏らないよう norms_folded に記録）。
+    区切り方を変えた後は、その spec の分布が空から始まり、backfill や rebuild() で来院が数え直される。
+    ResultsStore と同じ DB ファイルに置いてよい。
+    """
+
+    def __init__(self, db_path: str, *, spec: Optional[str] = None) -> None:
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.spec = spec or norms_spec()
+        # 読んで足して書き戻すので、backfill の並列プロセス同士では BEGIN IMMEDIATE で直列化する
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        cols = [r[1] for r in self.conn.execute("PRAGMA table_info(norms)")]
+        folded = [r[1] for r in self.conn.execute("PRAGMA table_info(norms_folded)")]
+        if (cols and "spec" not in cols) or (folded and "date_of_birth" not in folded):
+            # spec / 生年月日の列の無い旧形式。results から作り直せる派生データなので捨てる（rebuild() で戻す）
+            self.conn.executescript("DROP TABLE IF EXISTS norms; DROP TABLE IF EXISTS norms_folded;")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "NormStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _load(self, keys: Iterable[tuple]) -> Dict[tuple, RunningStat]:
+        out: Dict[tuple, RunningStat] = {}
+        for loc, band, metric in set(keys):
+            row = self.conn.execute(
+                "SELECT n, mean, m2, min, max, lo, hi, hist FROM norms"
+                " WHERE spec = ? AND location = ? AND age_band = ? AND metric = ?",
+                (self.spec, loc, band, metric),
+            ).fetchone()
+            if row is not None:
+                out[(loc, band, metric)] = RunningStat.from_row(*row)
+        return out
+
+    # --- 更新 ---
+    def fold_visit(
+        self,
+        patient: str,
+        appointment_date: str,
+        date_of_birth: Optional[str],
+        tricho_analysis: Sequence[Dict[str, Any]],
+    ) -> bool:
+        """1 来院分を畳み込む。この spec で既に数えた (患者, 生年月日, 診察日) なら何もせず False"""
+        band = age_band(date_of_birth, appointment_date)
+        bands = (band, ALL_AGES) if band else (ALL_AGES,)
+        values: Dict[str, Dict[str, float]] = {}
+        for it in tricho_analysis:
+            m = region_metrics(it)
+            if m is not None:
+                values.setdefault(it.get("location"), m)  # 同じ部位の 2 つ目以降は数えない（norms_block と同じ）
+        keys = [(loc, b, metric) for loc, m in values.items() for b in bands for metric in m]
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO norms_folded(spec, patient, date_of_birth, appointment_date) VALUES(?, ?, ?, ?)",
+                (self.spec, patient, normalize_dob(date_of_birth), appointment_date),
+            )
+            if cur.rowcount == 0:
+                self.conn.execute("ROLLBACK")
+                return False
+            stats = self._load(keys)
+            for loc, b, metric in keys:
+                st = stats.setdefault((loc, b, metric), RunningStat.for_metric(metric))
+                st.add(values[loc][metric])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO norms VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(self.spec,) + k + st.to_row() for k, st in stats.items()],
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def fold_results(self, visits: Iterable[Dict[str, Any]]) -> int:
+        """ResultsStore.latest_visits() の来院を順に畳み込み（既に数えた来院は飛ばす）、新たに数えた件数を返す"""
+        return sum(
+            self.fold_visit(v["patient"], v["appointment_date"], v.get("date_of_birth"), v["tricho_analysis"])
+            for v in visits
+        )
+
+    def rebuild(self, visits: Iterable[Dict[str, Any]]) -> int:
+        """全 spec の分布と畳み込み記録を消し、visits（ResultsStore.latest_visits()）から今の spec で数え直す"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM norms")
+            self.conn.execute("DELETE FROM norms_folded")
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return self.fold_results(visits)
+
+    # --- 参照 ---
+    def report_block(
+        self,
+        tricho_analysis: Sequence[Dict[str, Any]],
+        date_of_birth: Optional[str],
+        appointment_date: str,
+        *,
+        min_n: int = 20,
+    ) -> Dict[str, Any]:
+        """今回の部位の行（年齢帯 + 全年齢）だけを読み、tricho_data.json の "norms" ブロックを返す"""
+        band = age_band(date_of_birth, appointment_date)
+        locs = {it.get("location") for it in tricho_analysis if "data" in it}
+        bands = (band, ALL_AGES) if band else (ALL_AGES,)
+        rows = self.conn.execute(
+            f"SELECT location, age_band, metric, n, mean, m2, min, max, lo, hi, hist FROM norms"
+            f" WHERE spec = ? AND age_band IN ({','.join('?' * len(bands))})",
+            (self.spec,) + bands,
+        )
+        stats = {(loc, b, m): RunningStat.from_row(*rest) for loc, b, m, *rest in rows if loc in locs}
+        return norms_block(stats, tricho_analysis, band, min_n=min_n)
+
+    def table(self, *, location: Optional[str] = None, band: Optional[str] = None) -> List[Dict[str, Any]]:
+        """今の spec で蓄積した分布の要約（部位・年齢帯・指標ごとの件数 / 平均 / SD / 分位点）"""
+        sql = "SELECT location, age_band, metric, n, mean, m2, min, max, lo, hi, hist FROM norms WHERE spec = ?"
+        params: List[Any] = [self.spec]
+        if location is not None:
+            sql += " AND location = ?"
+            params.append(location)
+        if band is not None:
+            sql += " AND age_band = ?"
+            params.append(band)
+        sql += " ORDER BY location, age_band, metric"
+        return [
+            {"location": loc, "age_band": b, "metric": m, **RunningStat.from_row(*rest).summary()}
+            for loc, b, m, *rest in self.conn.execute(sql, params)
+        ]
@@ -1,15 +1,24 @@
 from __future__ import annotations
-import os, json
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+import os, json, asyncio, threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
 
 from tricho_pipeline.core.config import PipelineConfig
 from tricho_pipeline.core.io_utils import (
-    make_default_out_root, ensure_dir, write_json, try_remove, read_json
+    make_default_out_root, ensure_dir, write_json, try_remove, read_json, remove_in_background
 )
-from tricho_pipeline.extraction.pdf_extractor import PdfExtractor, setup_logger
-from tricho_pipeline.analysis.tricho_analyzer import run_on_dir as tricho_run_on_dir
-from tricho_pipeline.core.node_render import render_pdf_with_node
+from tricho_pipeline.extraction.pdf_extractor import PdfExtractor
+from tricho_pipeline.extraction.cache import ExtractionCache
+from tricho_pipeline.core.results_store import ResultsStore, visit_identity
+from tricho_pipeline.core.norm_store import NormStore
+from tricho_pipeline.core.timing import StageTimer, format_spans
+from tricho_pipeline.core.run_log import RunLog
+from tricho_pipeline.analysis.trend import trend_block
+from tricho_pipeline.analysis.tricho_analyzer import TrichoAnalyzer, run_on_dir as tricho_run_on_dir
+from tricho_pipeline.analysis.schemes import build_schemes
+from tricho_pipeline.core.node_render import render_pdf_with_node, arender_pdf_with_node, get_render_server
 
 @dataclass
 class OrchestratorSummary:
@@ -18,64 +27,177 @@ class OrchestratorSummary:
     final_report_json: str
     image_counts: Dict[str, int]
     notes: List[str]
+    # キャッシュ有効時のみ: {"status": "hit"|"miss", "hits", "misses", "entries", "bytes", "max_bytes"}
+    cache: Dict[str, Any] | None = None
+    # results_db 有効時のみ: ResultsStore に登録した run_id
+    results_run_id: int | None = None
+    # 段階ごとの計測（StageTimer の span ツリー。wall_ms / cpu_ms は各段階を実行したスレッド・ワーカーの値）
+    timings: Dict[str, Any] | None = None
+    # ログ（pdf_extractor.log / pdf_extractor.jsonl）の各レコードに付く run_id
+    run_id: str | None = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        for k in ("cache", "results_run_id", "timings", "run_id"):
+            if d[k] is None:
+                del d[k]
+        return d
 
 class Orchestrator:
     def __init__(self, config: PipelineConfig | None = None) -> None:
         self.config = config or PipelineConfig()
+        self._background: List[threading.Thread] = []
 
-    def run(self, json_dir: str, pdf_path: str, out_root: str | None = None) -> OrchestratorSummary:
+    def wait_background(self, timeout: float | None = None) -> None:
+        """run() が裏で始めた後片付け（raw 画像の削除など）の完了を待つ"""
+        for t in self._background:
+            t.join(timeout)
+        self._background = [t for t in self._background if t.is_alive()]
+
+    def _open_run(self, pdf_path: str, out_root: str | None) -> RunLog:
+        """出力先を決めて作り、その run 専用のログ（計測用 StageTimer 付き）を用意する"""
         out_root = out_root or self.config.out_root or make_default_out_root(pdf_path)
         ensure_dir(out_root)
-        logger = setup_logger(out_root)
-        extractor = PdfExtractor(logger=logger)
-        pdf_info = extractor.extract_pdf_assets(pdf_path, out_root)
+        return RunLog(out_root, timer=StageTimer(), console=self.config.log_console)
+
+    def run(self, json_dir: str, pdf_path: str, out_root: str | None = None) -> OrchestratorSummary:
+        with self._open_run(pdf_path, out_root) as run_log:
+            return self._run(json_dir, pdf_path, run_log)
+
+    def _stages(self, json_dir: str, pdf_path: str, run_log: RunLog) -> tuple:
+        """この run の (PDF 抽出, tricho 解析, キャッシュ)。抽出・解析はどのスレッドから呼んでもよい"""
+        timer, logger, out_root = run_log.timer, run_log.logger, run_log.out_root
+        cache = None
+        if self.config.cache_dir:
+            cache = ExtractionCache(self.config.cache_dir, max_bytes=self.config.cache_max_mb * 1024 * 1024)
+        extractor = PdfExtractor(config=self.config.extractor, logger=logger, cache=cache, timer=timer)
+
+        def analyze() -> List[Dict[str, Any]]:
+            file_times: List[tuple] = []
+            with timer.span(
+                "tricho_analysis", workers=self.config.analysis_workers, executor=self.config.analysis_executor
+            ) as sp:
+                results = tricho_run_on_dir(
+                    json_dir, workers=self.config.analysis_workers, executor=self.config.analysis_executor,
+                    analyzer=TrichoAnalyzer(
+                        schemes=build_schemes(self.config.analysis_schemes),
+                        follicle_units=self.config.follicle_units,
+                        heatmap_cell_mm=self.config.heatmap_cell_mm,
+                    ),
+                    timings=file_times,
+                )
+            for name, wall, cpu in file_times:
+                timer.add("analyze_file", wall, cpu, parent=sp, file=name)
+            return results
+
+        def extract() -> Dict[str, Any]:
+            with timer.span("pdf_extraction"):
+                return extractor.extract_pdf_assets(pdf_path, out_root)
+
+        return extract, analyze, cache
+
+    def _run(self, json_dir: str, pdf_path: str, run_log: RunLog) -> OrchestratorSummary:
+        extract, analyze, cache = self._stages(json_dir, pdf_path, run_log)
+        if self.config.concurrent_stages:
+            # PDF 抽出（pdf_path のみ）と tricho 解析（json_dir のみ）は入力を共有しないので並行に実行し、
+            # tricho_data.json を組み立てる前に合流する
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="tricho-analysis") as pool:
+                tricho_future = pool.submit(analyze)
+                pdf_info = extract()
+                tricho_results = tricho_future.result()
+        else:
+            pdf_info = extract()
+            tricho_results = analyze()
+        return self._finish(json_dir, pdf_path, run_log, pdf_info, tricho_results, cache)
 
-        tricho_results = tricho_run_on_dir(json_dir)
+    def _finish(
+        self,
+        json_dir: str,
+        pdf_path: str,
+        run_log: RunLog,
+        pdf_info: Dict[str, Any],
+        tricho_results: List[Dict[str, Any]],
+        cache: ExtractionCache | None,
+    ) -> OrchestratorSummary:
+        """抽出・解析の結果から tricho_data.json（+ results_db / norms）と summary を書き出す"""
+        timer, out_root = run_log.timer, run_log.out_root
         tricho_out_path = os.path.join(out_root, "tricho_analysis.json")
-        write_json(tricho_out_path, tricho_results)
+        with timer.span("write_json", file="tricho_analysis.json"):
+            write_json(tricho_out_path, tricho_results)
 
         if self.config.remove_raw_images:
             raw_dir = pdf_info.get("raw_img_dir")
             if raw_dir:
-                try_remove(raw_dir)
+                # 削除自体は裏のスレッドで進むので、ここで測るのは開始まで
+                with timer.span("cleanup", target="temp_extracted_images", background=True):
+                    t = remove_in_background(raw_dir)
+                if t is not None:
+                    self._background.append(t)
 
         report_metadata = read_json(pdf_info["json_path"])
 
         final_report = { "report_metadata": report_metadata, "tricho_analysis": tricho_results }
         final_report_path = os.path.join(out_root, "tricho_data.json")
-        write_json(final_report_path, final_report)
 
-        try_remove(pdf_info["json_path"])
-        try_remove(tricho_out_path)
+        results_run_id = None
+        if self.config.results_db:
+            with timer.span("results_store"), ResultsStore(self.config.results_db) as store:
+                # 過去来院を 1 回の索引付き検索で取り、前回比・傾きを tricho_data.json に同梱する
+                patient, dob_key, day = visit_identity(report_metadata, pdf_path)
+                final_report["trend"] = trend_block(store.history(patient, dob_key, before=day), tricho_results, day)
+                results_run_id = store.record_run(final_report, pdf_path=pdf_path, json_dir=json_dir, out_root=out_root)
+            with timer.span("norms"), NormStore(self.config.results_db) as norms:
+                # 院内分布の中の位置を先に出してから今回の来院を畳み込む（同じ来院の再実行は数え直さない）
+                dob = report_metadata.get("date_of_birth")
+                final_report["norms"] = norms.report_block(tricho_results, dob, day, min_n=self.config.norms_min_n)
+                norms.fold_visit(patient, day, dob, tricho_results)
+        with timer.span("write_json", file="tricho_data.json"):
+            write_json(final_report_path, final_report)
+
+        with timer.span("cleanup", target="intermediate_json"):
+            try_remove(pdf_info["json_path"])
+            try_remove(tricho_out_path)
 
-        summary_json = os.path.join(out_root, "summary.json")
-        summary_txt  = os.path.join(out_root, "summary.txt")
         summary = OrchestratorSummary(
             temp_root=out_root,
             filtered_images_dir=pdf_info.get("filtered_dir"),
             final_report_json=final_report_path,
             image_counts={"filtered": pdf_info.get("n_filtered", 0), "renamed": pdf_info.get("n_renamed", 0)},
             notes=[
-                "temp_extracted_images は削除済みです。" if self.config.remove_raw_images else "temp_extracted_images は残しています。",
+                "temp_extracted_images は作成していません。" if pdf_info.get("raw_img_dir") is None
+                else "temp_extracted_images はバックグラウンドで削除しています。" if self.config.remove_raw_images
+                else "temp_extracted_images は残しています。",
                 "report_metadata.json と tricho_analysis.json は削除済みです。"
-            ]
+            ],
+            cache=None if cache is None else {"status": pdf_info.get("cache"), **cache.stats()},
+            results_run_id=results_run_id,
+            timings=timer.finish().to_dict(),
+            run_id=run_log.run_id,
         )
-        write_json(summary_json, {
-            "temp_root": summary.temp_root,
-            "filtered_images_dir": summary.filtered_images_dir,
-            "final_report_json": summary.final_report_json,
-            "image_counts": summary.image_counts,
-            "notes": summary.notes
-        })
+        self._write_summary(summary)
+        return summary
+
+    def _write_summary(self, summary: OrchestratorSummary) -> None:
+        """summary.json / summary.txt を（再）書き出す"""
+        summary_json = os.path.join(summary.temp_root, "summary.json")
+        summary_txt  = os.path.join(summary.temp_root, "summary.txt")
+        write_json(summary_json, summary.to_dict())
         with open(summary_txt, "w", encoding="utf-8") as f:
             f.write("=== Run Summary ===\n")
+            if summary.run_id:
+                f.write(f"Run ID: {summary.run_id}\n")
             f.write(f"Temp root: {summary.temp_root}\n")
             f.write(f"Filtered images: {summary.filtered_images_dir}\n")
             f.write(f"Tricho data: {summary.final_report_json}\n")
             f.write(f"Images (filtered/renamed): {summary.image_counts['filtered']}/{summary.image_counts['renamed']}\n")
-            f.write("temp_extracted_images, report_metadata.json, tricho_analysis.json は削除済みです。\n")
-
-        return summary
+            if summary.cache:
+                f.write(f"Cache: {summary.cache['status']} (hits/misses: {summary.cache['hits']}/{summary.cache['misses']})\n")
+            for note in summary.notes:
+                f.write(note + "\n")
+            if summary.timings:
+                f.write("Timings:\n")
+                for line in format_spans(summary.timings, indent=1):
+                    f.write(line + "\n")
 
     # === New: ③ run の後で Node.js による PDF レンダリングまで実施するユーティリティ ===
     def run_and_render(
@@ -88,18 +210,118 @@ class Orchestrator:
         out_pdf: Optional[str] = None,
         html: Optional[str] = None,
         node_bin: str = "node",
+        warm: bool = True,
     ) -> tuple[OrchestratorSummary, str]:
         """
         1) run() で temp を作る
         2) Node の render.js を使って PDF を生成
+           warm=True なら常駐の render server（ブラウザ起動済み）にジョブを送る。False なら毎回 node を起動
+           （arun_and_render() は並行実行を前提に既定が warm=False。理由はそちらを参照）
         戻り値: (summary, out_pdf_path)
+        summary.timings / summary.json にはレンダリング（node_render）の span も含める
+        """
+        with self._open_run(pdf_path, out_root) as run_log:
+            timer = run_log.timer
+            summary = self._run(json_dir, pdf_path, run_log)
+            # CPU はブラウザ側で使われるので、ここで測れるのは wall のみ（cpu_ms は Python 側の待ち分）
+            with timer.span("node_render", warm=warm):
+                if warm:
+                    server = get_render_server(render_js, node_bin=node_bin)
+                    out_pdf_path = server.render(summary.temp_root, out_pdf=out_pdf, html=html)
+                else:
+                    out_pdf_path = render_pdf_with_node(
+                        temp_dir=summary.temp_root,
+                        render_js=render_js,
+                        out_pdf=out_pdf,
+                        html=html,
+                        node_bin=node_bin,
+                    )
+            run_log.logger.info("PDF 出力: %s", out_pdf_path)
+            summary.timings = timer.finish().to_dict()
+            self._write_summary(summary)
+        return summary, out_pdf_path
+
+    # === asyncio 版: イベントループ上のフロントエンド（複数の診察室）から呼ぶ ===
+    async def _in_executor(self, run_log: RunLog, executor: Executor | None, *fns: Callable[[], Any]) -> List[Any]:
+        """
+        fns を executor（None ならループ既定のスレッドプール）で同時に実行し、結果を順に返す。
+        キャンセル・失敗時は run の timer を止め、実行中の段階が次の span の境目で抜けるのを待ってから送出する
+        （呼び出し元に戻った後も out_root に書き続けるスレッドを残さない）。
         """
-        summary = self.run(json_dir, pdf_path, out_root)
-        out_pdf_path = render_pdf_with_node(
-            temp_dir=summary.temp_root,
-            render_js=render_js,
-            out_pdf=out_pdf,
-            html=html,
-            node_bin=node_bin,
+        loop = asyncio.get_running_loop()
+        futs = [loop.run_in_executor(executor, fn) for fn in fns]
+        try:
+            return list(await asyncio.gather(*(asyncio.shield(f) for f in futs)))
+        except BaseException:
+            run_log.timer.cancel()
+            await asyncio.wait(futs)
+            for f in futs:
+                if not f.cancelled():
+                    f.exception()  # 残りの例外は回収だけする
+            raise
+
+    async def _arun(self, json_dir: str, pdf_path: str, run_log: RunLog, executor: Executor | None) -> OrchestratorSummary:
+        extract, analyze, cache = self._stages(json_dir, pdf_path, run_log)
+        if self.config.concurrent_stages:
+            pdf_info, tricho_results = await self._in_executor(run_log, executor, extract, analyze)
+        else:
+            (pdf_info,) = await self._in_executor(run_log, executor, extract)
+            (tricho_results,) = await self._in_executor(run_log, executor, analyze)
+        (summary,) = await self._in_executor(
+            run_log, executor, partial(self._finish, json_dir, pdf_path, run_log, pdf_info, tricho_results, cache)
         )
+        return summary
+
+    async def arun(
+        self, json_dir: str, pdf_path: str, out_root: str | None = None, *, executor: Executor | None = None
+    ) -> OrchestratorSummary:
+        """
+        run() の asyncio 版。PDF 抽出・tricho 解析・書き出し（results_db / norms を含む）は executor で実行し、
+        イベントループは塞がない。タスクをキャンセルすると各段階は次の span の境目で止まる。
+        executor はスレッド系のみ（各段階は run の timer / logger を閉じ込めた関数で、pickle できない）。
+        PDF 抽出は PyMuPDF がスレッドセーフでないためプロセス内で 1 件ずつ（_PYMUPDF_LOCK）なので、
+        複数の診察室の run を gather しても並行するのは解析・書き出し・描画と、キャッシュヒットした抽出だけ。
+        抽出も並行させたいなら run をプロセスごとに分ける（backfill と同じく ProcessPoolExecutor で run() を呼ぶ）。
+        """
+        with self._open_run(pdf_path, out_root) as run_log:
+            return await self._arun(json_dir, pdf_path, run_log, executor)
+
+    async def arun_and_render(
+        self,
+        json_dir: str,
+        pdf_path: str,
+        out_root: str | None = None,
+        *,
+        render_js: str,
+        out_pdf: Optional[str] = None,
+        html: Optional[str] = None,
+        node_bin: str = "node",
+        warm: bool = False,
+        executor: Executor | None = None,
+    ) -> tuple[OrchestratorSummary, str]:
+        """
+        run_and_render() の asyncio 版。既定（warm=False）では node を asyncio.create_subprocess_exec で起動し、
+        複数の run を並行に描画できる。キャンセル時は node を kill する。
+        warm=True なら常駐の render server に executor から送る（ジョブは直列。キャンセルは送信済みのジョブの完了後）。
+        既定が run_and_render()（warm=True）と逆なのはこのため: 常駐サーバはプロセスで 1 つなので、
+        gather した run の描画が 1 件ずつ待たされ、キャンセルもすぐには効かない。
+        1 件ずつ await するだけなら warm=True の方がブラウザ起動分速い。
+        executor と PDF 抽出の直列化は arun() と同じ。
+        """
+        with self._open_run(pdf_path, out_root) as run_log:
+            timer = run_log.timer
+            summary = await self._arun(json_dir, pdf_path, run_log, executor)
+            with timer.span("node_render", warm=warm):
+                if warm:
+                    server = get_render_server(render_js, node_bin=node_bin)
+                    (out_pdf_path,) = await self._in_executor(
+                        run_log, executor, partial(server.render, summary.temp_root, out_pdf=out_pdf, html=html)
+                    )
+                else:
+                    out_pdf_path = await arender_pdf_with_node(
+                        summary.temp_root, render_js, out_pdf=out_pdf, html=html, node_bin=node_bin
+                    )
+            run_log.logger.info("PDF 出力: %s", out_pdf_path)
+            summary.timings = timer.finish().to_dict()
+            self._write_summary(summary)
         return summary, out_pdf_path
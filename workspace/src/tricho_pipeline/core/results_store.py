@@ -0,0 +1,252 @@
+from __future__ import annotations
+import os, re, json, sqlite3
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs(
+    run_id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient          TEXT NOT NULL,   -- 患者は (patient, date_of_birth) で区別する（同姓同名を混ぜない）
+    name             TEXT,
+    date_of_birth    TEXT NOT NULL DEFAULT '',   -- YYYY-MM-DD / 読めなければ ''
+    appointment_date TEXT NOT NULL,   -- YYYY-MM-DD
+    pdf_path         TEXT,
+    json_dir         TEXT,
+    out_root         TEXT,
+    created_at       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_patient_date ON runs(patient, date_of_birth, appointment_date, run_id);
+CREATE INDEX IF NOT EXISTS runs_date ON runs(appointment_date);
+CREATE TABLE IF NOT EXISTS results(
+    run_id           INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    patient          TEXT NOT NULL,
+    date_of_birth    TEXT NOT NULL DEFAULT '',
+    appointment_date TEXT NOT NULL,
+    location         TEXT,
+    file             TEXT,
+    width_mm         REAL,
+    height_mm        REAL,
+    area_cm2         REAL,
+    follicles        INTEGER,
+    hairs            INTEGER,
+    classification   TEXT,            -- JSON {label: 本数}
+    density_per_cm2  TEXT,            -- JSON {label: 本/cm²}
+    error            TEXT
+);
+CREATE INDEX IF NOT EXISTS results_patient_date_loc ON results(patient, date_of_birth, appointment_date, location);
+CREATE INDEX IF NOT EXISTS results_date ON results(appointment_date);
+CREATE INDEX IF NOT EXISTS results_location ON results(location);
+CREATE INDEX IF NOT EXISTS results_run ON results(run_id);
+"""
+# 上の形式の版。患者キーに date_of_birth を足す前の DB（0）は開くときに移行する
+SCHEMA_VERSION = 1
+
+_YMD = re.compile(r"(\d{4})[/-](\d{2})[/-](\d{2})")
+_APPOINTMENT_IN_RAW = re.compile(r"診察：\s*(\d{4}/\d{2}/\d{2})")
+_PDF_DATE = re.compile(r"HairReport_(\d{4}-\d{2}-\d{2})", re.IGNORECASE)
+
+def _iso(text: Optional[str]) -> Optional[str]:
+    m = _YMD.search(text or "")
+    return f"{m.group(1)}-{m.group(2)}-{m.group(3)}" if m else None
+
+def normalize_dob(text: Optional[str]) -> str:
+    """患者キーに使う生年月日（YYYY-MM-DD）。読めなければ ''"""
+    return _iso(text) or ""
+
+def visit_identity(report_metadata: Dict[str, Any], pdf_path: Optional[str] = None) -> Tuple[str, str, str]:
+    """
+    (patient, date_of_birth[YYYY-MM-DD or ''], appointment_date[YYYY-MM-DD]) を決める。患者は (patient, date_of_birth) で区別する。
+    patient は report_metadata の氏名。読めなければ PDF のあるフォルダ名（HairMetrixDB の患者フォルダ）。
+    診察日は appointment_date → ヘッダ行の「診察：」→ HairReport_<日付>.pdf → 実行日 の順で採用。
+    """
+    patient = (report_metadata.get("name") or "").strip()
+    if not patient and pdf_path:
+        patient = os.path.basename(os.path.dirname(os.path.abspath(pdf_path)))
+    raw = _APPOINTMENT_IN_RAW.search(report_metadata.get("raw") or "")
+    pdf_day = _PDF_DATE.search(os.path.basename(pdf_path or ""))
+    day = (
+        _iso(report_metadata.get("appointment_date"))
+        or (_iso(raw.group(1)) if raw else None)
+        or (pdf_day.group(1) if pdf_day else None)
+        or datetime.now().strftime("%Y-%m-%d")
+    )
+    return patient or "-", normalize_dob(report_metadata.get("date_of_birth")), day
+
+def _result_item(run_id, day, loc, file, w, h, a, fol, hairs, cls, dens, err) -> Dict[str, Any]:
+    """results の 1 行を tricho_analysis の要素と同じ形（+ appointment_date / run_id）にする"""
+    item: Dict[str, Any] = {"run_id": run_id, "appointment_date": day, "location": loc, "file": file}
+    if err:
+        item["error"] = err
+    else:
+        item["data"] = {
+            "roi": {"width_mm": w, "height_mm": h, "area_cm2": a},
+            "counts": {"follicles": fol, "hairs": hairs},
+            "classification": json.loads(cls) if cls else {},
+            "density_per_cm2": json.loads(dens) if dens else {},
+        }
+    return item
+
+class ResultsStore:
+    """
+    実行ごとの解析結果（TrichoAnalyzer.analyze の roi / counts / classification / density_per_cm2）を
+    患者・診察日・部位で索引付けして SQLite に蓄積する。患者は (氏名, 生年月日) で区別する。
+    同日の再実行も run として全て残し、参照時は既定で (患者, 診察日) ごとの最新 run だけを返す。
+    """
+
+    def __init__(self, db_path: str) -> None:
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # backfill のように複数プロセスから書くので WAL + 待ち時間付き
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+
+    def _migrate(self) -> None:
+        """date_of_birth を患者キーに入れる前の DB に列を足し、既存の生年月日を YYYY-MM-DD にそろえる"""
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        cols = [r[1] for r in self.conn.execute("PRAGMA table_info(results)")]
+        with self.conn:
+            if cols and "date_of_birth" not in cols:
+                self.conn.execute("DROP INDEX IF EXISTS runs_patient_date")
+                self.conn.execute("DROP INDEX IF EXISTS results_patient_date_loc")
+                self.conn.execute("ALTER TABLE results ADD COLUMN date_of_birth TEXT NOT NULL DEFAULT ''")
+                runs = self.conn.execute("SELECT run_id, date_of_birth FROM runs").fetchall()
+                for run_id, dob in runs:
+                    self.conn.execute("UPDATE runs SET date_of_birth = ? WHERE run_id = ?", (normalize_dob(dob), run_id))
+                    self.conn.execute("UPDATE results SET date_of_birth = ? WHERE run_id = ?", (normalize_dob(dob), run_id))
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # --- 登録 ---
+    def record_run(
+        self,
+        final_report: Dict[str, Any],
+        *,
+        pdf_path: Optional[str] = None,
+        json_dir: Optional[str] = None,
+        out_root: Optional[str] = None,
+    ) -> int:
+        """tricho_data.json と同じ形の dict を 1 run として登録し、run_id を返す"""
+        meta = final_report.get("report_metadata") or {}
+        patient, dob, day = visit_identity(meta, pdf_path)
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs(patient, name, date_of_birth, appointment_date, pdf_path, json_dir, out_root, created_at)"
+                " VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                (patient, meta.get("name"), dob, day, pdf_path, json_dir, out_root,
+                 datetime.now().isoformat(timespec="seconds")),
+            )
+            run_id = cur.lastrowid
+            rows = []
+            for r in final_report.get("tricho_analysis") or []:
+                data = r.get("data") or {}
+                roi, counts = data.get("roi") or {}, data.get("counts") or {}
+                rows.append((
+                    run_id, patient, dob, day, r.get("location"), r.get("file"),
+                    roi.get("width_mm"), roi.get("height_mm"), roi.get("area_cm2"),
+                    counts.get("follicles"), counts.get("hairs"),
+                    json.dumps(data["classification"], ensure_ascii=False) if "classification" in data else None,
+                    json.dumps(data["density_per_cm2"], ensure_ascii=False) if "density_per_cm2" in data else None,
+                    r.get("error"),
+                ))
+            self.conn.executemany(
+                "INSERT INTO results(run_id, patient, date_of_birth, appointment_date, location, file,"
+                " width_mm, height_mm, area_cm2, follicles, hairs, classification, density_per_cm2, error)"
+                " VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return run_id
+
+    # --- 参照 ---
+    def patients(self, name: str) -> List[str]:
+        """氏名が name の患者の生年月日（YYYY-MM-DD / ''）の一覧。同姓同名なら 2 件以上"""
+        rows = self.conn.execute("SELECT DISTINCT date_of_birth FROM runs WHERE patient = ? ORDER BY 1", (name,))
+        return [r[0] for r in rows]
+
+    def history(
+        self,
+        patient: str,
+        date_of_birth: Optional[str],
+        *,
+        location: Optional[str] = None,
+        before: Optional[str] = None,
+        all_runs: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        患者 (patient, date_of_birth) の部位別結果を診察日順に返す（tricho_analysis の各要素と同じ形 + appointment_date / run_id）。
+        before（YYYY-MM-DD）を与えるとその日より前の来院のみ。all_runs=False なら同じ診察日の再実行は最新 run のみ。
+        """
+        sql = """
+            SELECT r.run_id, r.appointment_date, r.location, r.file, r.width_mm, r.height_mm, r.area_cm2,
+                   r.follicles, r.hairs, r.classification, r.density_per_cm2, r.error
+            FROM results r
+            WHERE r.patient = ? AND r.date_of_birth = ?
+        """
+        params: List[Any] = [patient, normalize_dob(date_of_birth)]
+        if location is not None:
+            sql += " AND r.location = ?"
+            params.append(location)
+        if before is not None:
+            sql += " AND r.appointment_date < ?"
+            params.append(before)
+        if not all_runs:
+            sql += """ AND r.run_id = (SELECT MAX(run_id) FROM runs u
+                                       WHERE u.patient = r.patient AND u.date_of_birth = r.date_of_birth
+                                         AND u.appointment_date = r.appointment_date)"""
+        sql += " ORDER BY r.appointment_date, r.run_id, r.rowid"
+        return [_result_item(*row) for row in self.conn.execute(sql, params)]
+
+    def latest_visits(self) -> Iterator[Dict[str, Any]]:
+        """
+        全患者の (患者, 診察日) ごとの最新 run を診察日順に
+        {patient, appointment_date, date_of_birth, tricho_analysis} として返す（NormStore の作り直し用）
+        """
+        runs = self.conn.execute(
+            """
+            SELECT run_id, patient, appointment_date, date_of_birth FROM runs u
+            WHERE run_id = (SELECT MAX(run_id) FROM runs v
+                            WHERE v.patient = u.patient AND v.date_of_birth = u.date_of_birth
+                              AND v.appointment_date = u.appointment_date)
+            ORDER BY appointment_date, run_id
+            """
+        ).fetchall()
+        for run_id, patient, day, dob in runs:
+            rows = self.conn.execute(
+                """
+                SELECT run_id, appointment_date, location, file, width_mm, height_mm, area_cm2,
+                       follicles, hairs, classification, density_per_cm2, error
+                FROM results WHERE run_id = ? ORDER BY rowid
+                """,
+                (run_id,),
+            )
+            yield {
+                "patient": patient, "appointment_date": day, "date_of_birth": dob,
+                "tricho_analysis": [_result_item(*row) for row in rows],
+            }
+
+    def visits(self, patient: str, date_of_birth: Optional[str]) -> List[Dict[str, Any]]:
+        """患者 (patient, date_of_birth) の診察日ごとの最新 run（run_id, appointment_date, pdf_path, out_root）を日付順に返す"""
+        rows = self.conn.execute(
+            """
+            SELECT run_id, appointment_date, pdf_path, out_root, created_at FROM runs u
+            WHERE patient = ? AND date_of_birth = ?
+              AND run_id = (SELECT MAX(run_id) FROM runs v
+                            WHERE v.patient = u.patient AND v.date_of_birth = u.date_of_birth
+                              AND v.appointment_date = u.appointment_date)
+            ORDER BY appointment_date
+            """,
+            (patient, normalize_dob(date_of_birth)),
+        )
+        keys = ("run_id", "appointment_date", "pdf_path", "out_root", "created_at")
+        return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,128 @@
+from __future__ import annotations
+import os, json, queue, uuid, asyncio, logging
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from tricho_pipeline.core.timing import Span, StageTimer, StageCancelled
+
+LOG_NAME = "pdf_extractor"      # 従来の [pdf_extractor] 表記と pdf_extractor.log を引き継ぐ
+TEXT_LOG = "pdf_extractor.log"
+JSON_LOG = "pdf_extractor.jsonl"
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+def new_run_id() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+class JsonLinesFormatter(logging.Formatter):
+    """1 レコード 1 行の JSON。run_id / stage は常に、duration_ms / cpu_ms / attrs は段階完了レコードのみ"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        d: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "stage": getattr(record, "stage", None),
+            "msg": record.getMessage(),
+        }
+        for k in ("duration_ms", "cpu_ms", "attrs"):
+            v = getattr(record, k, None)
+            if v is not None:
+                d[k] = v
+        return json.dumps(d, ensure_ascii=False)
+
+class _RunContext(logging.Filter):
+    """呼び出し側スレッドで run_id と実行中の段階名（timer の現在の span）をレコードに付ける"""
+
+    def __init__(self, run_id: str, timer: Optional[StageTimer]) -> None:
+        super().__init__()
+        self.run_id = run_id
+        self.timer = timer
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = self.run_id
+        if not hasattr(record, "stage"):
+            record.stage = self.timer.current() if self.timer is not None else None
+        return True
+
+class RunLog:
+    """
+    1 回の run 専用のログ出力。ロガーは run ごとに作る（logging のグローバル登録はしない）ので、
+    常駐プロセスで run を重ねても各 run のログはその out_root にだけ書かれる。
+    呼び出し側は QueueHandler にレコードを積むだけで、書式化とディスク書き込みは QueueListener のスレッドで行う。
+      - <out_root>/pdf_extractor.log   : 従来と同じテキスト形式（level 以上）
+      - <out_root>/pdf_extractor.jsonl : JSON Lines（run_id / stage / duration_ms。段階完了の DEBUG レコードも含む）
+      - stderr                          : console=True のとき（level 以上）
+    timer を渡すと各 span の完了を段階レコードとして記録する。
+    """
+
+    def __init__(
+        self,
+        out_root: str,
+        *,
+        run_id: Optional[str] = None,
+        timer: Optional[StageTimer] = None,
+        console: bool = True,
+        level: int = logging.INFO,
+    ) -> None:
+        self.run_id = run_id or new_run_id()
+        self.out_root = out_root
+        self.timer = timer
+        self._queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self.logger = logging.Logger(LOG_NAME, logging.DEBUG)
+        qh = QueueHandler(self._queue)
+        qh.addFilter(_RunContext(self.run_id, timer))
+        self.logger.addHandler(qh)
+
+        text_fmt = logging.Formatter(TEXT_FORMAT)
+        # delay=True: ファイルを開くのもリスナースレッドの最初の書き込み時
+        text = logging.FileHandler(os.path.join(out_root, TEXT_LOG), encoding="utf-8", delay=True)
+        text.setLevel(level); text.setFormatter(text_fmt)
+        jsonl = logging.FileHandler(os.path.join(out_root, JSON_LOG), encoding="utf-8", delay=True)
+        jsonl.setLevel(logging.DEBUG); jsonl.setFormatter(JsonLinesFormatter())
+        self._handlers = [text, jsonl]
+        if console:
+            ch = logging.StreamHandler(); ch.setLevel(level); ch.setFormatter(text_fmt)
+            self._handlers.append(ch)
+        self._listener = QueueListener(self._queue, *self._handlers, respect_handler_level=True)
+        self._started = False
+
+    def start(self) -> "RunLog":
+        if not self._started:
+            self._listener.start()
+            self._started = True
+            if self.timer is not None:
+                self.timer.on_end = self.stage_done
+        return self
+
+    def stage_done(self, span: Span) -> None:
+        self.logger.debug(
+            "%s 完了 (%.1f ms)", span.name, span.wall_s * 1000,
+            extra={
+                "stage": span.name, "duration_ms": round(span.wall_s * 1000, 2), "cpu_ms": round(span.cpu_s * 1000, 2),
+                "attrs": span.attrs or None,
+            },
+        )
+
+    def close(self) -> None:
+        """run 全体の段階レコードを出し、キューを書き切ってからファイルを閉じる"""
+        if not self._started:
+            return
+        if self.timer is not None:
+            self.timer.on_end = None
+            self.stage_done(self.timer.finish())
+        self._listener.stop()
+        for h in self._handlers:
+            h.close()
+        self._started = False
+
+    def __enter__(self) -> "RunLog":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if isinstance(exc, (asyncio.CancelledError, StageCancelled)):
+            self.logger.warning("run キャンセル: %s", str(exc) or type(exc).__name__)
+        elif exc is not None:
+            self.logger.error("run 失敗: %s", exc, exc_info=(exc_type, exc, tb))
+        self.close()
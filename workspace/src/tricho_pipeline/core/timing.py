@@ -0,0 +1,115 @@
+from __future__ import annotations
+import time, threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+@dataclass
+class Span:
+    """1 区間の計測結果。start_s はルート開始からの経過秒。cpu_s は計測したスレッド（またはワーカー）の CPU 時間"""
+    name: str
+    start_s: float = 0.0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    children: List["Span"] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d: Dict[str, Any] = {
+            "name": self.name,
+            "start_ms": round(self.start_s * 1000, 2),
+            "wall_ms": round(self.wall_s * 1000, 2),
+            "cpu_ms": round(self.cpu_s * 1000, 2),
+        }
+        if self.attrs:
+            d["attrs"] = self.attrs
+        if self.children:
+            d["children"] = [c.to_dict() for c in self.children]
+        return d
+
+class StageCancelled(RuntimeError):
+    """cancel() 後に新しい段階（span）を開こうとした"""
+
+class StageTimer:
+    """
+    入れ子の計測区間（span）を記録する。親子関係はスレッドごとのスタックで決まり、
+    別スレッドで開いた span はそのスレッドのスタックが空ならルート直下に付く。
+    プロセスプールなど別の場所で測った値は add() で後から登録する。
+    on_end を設定すると、span が閉じる（add される）たびにその Span で呼ぶ（RunLog の段階レコード用）。
+    cancel() 後は、どのスレッドでも次に span を開く時点で StageCancelled を送出する（段階の境目での協調的な中止）。
+    """
+
+    def __init__(self, name: str = "run") -> None:
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.thread_time()
+        self.root = Span(name)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.on_end: Optional[Callable[[Span], None]] = None
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def _stack(self) -> List[Span]:
+        st = getattr(self._local, "stack", None)
+        if st is None:
+            st = self._local.stack = [self.root]
+        return st
+
+    def _attach(self, parent: Span, span: Span) -> None:
+        with self._lock:
+            parent.children.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Span]:
+        if self._cancelled.is_set():
+            raise StageCancelled(f"{name}: run はキャンセルされました")
+        stack = self._stack()
+        sp = Span(name, attrs=dict(attrs))
+        self._attach(stack[-1], sp)
+        stack.append(sp)
+        t0, c0 = time.perf_counter(), time.thread_time()
+        sp.start_s = t0 - self._t0
+        try:
+            yield sp
+        finally:
+            sp.wall_s = time.perf_counter() - t0
+            sp.cpu_s = time.thread_time() - c0
+            stack.pop()
+            if self.on_end is not None:
+                self.on_end(sp)
+
+    def add(self, name: str, wall_s: float, cpu_s: float, *, parent: Optional[Span] = None, **attrs: Any) -> Span:
+        """計測済みの区間を parent（省略時は現在の span）の子として登録する"""
+        sp = Span(name, wall_s=wall_s, cpu_s=cpu_s, attrs=dict(attrs))
+        self._attach(parent or self._stack()[-1], sp)
+        if self.on_end is not None:
+            self.on_end(sp)
+        return sp
+
+    def current(self) -> Optional[str]:
+        """このスレッドで開いている最も内側の span 名（無ければ None）"""
+        stack = self._stack()
+        return stack[-1].name if len(stack) > 1 else None
+
+    def finish(self) -> Span:
+        """ルートの wall / cpu（呼び出しスレッド分）を確定して返す"""
+        self.root.wall_s = time.perf_counter() - self._t0
+        self.root.cpu_s = time.thread_time() - self._cpu0
+        return self.root
+
+def format_spans(span: Dict[str, Any], indent: int = 0) -> List[str]:
+    """to_dict() 形式の span ツリーを CLI 表示用の行にする"""
+    label = "  " * indent + span["name"]
+    attrs = span.get("attrs")
+    if attrs:
+        label += " (" + ", ".join(f"{k}={v}" for k, v in attrs.items()) + ")"
+    lines = [f"{label:<60} {span['wall_ms']:>10.1f} ms wall {span['cpu_ms']:>10.1f} ms cpu"]
+    for c in span.get("children", []):
+        lines += format_spans(c, indent + 1)
+    return lines
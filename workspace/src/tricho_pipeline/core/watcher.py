@@ -0,0 +1,273 @@
+from __future__ import annotations
+import os, re, time, queue, logging, threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from tricho_pipeline.analysis.tricho_analyzer import discover_tricho_files
+from tricho_pipeline.core.io_utils import OUTPUT_DIR_PREFIX
+
+REPORT_PDF = re.compile(r"^HairReport_.*\.pdf$", re.IGNORECASE)
+PDF_DATE = re.compile(r"HairReport_(\d{4}-\d{2}-\d{2})", re.IGNORECASE)
+# 計測機が書き出す番号付きファイル（パイプライン出力の tricho_data.json などとは区別する）
+DEVICE_TRICHO = re.compile(r"^tricho_\d+\.json$")
+
+@dataclass(frozen=True)
+class VisitJob:
+    patient_dir: str
+    json_dir: str
+    pdf_path: str
+
+Signature = Tuple[Tuple[str, int, int], ...]
+
+def _newest(entries: List[os.DirEntry]) -> Optional[os.DirEntry]:
+    best, best_ts = None, -1.0
+    for e in entries:
+        try:
+            ts = e.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if ts > best_ts:
+            best, best_ts = e, ts
+    return best
+
+def report_pdf_date(name: str) -> Optional[date]:
+    m = PDF_DATE.search(name)
+    if not m:
+        return None
+    try:
+        return date.fromisoformat(m.group(1))
+    except ValueError:
+        return None
+
+def is_visit_dir(entry: os.DirEntry) -> bool:
+    if not entry.is_dir() or entry.name.startswith(OUTPUT_DIR_PREFIX):
+        return False
+    return any(DEVICE_TRICHO.match(os.path.basename(p)) for p in discover_tricho_files(entry.path))
+
+def find_visit(patient_dir: str) -> Optional[VisitJob]:
+    """
+    患者フォルダ内で tricho_*.json を含む最新のサブフォルダと、その来院日（フォルダの mtime の日付）と
+    同じ日付の HairReport_<日付>.pdf を組にする（同日に複数あれば最新）。
+    来院フォルダか同日の PDF が無ければ None（前回来院の PDF とは組にしない）。
+    """
+    try:
+        with os.scandir(patient_dir) as it:
+            entries = list(it)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    visit = _newest([e for e in entries if is_visit_dir(e)])
+    if visit is None:
+        return None
+    try:
+        day = date.fromtimestamp(visit.stat().st_mtime)
+    except FileNotFoundError:
+        return None
+    pdf = _newest([e for e in entries if e.is_file() and REPORT_PDF.match(e.name) and report_pdf_date(e.name) == day])
+    if pdf is None:
+        return None
+    return VisitJob(patient_dir=patient_dir, json_dir=visit.path, pdf_path=pdf.path)
+
+def visit_signature(job: VisitJob) -> Signature:
+    """PDF と tricho_*.json の (名前, サイズ, mtime) の組。書き込み中は変化し続ける"""
+    paths = [job.pdf_path] + discover_tricho_files(job.json_dir)
+    sig = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+        except FileNotFoundError:
+            continue
+        sig.append((p, st.st_size, st.st_mtime_ns))
+    return tuple(sig)
+
+class PollingSource:
+    """
+    root 直下（患者フォルダ）の mtime を前回と比べ、変化したフォルダだけを返すポーリング方式。
+    新しい来院サブフォルダや PDF が作られると患者フォルダの mtime が変わるので、配下の再走査は不要。
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._mtimes: Dict[str, int] = self._scan()
+
+    def _scan(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        try:
+            with os.scandir(self.root) as it:
+                for e in it:
+                    try:
+                        if e.is_dir():
+                            out[e.path] = e.stat().st_mtime_ns
+                    except FileNotFoundError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return out
+
+    def changed(self) -> Set[str]:
+        cur = self._scan()
+        dirty = {p for p, m in cur.items() if self._mtimes.get(p) != m}
+        self._mtimes = cur
+        return dirty
+
+    def close(self) -> None:
+        pass
+
+class NativeSource:
+    """watchdog（OS のファイル変更通知）で root 配下の変更を受け取り、該当する患者フォルダを返す"""
+
+    def __init__(self, root: str) -> None:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        self.root = os.path.abspath(root)
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        source = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event) -> None:
+                for p in (event.src_path, getattr(event, "dest_path", "")):
+                    patient = source._patient_of(p)
+                    if patient:
+                        with source._lock:
+                            source._dirty.add(patient)
+
+        self._observer = Observer()
+        self._observer.schedule(_Handler(), self.root, recursive=True)
+        self._observer.start()
+
+    def _patient_of(self, path) -> Optional[str]:
+        if not path:
+            return None
+        path = os.fsdecode(path)
+        rel = os.path.relpath(os.path.abspath(path), self.root)
+        if rel.startswith(os.pardir) or rel == os.curdir:
+            return None
+        return os.path.join(self.root, rel.split(os.sep, 1)[0])
+
+    def changed(self) -> Set[str]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return {p for p in dirty if os.path.isdir(p)}
+
+    def close(self) -> None:
+        self._observer.stop()
+        self._observer.join()
+
+def make_source(root: str, native: bool = True, logger: Optional[logging.Logger] = None):
+    logger = logger or logging.getLogger("tricho_watch")
+    if native:
+        try:
+            src = NativeSource(root)
+            logger.info("ファイル変更通知で監視します: %s", root)
+            return src
+        except ImportError:
+            logger.info("watchdog が無いためポーリングで監視します: %s", root)
+        except Exception as e:
+            logger.warning("ファイル変更通知を開始できないためポーリングで監視します: %s", e)
+    return PollingSource(root)
+
+class VisitWatcher:
+    """
+    HairMetrixDB を監視し、新しい来院（tricho_*.json フォルダ + 同じ日付の HairReport_<日付>.pdf）が揃って
+    settle_seconds の間ファイルが変化しなくなったら on_ready(job) を呼ぶ。
+    起動時点で既に揃っている来院は処理済みとして控える（起動後に内容が変わった場合のみ処理）。
+    処理済みは来院フォルダごとに signature で覚え、同じ内容の来院は 1 回だけ処理する。
+    """
+
+    def __init__(
+        self,
+        root: str,
+        on_ready: Callable[[VisitJob], None],
+        *,
+        settle_seconds: float = 5.0,
+        poll_interval: float = 1.0,
+        native: bool = True,
+        logger: Optional[logging.Logger] = None,
+        index=None,
+    ) -> None:
+        self.root = root
+        self.on_ready = on_ready
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.logger = logger or logging.getLogger("tricho_watch")
+        self.source = make_source(root, native=native, logger=self.logger)
+        self.index = index  # MtimeIndex（任意）。変更のあった患者フォルダだけ差分更新する
+        # patient_dir -> (signature, 最後に変化を見た時刻)
+        self._pending: Dict[str, Tuple[Signature, float]] = {}
+        # 来院フォルダ -> 処理済み（または起動時に既にあった）内容の signature
+        self._done: Dict[str, Signature] = self._existing_visits()
+        self._jobs: "queue.Queue[Optional[VisitJob]]" = queue.Queue()
+
+    def _existing_visits(self) -> Dict[str, Signature]:
+        """起動時点で PDF と組になっている各患者の最新来院"""
+        try:
+            with os.scandir(self.root) as it:
+                patients = [e.path for e in it if e.is_dir()]
+        except FileNotFoundError:
+            return {}
+        done = {}
+        for patient in patients:
+            job = find_visit(patient)
+            if job is not None:
+                done[job.json_dir] = visit_signature(job)
+        return done
+
+    def poll_once(self, now: Optional[float] = None) -> List[VisitJob]:
+        """変更のあった患者フォルダを評価し、落ち着いた来院を返す（テスト・単発実行用）"""
+        now = time.monotonic() if now is None else now
+        changed = self.source.changed()
+        if changed and self.index is not None:
+            self.index.refresh(patients=changed)
+        for patient in changed:
+            self._pending.setdefault(patient, ((), now))
+        ready = []
+        for patient, (prev_sig, since) in list(self._pending.items()):
+            job = find_visit(patient)
+            if job is None:
+                # 来院フォルダか PDF がまだ揃っていない。揃うまで保留（消えたフォルダは破棄）
+                if not os.path.isdir(patient):
+                    del self._pending[patient]
+                continue
+            sig = visit_signature(job)
+            if sig != prev_sig:
+                self._pending[patient] = (sig, now)
+                continue
+            if now - since < self.settle_seconds:
+                continue
+            del self._pending[patient]
+            if self._done.get(job.json_dir) == sig:
+                continue
+            self._done[job.json_dir] = sig
+            ready.append(job)
+        return ready
+
+    def _worker(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            self.logger.info("処理開始: %s / %s", job.json_dir, job.pdf_path)
+            try:
+                self.on_ready(job)
+                self.logger.info("処理完了: %s", job.pdf_path)
+            except Exception:
+                self.logger.exception("処理失敗: %s", job.pdf_path)
+
+    def run_forever(self, stop: Optional[threading.Event] = None) -> None:
+        """stop がセットされる（または KeyboardInterrupt）まで監視。処理は別スレッドで順に実行"""
+        stop = stop or threading.Event()
+        worker = threading.Thread(target=self._worker, name="tricho-watch-worker")
+        worker.start()
+        try:
+            while not stop.is_set():
+                for job in self.poll_once():
+                    self._jobs.put(job)
+                stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.source.close()
+            self._jobs.put(None)
+            worker.join()
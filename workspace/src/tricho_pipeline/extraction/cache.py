@@ -0,0 +1,224 @@
+from __future__ import annotations
+import os, json, time, shutil, sqlite3, hashlib, tempfile, dataclasses
+from contextlib import closing
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from tricho_pipeline.core.config import ExtractorConfig
+
+ENTRY_FILE = "entry.json"
+STATS_DB = "stats.db"
+LEGACY_STATS_FILE = "stats.json"  # 旧形式（読み込んで stats.db へ移す）
+IMAGES_DIR = "images"
+
+def config_fingerprint(config: ExtractorConfig) -> str:
+    """出力に影響する ExtractorConfig を順序に依存しない JSON 文字列にする"""
+    d = dataclasses.asdict(config)
+    d["allowed_sizes"] = sorted([list(s) for s in config.allowed_sizes])
+    d["rename_map"] = sorted(config.rename_map.items())
+    return json.dumps(d, sort_keys=True, ensure_ascii=False)
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def _copy(src: str, dst: str) -> None:
+    # ハードリンクだと filtered_images 側の上書きがキャッシュの実体まで変えてしまうのでコピーする
+    if os.path.exists(dst):
+        os.remove(dst)
+    shutil.copy2(src, dst)
+
+class ExtractionCache:
+    """
+    PDF 抽出結果（filtered_images の画像 + report_metadata）の永続キャッシュ。
+    キーは PDF バイト列と ExtractorConfig のハッシュ。entry.json の mtime を最終利用時刻とした LRU で
+    max_bytes を超えた分を古い順に削除する。合計サイズは stats.db の bytes に登録のたびに足しておき、
+    上限を超えたときだけ全エントリを走査する（その時に実測値で数え直す）。ヒット/ミス数は stats.db（SQLite）に累積する
+    （backfill の複数プロセスが同じキャッシュを使っても数え落とさないよう、加算は SQL の 1 文で行う）。
+    """
+
+    def __init__(self, root: str, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def key_for(self, pdf_path: str, config: ExtractorConfig) -> str:
+        h = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        h.update(b"\0")
+        h.update(config_fingerprint(config).encode("utf-8"))
+        return h.hexdigest()
+
+    # --- 参照 ---
+    def restore(self, key: str, filtered_dir: str) -> Optional[Dict[str, Any]]:
+        """
+        ヒットすれば画像を filtered_dir に復元し、保存時の
+        {"report": ..., "n_filtered": ..., "n_renamed": ...} を返す。ミスなら None。
+        """
+        entry_dir = os.path.join(self.root, key)
+        entry_json = os.path.join(entry_dir, ENTRY_FILE)
+        try:
+            with open(entry_json, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            images_dir = os.path.join(entry_dir, IMAGES_DIR)
+            os.makedirs(filtered_dir, exist_ok=True)
+            for name in entry["images"]:
+                _copy(os.path.join(images_dir, name), os.path.join(filtered_dir, name))
+            os.utime(entry_json)  # LRU 用に最終利用時刻を更新
+        except (OSError, ValueError, KeyError):
+            self._bump("misses")
+            return None
+        self._bump("hits")
+        return entry
+
+    # --- 登録 ---
+    def store(self, key: str, image_paths: Iterable[str], report: Dict[str, Any], n_filtered: int, n_renamed: int) -> None:
+        """
+        エントリを一時ディレクトリに組み立ててから置き換える。同じキーを別の run（別スレッド・別プロセス）が
+        先に登録していれば中身は同じなので、それをそのまま使う。
+        """
+        final_dir = os.path.join(self.root, key)
+        if os.path.isfile(os.path.join(final_dir, ENTRY_FILE)):
+            return
+        self._total_bytes()  # 旧形式のキャッシュなら、今回の分を足す前に既存の合計を数えておく
+        tmp_dir = tempfile.mkdtemp(prefix=f".{key}.", suffix=".tmp", dir=self.root)
+        images_dir = os.path.join(tmp_dir, IMAGES_DIR)
+        os.makedirs(images_dir)
+        try:
+            names = []
+            for p in image_paths:
+                name = os.path.basename(p)
+                shutil.copy2(p, os.path.join(images_dir, name))
+                names.append(name)
+            entry = {"images": sorted(names), "report": report, "n_filtered": n_filtered, "n_renamed": n_renamed}
+            with open(os.path.join(tmp_dir, ENTRY_FILE), "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, indent=2)
+            size = _dir_size(tmp_dir)
+            if os.path.isdir(final_dir) and not os.path.isfile(os.path.join(final_dir, ENTRY_FILE)):
+                shutil.rmtree(final_dir, ignore_errors=True)  # 書きかけで残った壊れたエントリ
+            try:
+                os.replace(tmp_dir, final_dir)
+            except OSError:
+                if os.path.isfile(os.path.join(final_dir, ENTRY_FILE)):
+                    return  # 置き換える間に他の run が登録した
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._add("bytes", size)
+        self.evict(keep=key)
+
+    # --- LRU ---
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        out = []
+        with os.scandir(self.root) as it:
+            for e in it:
+                if not e.is_dir() or e.name.startswith("."):
+                    continue
+                try:
+                    used = os.stat(os.path.join(e.path, ENTRY_FILE)).st_mtime
+                except FileNotFoundError:
+                    used = 0.0  # 壊れたエントリは最優先で削除
+                out.append((used, _dir_size(e.path), e.name))
+        return out
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        if self._total_bytes() <= self.max_bytes:
+            return 0
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            total -= size
+            removed += 1
+        self._set("bytes", total)
+        return removed
+
+    # --- 統計 ---
+    def _stats_conn(self) -> sqlite3.Connection:
+        # 呼び出しごとに開く（run ごとに別スレッド・別プロセスから使われるため接続を持ち回さない）
+        conn = sqlite3.connect(os.path.join(self.root, STATS_DB), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters(name TEXT PRIMARY KEY, value INTEGER NOT NULL, updated_at INTEGER)"
+        )
+        legacy = os.path.join(self.root, LEGACY_STATS_FILE)
+        if os.path.isfile(legacy):
+            # 先に自分用の名前へ移せたプロセスだけが取り込む（二重加算しない）
+            claimed = os.path.join(self.root, f".{LEGACY_STATS_FILE}.{os.getpid()}.migrate")
+            try:
+                os.replace(legacy, claimed)
+                with open(claimed, "r", encoding="utf-8") as f:
+                    old = json.load(f)
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO counters(name, value, updated_at) VALUES(?, ?, ?)"
+                        " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                        [(k, int(old.get(k, 0)), old.get("updated_at")) for k in ("hits", "misses")],
+                    )
+            except (OSError, ValueError, TypeError, AttributeError):
+                pass  # 他のプロセスが先に移した / 壊れている
+            finally:
+                if os.path.exists(claimed):
+                    os.remove(claimed)
+        return conn
+
+    def _read_stats(self) -> Dict[str, int]:
+        try:
+            with closing(self._stats_conn()) as conn:
+                return {"hits": 0, "misses": 0, **dict(conn.execute("SELECT name, value FROM counters"))}
+        except sqlite3.Error:
+            return {"hits": 0, "misses": 0}
+
+    def _add(self, counter: str, delta: int) -> None:
+        # 読んで書き戻すと並列の run が互いの加算を消すので、SQL の 1 文で足す
+        with closing(self._stats_conn()) as conn, conn:
+            conn.execute(
+                "INSERT INTO counters(name, value, updated_at) VALUES(?, ?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value, updated_at = excluded.updated_at",
+                (counter, delta, int(time.time())),
+            )
+
+    def _bump(self, counter: str) -> None:
+        try:
+            self._add(counter, 1)
+        except sqlite3.Error:
+            pass  # ヒット/ミス数は目安なので、数えられなくても復元は続ける
+
+    def _set(self, counter: str, value: int) -> None:
+        with closing(self._stats_conn()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO counters(name, value, updated_at) VALUES(?, ?, ?)",
+                (counter, value, int(time.time())),
+            )
+
+    def _total_bytes(self) -> int:
+        """エントリの合計サイズ。まだ数えていない（旧形式の）キャッシュなら 1 回だけ走査して記録する"""
+        total = self._read_stats().get("bytes")
+        if total is None:
+            total = sum(size for _, size, _ in self._entries())
+            self._set("bytes", total)
+        return int(total)
+
+    def stats(self) -> Dict[str, Any]:
+        s = self._read_stats()
+        with os.scandir(self.root) as it:
+            n_entries = sum(1 for e in it if e.is_dir() and not e.name.startswith("."))
+        return {
+            "hits": int(s.get("hits", 0)),
+            "misses": int(s.get("misses", 0)),
+            "entries": n_entries,
+            "bytes": self._total_bytes(),
+            "max_bytes": self.max_bytes,
+        }
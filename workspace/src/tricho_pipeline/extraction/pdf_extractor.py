@@ -1,27 +1,63 @@
 from __future__ import annotations
-import os, re, json, shutil, pathlib, logging
+import os, re, json, shutil, pathlib, logging, threading
 from typing import Dict, Any, Optional, Set, Tuple
 from PIL import Image
+import pymupdf
 import pymupdf4llm
 
 from tricho_pipeline.core.config import ExtractorConfig
+from tricho_pipeline.core.timing import StageTimer
+from tricho_pipeline.extraction.cache import ExtractionCache
+from tricho_pipeline.extraction.report_metadata import HEADER_PREFIX, extract_report_metadata, parse_report_line
 
-def setup_logger(out_root: str, name: str = "pdf_extractor", level: int = logging.INFO) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    if logger.handlers:
-        return logger
-    pathlib.Path(out_root).mkdir(parents=True, exist_ok=True)
-    fmt = logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s")
-    fh = logging.FileHandler(os.path.join(out_root, "pdf_extractor.log"), encoding="utf-8")
-    fh.setLevel(level); fh.setFormatter(fmt); logger.addHandler(fh)
-    ch = logging.StreamHandler(); ch.setLevel(level); ch.setFormatter(fmt); logger.addHandler(ch)
-    return logger
+# ブラウザ（render.js）でそのまま表示できるネイティブ形式。それ以外は PNG に変換する
+NATIVE_IMAGE_EXTS = {"png", "jpeg"}
+IMAGE_FILE_EXTS = (".png", ".jpeg", ".jpg")
+_PYMUPDF_LOCK = threading.Lock()
+
+def _page_image_infos(page: "pymupdf.Page", size_limit: float = 0.05) -> list:
+    """
+    page 上の画像配置を pymupdf4llm と同じ規則（小さすぎる画像・内包画像の除外→(y1, x0) 順）で並べる。
+    戻り値の添字が rename_map キー "<page>-<index>" の index に対応する。
+    ※ pymupdf4llm はベクター図形の領域も同じ連番に混ぜるため、画像より上に図形がある
+      ページでは番号がずれうる（HairReport では図形は画像の下のみ）。
+    """
+    clip = page.rect
+    infos = []
+    for info in page.get_image_info(xrefs=True):
+        r = pymupdf.Rect(info["bbox"])
+        if (r.width >= size_limit * clip.width and r.height >= size_limit * clip.height
+                and r.intersects(clip) and r.width > 3 and r.height > 3):
+            info["bbox"] = r
+            infos.append(info)
+    infos.sort(key=lambda i: abs(i["bbox"]), reverse=True)
+    infos = infos[:30]
+    for i in range(len(infos) - 1, 0, -1):
+        r = infos[i]["bbox"]
+        if r.is_empty or any(r in infos[j]["bbox"] for j in range(i)):
+            del infos[i]
+    infos.sort(key=lambda i: (i["bbox"].y1, i["bbox"].x0))
+    return infos
+
+def _image_mtimes(image_dir: str) -> Dict[str, int]:
+    if not os.path.isdir(image_dir):
+        return {}
+    with os.scandir(image_dir) as it:
+        return {e.name: e.stat().st_mtime_ns for e in it if e.is_file() and e.name.lower().endswith(IMAGE_FILE_EXTS)}
 
 class PdfExtractor:
-    def __init__(self, config: Optional[ExtractorConfig] = None, logger: Optional[logging.Logger] = None) -> None:
+    def __init__(
+        self,
+        config: Optional[ExtractorConfig] = None,
+        logger: Optional[logging.Logger] = None,
+        cache: Optional[ExtractionCache] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> None:
         self.config = config or ExtractorConfig()
         self.logger = logger or logging.getLogger("pdf_extractor")
+        self.cache = cache
+        # 各段階（画像抽出 / サイズ判定 / リネーム / Markdown / メタデータ / JSON 書き出し）の計測先
+        self.timer = timer or StageTimer("pdf_extraction")
 
     def extract_pdf_assets(self, pdf_path: str, out_root: str) -> Dict[str, Any]:
         self.logger.info("=== PDF抽出処理開始 ===")
@@ -29,12 +65,55 @@ class PdfExtractor:
         filtered_dir = os.path.join(out_root, "filtered_images")
         json_path = os.path.join(out_root, "report_metadata.json")
 
-        self._extract_all_images(pdf_path, raw_img_dir)
-        n_filtered = self._filter_images_by_size(raw_img_dir, filtered_dir, self.config.allowed_sizes)
-        n_renamed = self._rename_filtered_images(filtered_dir, self.config.rename_map)
-        md = self._convert_pdf_to_markdown_string(pdf_path)
-        report = self._extract_and_format_report_data(md)
-        self._write_json(json_path, report)
+        cfg = self.config
+        cache_key = None
+        if self.cache is not None:
+            with self.timer.span("cache_restore") as sp:
+                cache_key = self.cache.key_for(pdf_path, cfg)
+                hit = self.cache.restore(cache_key, filtered_dir)
+                sp.attrs["hit"] = hit is not None
+            if hit is not None:
+                self.logger.info("キャッシュヒット: %s", cache_key[:12])
+                with self.timer.span("write_json", file="report_metadata.json"):
+                    self._write_json(json_path, hit["report"])
+                self.logger.info("=== PDF抽出処理完了 ===")
+                return {
+                    "raw_img_dir": None,
+                    "filtered_dir": filtered_dir,
+                    "json_path": json_path,
+                    "n_filtered": hit["n_filtered"],
+                    "n_renamed": hit["n_renamed"],
+                    "cache": "hit",
+                }
+            # 今回書き出した画像だけを登録するため、既存ファイルの状態を控えておく
+            before = _image_mtimes(filtered_dir)
+
+        # PyMuPDF / pymupdf4llm はスレッドセーフでない（表検出などがモジュール共有の状態を使う）ので、
+        # 同じプロセスで複数の run を並行させる場合（Orchestrator.arun など）も PDF の解析は 1 件ずつ
+        with _PYMUPDF_LOCK:
+            if cfg.image_engine == "xref" or cfg.direct_output:
+                # 残す画像だけを filtered_images に直接書き出すので raw ディレクトリは作らない
+                raw_img_dir = None
+                with pymupdf.open(pdf_path) as doc:
+                    # xref / direct_output ではサイズ判定（と direct_output ならリネーム）も画像抽出の中で行う
+                    with self.timer.span("image_extraction", engine=cfg.image_engine, direct_output=cfg.direct_output):
+                        n_filtered, n_renamed = self._extract_images_from_doc(
+                            doc, filtered_dir, cfg.allowed_sizes, cfg.rename_map if cfg.direct_output else None)
+                    if not cfg.direct_output:
+                        with self.timer.span("rename"):
+                            n_renamed = self._rename_filtered_images(filtered_dir, cfg.rename_map)
+                    report = self._read_report_data(doc)
+            else:
+                # single_pass なら Markdown 変換はこの画像抽出（to_markdown 1 回）に含まれる
+                with self.timer.span("image_extraction", engine=cfg.image_engine, single_pass=cfg.single_pass):
+                    md = self._extract_all_images(pdf_path, raw_img_dir)
+                with self.timer.span("size_filter"):
+                    n_filtered = self._filter_images_by_size(raw_img_dir, filtered_dir, cfg.allowed_sizes)
+                with self.timer.span("rename"):
+                    n_renamed = self._rename_filtered_images(filtered_dir, cfg.rename_map)
+                report = self._read_report_data(pdf_path, md if cfg.single_pass else None)
+        with self.timer.span("write_json", file="report_metadata.json"):
+            self._write_json(json_path, report)
 
         info = {
             "raw_img_dir": raw_img_dir,
@@ -43,12 +122,78 @@ class PdfExtractor:
             "n_filtered": n_filtered,
             "n_renamed": n_renamed,
         }
+        if cache_key is not None:
+            with self.timer.span("cache_store"):
+                written = [os.path.join(filtered_dir, n) for n, t in _image_mtimes(filtered_dir).items() if before.get(n) != t]
+                try:
+                    self.cache.store(cache_key, written, report, n_filtered, n_renamed)
+                except Exception as exc:
+                    # キャッシュは高速化のためだけなので、登録できなくても抽出結果はそのまま使う
+                    self.logger.warning("キャッシュ登録に失敗（処理は続行）: %s", exc)
+            info["cache"] = "miss"
         self.logger.info("=== PDF抽出処理完了 ===")
         return info
 
-    def _extract_all_images(self, pdf_path: str, output_dir: str) -> None:
+    def _extract_all_images(self, pdf_path: str, output_dir: str) -> str:
+        """画像を書き出しつつ、同じ解析結果の Markdown を返す（画像リンク行以外はテキスト専用変換と同一）"""
         pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
-        pymupdf4llm.to_markdown(doc=pdf_path, write_images=True, image_path=output_dir, image_format="png", dpi=300)
+        return pymupdf4llm.to_markdown(doc=pdf_path, write_images=True, image_path=output_dir, image_format="png", dpi=self.config.dpi)
+
+    def _extract_images_from_doc(
+        self, doc: "pymupdf.Document", dst: str, allowed: Set[Tuple[int,int]],
+        rename_map: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, int]:
+        """
+        開いた doc の画像を 1 枚ずつメモリ上で判定し、残すものだけを dst に 1 回だけ書き出す。
+        - image_engine="xref"  : デコード前に「配置 bbox を config.dpi で描画した場合のサイズ」または
+                                 「宣言ピクセル寸法」を allowed と照合し、ネイティブ解像度のまま書き出す
+        - image_engine="render": 配置領域を config.dpi でメモリ上に描画し、描画サイズを allowed と照合して PNG 保存
+        rename_map を渡すと "<page>-<index>" キーを最終名（frontal_1_left 等）に解決して書き出す。
+        渡さなければ render エンジンと同じ <pdf名>-<page>-<index>.<ext> で書き出す。
+        戻り値: (n_filtered, n_renamed)
+        """
+        pathlib.Path(dst).mkdir(parents=True, exist_ok=True)
+        stem = os.path.basename(doc.name).replace(" ", "-")
+        zoom = pymupdf.Matrix(self.config.dpi / 72, self.config.dpi / 72)
+        taken: Set[str] = set()
+        n_filtered = n_renamed = 0
+        for page in doc:
+            for idx, info in enumerate(_page_image_infos(page)):
+                if self.config.image_engine == "xref":
+                    placed = (info["bbox"] * zoom).irect
+                    if (placed.width, placed.height) not in allowed and (info["width"], info["height"]) not in allowed:
+                        continue
+                    ext, data = self._native_image_bytes(doc, page, info)
+                else:
+                    pix = page.get_pixmap(clip=info["bbox"], dpi=self.config.dpi)
+                    if (pix.width, pix.height) not in allowed:
+                        continue
+                    ext, data = "png", pix.tobytes("png")
+                key = f"{page.number}-{idx}"
+                base = rename_map.get(key) if rename_map else None
+                if base:
+                    n_renamed += 1
+                else:
+                    base = f"{stem}-{key}"
+                # 同名は従来のリネームと同じく _2, _3 ... を付番（判定はメモリ上のみ）
+                name, i = f"{base}.{ext}", 2
+                while name in taken:
+                    name, i = f"{base}_{i}.{ext}", i + 1
+                taken.add(name)
+                with open(os.path.join(dst, name), "wb") as f:
+                    f.write(data)
+                n_filtered += 1
+        return n_filtered, n_renamed
+
+    def _native_image_bytes(self, doc: "pymupdf.Document", page: "pymupdf.Page", info: Dict[str, Any]) -> Tuple[str, bytes]:
+        xref = info.get("xref", 0)
+        img = doc.extract_image(xref) if xref > 0 else None
+        if img and img["ext"] in NATIVE_IMAGE_EXTS and not img.get("smask"):
+            return img["ext"], img["image"]
+        if xref > 0 and not info.get("has-mask"):
+            return "png", pymupdf.Pixmap(doc, xref).tobytes("png")
+        # インライン画像やマスク付き画像は配置領域を描画
+        return "png", page.get_pixmap(clip=info["bbox"], dpi=self.config.dpi).tobytes("png")
 
     def _filter_images_by_size(self, src: str, dst: str, allowed: Set[Tuple[int,int]]) -> int:
         pathlib.Path(dst).mkdir(parents=True, exist_ok=True)
@@ -68,7 +213,7 @@ class PdfExtractor:
     def _rename_filtered_images(self, image_dir: str, rename_map: Dict[str, str]) -> int:
         ren = 0
         for filename in sorted(os.listdir(image_dir)):
-            if not filename.lower().endswith(".png"): continue
+            if not filename.lower().endswith(IMAGE_FILE_EXTS): continue
             base, ext = os.path.splitext(filename)
             m = re.search(r'-(\d+)-(\d+)$', base)
             if not m: continue
@@ -85,20 +230,25 @@ class PdfExtractor:
             os.rename(old, new); ren += 1
         return ren
 
-    def _convert_pdf_to_markdown_string(self, pdf_path: str) -> str:
+    def _read_report_data(self, pdf: "str | pymupdf.Document", md: Optional[str] = None) -> Dict[str, Any]:
+        """metadata_source="header" ならヘッダスパンのみ、"markdown" なら Markdown（未取得なら変換）から抽出"""
+        if self.config.metadata_source == "header":
+            with self.timer.span("metadata_header"):
+                return extract_report_metadata(pdf)
+        if md is None:
+            with self.timer.span("markdown"):
+                md = self._convert_pdf_to_markdown_string(pdf)
+        with self.timer.span("metadata_regex"):
+            return self._extract_and_format_report_data(md)
+
+    def _convert_pdf_to_markdown_string(self, pdf_path: "str | pymupdf.Document") -> str:
         return pymupdf4llm.to_markdown(doc=pdf_path)
 
     def _extract_and_format_report_data(self, markdown_text: str) -> Dict[str, Any]:
-        import re
-        SEARCH = "HairMetrix のレポート"
-        first = next((ln.strip() for ln in markdown_text.splitlines() if ln.strip().startswith(SEARCH)), None)
+        first = next((ln.strip() for ln in markdown_text.splitlines() if ln.strip().startswith(HEADER_PREFIX)), None)
         if not first:
-            return {"error": f"'{SEARCH}' が見つかりません"}
-        pat = re.compile(r"HairMetrix のレポート\s+([\w\s]+?)、(\d{4}/\d{2}/\d{2}).*診察：\s*(\d{4}/\d{2}/\d{2})")
-        m = pat.search(first)
-        if not m:
-            return {"error": "レポート行の解析に失敗しました。", "raw": first}
-        return {"name": m.group(1).strip(), "date_of_birth": m.group(2), "appointment_date": m.group(3)}
+            return {"error": f"'{HEADER_PREFIX}' が見つかりません"}
+        return parse_report_line(first)
 
     def _write_json(self, path: str, data: Dict[str, Any]) -> None:
         with open(path, "w", encoding="utf-8") as f:
@@ -0,0 +1,52 @@
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Optional, Union
+
+import pymupdf
+
+HEADER_PREFIX = "HairMetrix のレポート"
+HEADER_PATTERN = re.compile(r"HairMetrix のレポート\s+([\w\s]+?)、(\d{4}/\d{2}/\d{2}).*診察：\s*(\d{4}/\d{2}/\d{2})")
+# ヘッダ行を探す範囲（1ページ目の上部。HairReport では y≈81pt）
+HEADER_BAND_RATIO = 0.2
+
+def parse_report_line(line: str) -> Dict[str, Any]:
+    """ヘッダ行 1 行から {name, date_of_birth, appointment_date} を取り出す（Markdown 経路と共通）"""
+    m = HEADER_PATTERN.search(line)
+    if not m:
+        return {"error": "レポート行の解析に失敗しました。", "raw": line}
+    return {"name": m.group(1).strip(), "date_of_birth": m.group(2), "appointment_date": m.group(3)}
+
+def _band_lines(page: "pymupdf.Page", clip: "pymupdf.Rect") -> List[str]:
+    """clip 内のテキストスパンを座標（ベースライン y → x）で並べ、行ごとに連結して返す"""
+    spans = []
+    for block in page.get_text("dict", clip=clip, flags=0)["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                spans.append((round(span["origin"][1]), span["bbox"][0], span["text"]))
+    spans.sort()
+    lines: Dict[int, List[str]] = {}
+    for y, _, text in spans:
+        lines.setdefault(y, []).append(text)
+    # Markdown 変換と同じく連続空白は 1 つにまとめる
+    return [" ".join("".join(parts).split()) for _, parts in sorted(lines.items())]
+
+def find_header_line(doc: "pymupdf.Document") -> Optional[str]:
+    page = doc[0]
+    clip = pymupdf.Rect(page.rect.x0, page.rect.y0, page.rect.x1, page.rect.y0 + page.rect.height * HEADER_BAND_RATIO)
+    return next((ln for ln in _band_lines(page, clip) if ln.startswith(HEADER_PREFIX)), None)
+
+def extract_report_metadata(pdf: Union[str, "pymupdf.Document"]) -> Dict[str, Any]:
+    """
+    1ページ目上部のテキストスパンだけを読んで氏名/生年月日/診察日を返す。
+    全ページの Markdown 変換を行わないので、過去レポートの一括索引付けにも使える。
+    戻り値は PdfExtractor._extract_and_format_report_data と同じ形式。
+    """
+    doc = pymupdf.open(pdf) if isinstance(pdf, str) else pdf
+    try:
+        first = find_header_line(doc) if doc.page_count else None
+    finally:
+        if doc is not pdf:
+            doc.close()
+    if not first:
+        return {"error": f"'{HEADER_PREFIX}' が見つかりません"}
+    return parse_report_line(first)
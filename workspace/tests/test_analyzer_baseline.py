@@ -0,0 +1,32 @@
+import json
+import os
+
+import pytest
+
+from tricho_pipeline.analysis.tricho_analyzer import TrichoAnalyzer, run_on_dir
+from tricho_pipeline.analysis.tricho_loader import load_tricho
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "sample_data", "json")
+# pandas 版 TrichoAnalyzer.analyze() が sample_data/json に対して出していた結果
+BASELINE = os.path.join(os.path.dirname(__file__), "data", "analyze_baseline.json")
+
+def _baseline() -> dict:
+    with open(BASELINE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _dump(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+@pytest.mark.parametrize("name", sorted(_baseline()))
+def test_analyze_matches_pandas_baseline(name):
+    expected = _dump(_baseline()[name])
+    path = os.path.join(SAMPLE_DIR, name)
+    with open(path, "r", encoding="utf-8") as f:
+        assert _dump(TrichoAnalyzer().analyze(json.load(f))) == expected
+    assert _dump(TrichoAnalyzer().analyze(load_tricho(path))) == expected
+
+def test_run_on_dir_matches_pandas_baseline():
+    expected = _baseline()
+    out = run_on_dir(SAMPLE_DIR)
+    assert [r.pop("file") for r in out] == sorted(expected)
+    assert _dump(out) == _dump([expected[k] for k in sorted(expected)])
@@ -0,0 +1,65 @@
+import os, time
+from datetime import datetime
+
+from tricho_pipeline.core import backfill as backfill_mod
+from tricho_pipeline.core.backfill import pair_visits
+
+def _visit(patient_dir: str, name: str, day: str) -> str:
+    d = os.path.join(patient_dir, name)
+    os.makedirs(d)
+    with open(os.path.join(d, "tricho_1.json"), "w") as f:
+        f.write("{}")
+    ts = datetime.fromisoformat(day).timestamp()
+    os.utime(d, (ts, ts))
+    return d
+
+def test_pair_visits_reports_unpaired(tmp_path):
+    patient = tmp_path / "Yamada"
+    patient.mkdir()
+    v1 = _visit(str(patient), "v1", "2025-10-01T10:00")
+    v2 = _visit(str(patient), "v2", "2025-10-05T10:00")
+    (patient / "HairReport_2025-10-01.pdf").write_bytes(b"x")
+    (patient / "HairReport_2025-10-03.pdf").write_bytes(b"x")
+
+    unpaired = []
+    jobs = pair_visits(str(patient), 0, unpaired)
+    assert [(j.json_dir, os.path.basename(j.pdf_path)) for j in jobs] == [(v1, "HairReport_2025-10-01.pdf")]
+    assert unpaired == [{
+        "visit": v2, "visit_date": "2025-10-05",
+        "nearest_pdf": str(patient / "HairReport_2025-10-03.pdf"), "days_apart": 2,
+    }]
+
+    unpaired = []
+    jobs = pair_visits(str(patient), 2, unpaired)
+    assert len(jobs) == 2 and unpaired == []
+
+def _fake_run(config, job, out_root):
+    # 実際の Orchestrator の代わりに、開始・終了を記録するだけ
+    log = os.path.join(os.path.dirname(os.path.dirname(job.patient_dir)), "order.log")
+    name = f"{os.path.basename(job.patient_dir)} {os.path.basename(job.pdf_path)}"
+    with open(log, "a") as f:
+        f.write(f"start {name}\n")
+    time.sleep(0.2)
+    with open(log, "a") as f:
+        f.write(f"end {name}\n")
+    return {"key": name, "ok": True, "pdf": job.pdf_path, "sec": 0.2}
+
+def test_backfill_runs_each_patients_visits_in_date_order(tmp_path, monkeypatch):
+    root = tmp_path / "db"
+    for patient, days in {"A": ["2025-10-05", "2025-10-01", "2025-10-03"], "B": ["2025-10-02"]}.items():
+        d = root / patient
+        d.mkdir(parents=True)
+        for day in days:
+            _visit(str(d), f"v{day}", f"{day}T10:00")
+            (d / f"HairReport_{day}.pdf").write_bytes(b"x")
+    monkeypatch.setattr(backfill_mod, "_run_one", _fake_run)
+
+    result = backfill_mod.backfill(str(root), None, checkpoint_path=str(tmp_path / "ck.jsonl"), workers=3)
+
+    assert result["ok"] == 4
+    events = (tmp_path / "order.log").read_text().split("\n")[:-1]
+    a = [e for e in events if " A " in e]
+    assert a == [f"{kind} A HairReport_{day}.pdf"
+                 for day in ("2025-10-01", "2025-10-03", "2025-10-05") for kind in ("start", "end")]
+    # B は A と並行に走る（A の 1 件目が終わる前に始まる）
+    assert events.index("start B HairReport_2025-10-02.pdf") < events.index("end A HairReport_2025-10-01.pdf")
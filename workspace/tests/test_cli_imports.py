@@ -0,0 +1,52 @@
+import os, sys, json, subprocess
+
+import pytest
+
+import tricho_pipeline
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+HEAVY_MODULES = ("numpy", "pandas", "pymupdf", "pymupdf4llm", "PIL")
+
+def _loaded_after(code: str) -> list:
+    """別プロセスで code を実行し、読み込まれた重いモジュールを返す"""
+    probe = code + f"\nimport sys, json; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    env = dict(os.environ, PYTHONPATH=SRC + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, env=env, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def test_cli_import_does_not_load_heavy_modules():
+    assert _loaded_after("import tricho_pipeline.cli.main; import tricho_pipeline") == []
+
+@pytest.mark.parametrize("argv", [
+    ["newest"],
+    ["newest", "--dirs-only"],
+    ["newest", "--index", "{tmp}/idx.db"],
+    ["newest-with-pdf"],
+    ["newest-with-pdf", "--index", "{tmp}/idx.db"],
+])
+def test_newest_commands_do_not_load_heavy_modules(tmp_path, argv):
+    root = tmp_path / "patients"
+    (root / "p1" / "2025-01-01").mkdir(parents=True)
+    (root / "p1" / "2025-01-01" / "HairReport_2025-01-01.pdf").write_bytes(b"%PDF-1.4\n")
+    args = [argv[0], str(root)] + [a.format(tmp=tmp_path) for a in argv[1:]]
+    code = (
+        "import sys\n"
+        "from tricho_pipeline.cli.main import main\n"
+        f"sys.argv = ['tricho-pipeline'] + {args!r}\n"
+        "assert main() == 0\n"
+    )
+    assert _loaded_after(code) == []
+
+def test_lazy_config_attribute_stays_light():
+    assert _loaded_after("import tricho_pipeline; tricho_pipeline.PipelineConfig; tricho_pipeline.ExtractorConfig") == []
+
+def test_lazy_attribute_resolves_and_is_cached():
+    from tricho_pipeline.core.orchestrator import Orchestrator
+
+    assert tricho_pipeline.Orchestrator is Orchestrator
+    assert vars(tricho_pipeline)["Orchestrator"] is Orchestrator
+    assert "TrichoAnalyzer" in dir(tricho_pipeline)
+
+def test_unknown_attribute_raises():
+    with pytest.raises(AttributeError):
+        tricho_pipeline.NoSuchThing
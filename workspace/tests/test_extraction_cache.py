@@ -0,0 +1,63 @@
+import json, os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tricho_pipeline.extraction.cache import ExtractionCache
+
+def _miss_many(root: str, n: int = 50) -> None:
+    cache = ExtractionCache(root)
+    for _ in range(n):
+        cache.restore("missing", os.path.join(root, ".out"))
+
+def test_counters_survive_concurrent_processes(tmp_path):
+    root = str(tmp_path / "cache")
+    _miss_many(root, 0)
+    with open(os.path.join(root, "stats.json"), "w") as f:
+        json.dump({"hits": 2, "misses": 3}, f)  # 旧形式は取り込まれる
+    with ProcessPoolExecutor(4) as ex:
+        list(ex.map(_miss_many, [root] * 4))
+    stats = ExtractionCache(root).stats()
+    assert (stats["hits"], stats["misses"]) == (2, 3 + 4 * 50)
+    assert not os.path.exists(os.path.join(root, "stats.json"))
+
+def _images(tmp_path, n: int = 2, size: int = 1000) -> list:
+    src = tmp_path / "src"
+    src.mkdir(exist_ok=True)
+    paths = []
+    for i in range(n):
+        p = src / f"img{i}.png"
+        p.write_bytes(bytes([i]) * size)
+        paths.append(str(p))
+    return paths
+
+def test_concurrent_stores_of_one_key(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    paths = _images(tmp_path)
+
+    def store(_):
+        for _ in range(5):
+            cache.store("k", paths, {"name": "x"}, 2, 0)
+
+    with ThreadPoolExecutor(4) as ex:
+        list(ex.map(store, range(4)))
+    assert sorted(os.listdir(cache.root)) == ["k", "stats.db"]
+    assert cache.stats()["entries"] == 1
+
+def test_restore_copies_instead_of_linking(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    cache.store("k", _images(tmp_path), {"name": "x"}, 2, 0)
+    out = tmp_path / "filtered"
+    assert cache.restore("k", str(out))["report"] == {"name": "x"}
+    (out / "img0.png").write_bytes(b"edited")
+    again = tmp_path / "again"
+    cache.restore("k", str(again))
+    assert (again / "img0.png").read_bytes() == bytes([0]) * 1000
+
+def test_evict_keeps_running_total(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_bytes=5000)
+    for k in ("a", "b", "c"):
+        cache.store(k, _images(tmp_path, size=1000), {"k": k}, 2, 0)
+        os.utime(os.path.join(cache.root, k, "entry.json"), (ord(k), ord(k)))
+    stats = cache.stats()
+    assert stats["entries"] == 2 and not os.path.exists(os.path.join(cache.root, "a"))
+    assert stats["bytes"] == sum(os.path.getsize(os.path.join(r, f))
+                                 for k in ("b", "c") for r, _, fs in os.walk(os.path.join(cache.root, k)) for f in fs)
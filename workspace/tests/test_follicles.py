@@ -0,0 +1,75 @@
+import json, math
+
+import numpy as np
+
+from tricho_pipeline.analysis.follicles import UNIT_SIZES, follicle_unit_stats
+from tricho_pipeline.analysis.tricho_analyzer import TrichoAnalyzer
+from tricho_pipeline.analysis.tricho_loader import loads_tricho
+
+PPMM = 100.0
+
+def _tricho(seed: int) -> dict:
+    """毛 0〜6 本の毛包・毛の無い毛包・どの毛包にも属さない毛（follicle_uuid 無し / 未知の uuid）を含む"""
+    rng = np.random.default_rng(seed)
+    units = [{"uuid": f"u{seed}-{i}", "x": float(i), "y": float(i)} for i in range(40)]
+    hairs = []
+    for i, u in enumerate(units):
+        for _ in range(int(rng.integers(0, 7))):
+            hairs.append({"w": float(rng.uniform(1, 10)), "cx": 1.0, "cy": 1.0, "follicle_uuid": u["uuid"]})
+    hairs += [{"w": 5.0, "cx": 1.0, "cy": 1.0}, {"w": 3.0, "cx": 1.0, "cy": 1.0, "follicle_uuid": "nowhere"}]
+    rng.shuffle(hairs)
+    return {"location": f"L{seed}", "ppmm": PPMM, "roi": [[0, 0], [0, 100], [100, 100], [100, 0]],
+            "hairs": hairs, "follicle_units": units}
+
+def _reference(d: dict) -> dict:
+    """dict ループでの素直な集計"""
+    per_unit = {u["uuid"]: [] for u in d["follicle_units"]}
+    orphans = 0
+    for h in d["hairs"]:
+        ts = per_unit.get(h.get("follicle_uuid"))
+        if ts is None:
+            orphans += 1
+        else:
+            ts.append(h["w"] / d["ppmm"] * 1000.0)
+    dist = dict.fromkeys(UNIT_SIZES, 0)
+    means = {k: [] for k in UNIT_SIZES}
+    empty = 0
+    for ts in per_unit.values():
+        if not ts:
+            empty += 1
+            continue
+        key = str(len(ts)) if len(ts) < 4 else "4+"
+        dist[key] += 1
+        means[key].append(sum(ts) / len(ts))
+    occupied = sum(dist.values())
+    all_means = [m for ms in means.values() for m in ms]
+    avg = lambda xs: round(sum(xs) / len(xs), 2) if xs else None
+    return {
+        "units": len(per_unit), "with_hairs": occupied, "empty": empty, "orphan_hairs": orphans,
+        "distribution": dist,
+        "mean_hairs_per_unit": round((len(d["hairs"]) - orphans) / occupied, 2) if occupied else None,
+        "mean_thickness_um": avg(all_means),
+        "mean_thickness_um_by_size": {k: avg(v) for k, v in means.items()},
+    }
+
+def test_follicle_units_match_dict_loop():
+    ds = [_tricho(s) for s in range(3)]
+    an = TrichoAnalyzer(follicle_units=True)
+    for res, d in zip(an.analyze_many(ds), ds):
+        assert res["data"]["follicular_units"] == _reference(d)
+    recs = [loads_tricho(json.dumps(d)) for d in ds]
+    for res, d in zip(an.analyze_many(recs), ds):
+        assert res["data"]["follicular_units"] == _reference(d)
+
+def test_units_without_thickness_and_empty_rois():
+    # 毛包 0: 太さ NaN の毛だけ / 毛包 1: 5 本（4+）/ 2 つ目の ROI は毛も毛包も無い
+    t = np.array([math.nan, 10, 20, 30, 40, 50, 60])
+    rows = np.array([0, 1, 1, 1, 1, 1, -1])
+    a, b = follicle_unit_stats(t, rows, [0, 7, 7], [2, 0])
+    assert a["distribution"] == {"1": 1, "2": 0, "3": 0, "4+": 1}
+    assert (a["empty"], a["orphan_hairs"], a["mean_hairs_per_unit"]) == (0, 1, 3.0)
+    assert a["mean_thickness_um_by_size"] == {"1": None, "2": None, "3": None, "4+": 30.0}
+    assert a["mean_thickness_um"] == 30.0
+    assert b == {"units": 0, "with_hairs": 0, "empty": 0, "orphan_hairs": 0,
+                 "distribution": dict.fromkeys(UNIT_SIZES, 0), "mean_hairs_per_unit": None,
+                 "mean_thickness_um": None, "mean_thickness_um_by_size": dict.fromkeys(UNIT_SIZES)}
@@ -0,0 +1,47 @@
+import numpy as np
+
+from tricho_pipeline.analysis.heatmap import density_heatmaps, grid_shape
+
+def _reference(cx, cy, cls, roi, ppmm, n_cls, cell_mm):
+    lo, hi = roi.min(axis=0), roi.max(axis=0)
+    ny, nx = grid_shape(*((hi - lo) / ppmm), cell_mm)
+    xe, ye = np.linspace(lo[0], hi[0], nx + 1), np.linspace(lo[1], hi[1], ny + 1)
+    counts = []
+    for c in range(n_cls):
+        m = cls == c
+        # histogram2d は最後のビンだけ右端を含む（右端・下端ちょうどの毛は最後のセル）
+        h, _, _ = np.histogram2d(cy[m], cx[m], bins=[ye, xe])
+        counts.append(h.astype(int).reshape(-1).tolist())
+    classified = cls >= 0
+    inside = classified & (cx >= lo[0]) & (cx <= hi[0]) & (cy >= lo[1]) & (cy <= hi[1])
+    return [ny, nx], counts, int((classified & ~inside).sum())
+
+def test_heatmap_matches_histogram2d():
+    rng = np.random.default_rng(0)
+    rois = [np.array([[0, 0], [0, 1000], [1000, 1000], [1000, 0]], float),
+            np.array([[200, 100], [200, 1600], [700, 1600], [700, 100]], float)]
+    ppmms = [100.0, 100.0]
+    cxs, cys, clss = [], [], []
+    for roi in rois:
+        lo, hi = roi.min(axis=0), roi.max(axis=0)
+        n = 500
+        cx = rng.uniform(lo[0] - 50, hi[0] + 50, n)   # 一部は ROI の外
+        cy = rng.uniform(lo[1] - 50, hi[1] + 50, n)
+        cx[:4], cy[:4] = [hi[0], lo[0], hi[0], lo[0]], [hi[1], lo[1], lo[1], hi[1]]  # 四隅ちょうど
+        cx[4:8], cy[4:8] = hi[0], rng.uniform(lo[1], hi[1], 4)                      # 右端ちょうど
+        cx[8:12], cy[8:12] = rng.uniform(lo[0], hi[0], 4), hi[1]                    # 下端ちょうど
+        cx[12] = np.nan                                                             # 位置が読めない毛
+        cls = rng.integers(-1, 4, n)                                                # -1 は分類対象外
+        cxs.append(cx); cys.append(cy); clss.append(cls)
+    offsets = [0, 500, 1000]
+    labels = ["a", "b", "c", "d"]
+
+    maps = density_heatmaps(np.concatenate(cxs), np.concatenate(cys), np.concatenate(clss),
+                            offsets, rois, ppmms, labels, cell_mm=1.0)
+
+    for hm, cx, cy, cls, roi, ppmm in zip(maps, cxs, cys, clss, rois, ppmms):
+        shape, counts, outside = _reference(cx, cy, cls, roi, ppmm, len(labels), 1.0)
+        assert hm["shape"] == shape
+        assert hm["counts"] == counts
+        assert hm["outside"] == outside
+    assert maps[1]["shape"] == [15, 5]
@@ -0,0 +1,55 @@
+import os
+from datetime import date, datetime
+
+from tricho_pipeline.core.mtime_index import MtimeIndex
+
+def _visit(patient_dir: str, name: str, day: str) -> str:
+    d = os.path.join(patient_dir, name)
+    os.makedirs(d)
+    ts = datetime.fromisoformat(day).timestamp()
+    os.utime(d, (ts, ts))
+    return d
+
+def test_visits_on_returns_only_that_day(tmp_path):
+    patient = tmp_path / "Yamada"
+    patient.mkdir()
+    _visit(str(patient), "v1", "2025-10-01T10:00")
+    _visit(str(patient), "v2", "2025-10-02T09:00")
+    (patient / "HairReport_2025-10-01.pdf").write_bytes(b"x")
+
+    with MtimeIndex(":memory:", str(tmp_path)) as idx:
+        idx.refresh()
+        visits = idx.visits_on(date(2025, 10, 1))
+        later = idx.visits_on(date(2025, 10, 2))
+
+    assert [os.path.basename(v["visit"]) for v in visits] == ["v1"]
+    assert visits[0]["pdf"] == str(patient / "HairReport_2025-10-01.pdf")
+    assert [os.path.basename(v["visit"]) for v in later] == ["v2"]
+    assert later[0]["pdf"] is None
+
+def test_refresh_skips_unchanged_root_but_sees_new_visits(tmp_path):
+    a, b = tmp_path / "A", tmp_path / "B"
+    a.mkdir(); b.mkdir()
+    _visit(str(a), "v1", "2025-10-01T10:00")
+    _visit(str(b), "v1", "2025-10-01T11:00")
+    for d in (a, b):
+        ts = datetime.fromisoformat("2025-10-01T12:00").timestamp()
+        os.utime(d, (ts, ts))
+    with MtimeIndex(":memory:", str(tmp_path)) as idx:
+        assert idx.refresh()["rescanned"] == 2
+        assert idx.refresh()["rescanned"] == 0  # 何も変わっていなければ列挙し直さない
+
+        # 来院の追加は患者フォルダの mtime だけを変える（root は変わらない）
+        root_ns = os.stat(tmp_path).st_mtime_ns
+        _visit(str(a), "v2", "2025-10-02T09:00")
+        ts = datetime.fromisoformat("2025-10-02T09:00").timestamp()
+        os.utime(a, (ts, ts))
+        assert os.stat(tmp_path).st_mtime_ns == root_ns
+        assert idx.refresh()["rescanned"] == 1
+        assert idx.newest() == str(a)
+        assert [os.path.basename(v["visit"]) for v in idx.visits_on(date(2025, 10, 2))] == ["v2"]
+
+        # 患者フォルダの追加は root の mtime を変えるので root ごと列挙し直す
+        c = tmp_path / "C"
+        c.mkdir()
+        assert idx.refresh()["entries"] == 3
@@ -0,0 +1,46 @@
+import shutil
+
+import pytest
+
+from tricho_pipeline.core.node_render import RenderServer, render_many
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node not installed")
+
+# render.js の代わり。応答の前後に JSON でない行（依存ライブラリの console.log 相当）を混ぜる
+FAKE_RENDER_JS = r"""
+const readline = require("node:readline");
+const fs = require("node:fs");
+const args = process.argv.slice(2);
+const send = (o) => process.stdout.write(JSON.stringify(o) + "\n");
+if (args[0] === "--batch") {
+  const jobs = JSON.parse(fs.readFileSync(args[1], "utf8"));
+  console.log("Downloading Chromium r123...");
+  jobs.forEach((j, index) => { console.log("noise", 42); send({ index, ok: true, temp_dir: j.temp_dir }); });
+  console.log("[1, 2]");
+  send({ event: "done", ok: jobs.length, failed: 0 });
+} else {
+  console.log("booting");
+  send({ event: "ready" });
+  readline.createInterface({ input: process.stdin }).on("line", (line) => {
+    const req = JSON.parse(line);
+    console.log("rendering", req.temp_dir);
+    send({ id: req.id, ok: true, pdf_out: req.temp_dir + "/out.pdf", cards: 1, ms: {} });
+  });
+}
+"""
+
+@pytest.fixture
+def fake_js(tmp_path):
+    p = tmp_path / "render.cjs"
+    p.write_text(FAKE_RENDER_JS)
+    return str(p)
+
+def test_render_many_skips_non_json_stdout(tmp_path, fake_js):
+    dirs = [str(tmp_path / "a"), str(tmp_path / "b")]
+    results = render_many(dirs, fake_js, pool=1)
+    assert [(r["ok"], r["temp_dir"]) for r in results] == [(True, dirs[0]), (True, dirs[1])]
+
+def test_render_server_skips_non_json_stdout(tmp_path, fake_js):
+    with RenderServer(fake_js, start_timeout=20, job_timeout=20) as srv:
+        res = srv.render_job(str(tmp_path))
+    assert res["pdf_out"] == str(tmp_path / "out.pdf")
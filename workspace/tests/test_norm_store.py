@@ -0,0 +1,54 @@
+from tricho_pipeline.analysis import norms
+from tricho_pipeline.core.norm_store import NormStore
+
+def _visit(thin: int, thick: int) -> list:
+    return [{
+        "location": "Frontal 1 left",
+        "data": {
+            "counts": {"follicles": 10, "hairs": thin + thick},
+            "classification": {"<30 μm": 0, "30-60 μm": thin, "60-90 μm": thick, ">90 μm": 0},
+            "density_per_cm2": {"<30 μm": 0.0, "30-60 μm": thin * 10.0, "60-90 μm": thick * 10.0, ">90 μm": 0.0},
+        },
+    }]
+
+def _n(store: NormStore, metric: str = "thin60", band: str = "all") -> int:
+    rows = [r for r in store.table(band=band) if r["metric"] == metric]
+    return rows[0]["n"] if rows else 0
+
+def test_fold_counts_each_visit_once(tmp_path):
+    db = str(tmp_path / "r.db")
+    with NormStore(db) as s:
+        assert s.fold_visit("p1", "2025-01-01", "1980/01/01", _visit(3, 7))
+        assert not s.fold_visit("p1", "2025-01-01", "1980/01/01", _visit(3, 7))
+        assert _n(s) == 1 and _n(s, band="40-49") == 1
+
+def test_changed_binning_refolds_visits(tmp_path, monkeypatch):
+    db = str(tmp_path / "r.db")
+    with NormStore(db) as s:
+        s.fold_visit("p1", "2025-01-01", None, _visit(3, 7))
+    monkeypatch.setattr(norms, "N_BINS", 50)
+    with NormStore(db) as s:
+        assert _n(s) == 0  # 区切り方が変わったので古い分布は使わない
+        assert s.fold_visit("p1", "2025-01-01", None, _visit(3, 7))
+        assert _n(s) == 1
+
+def test_rebuild_drops_and_refolds(tmp_path):
+    db = str(tmp_path / "r.db")
+    visits = [{"patient": f"p{i}", "appointment_date": "2025-01-01", "date_of_birth": None,
+               "tricho_analysis": _visit(i, 10 - i)} for i in range(5)]
+    with NormStore(db) as s:
+        s.fold_results(visits[:3])
+        s.fold_visit("gone", "2025-01-01", None, _visit(1, 1))
+        assert s.rebuild(visits) == 5
+        assert _n(s) == 5
+
+def test_min_n_falls_back_to_all_ages(tmp_path):
+    with NormStore(str(tmp_path / "r.db")) as s:
+        for i in range(4):
+            s.fold_visit(f"p{i}", "2025-01-01", "1990/01/01" if i else "1980/01/01", _visit(i + 1, 9 - i))
+        block = s.report_block(_visit(2, 8), "1980/01/01", "2025-02-01", min_n=3)
+        entry = block["regions"]["Frontal 1 left"]["thin60"]
+        assert block["age_band"] == "40-49"
+        assert entry["band"] == "all" and entry["n"] == 4 and entry["percentile"] is not None
+        none = s.report_block(_visit(2, 8), "1980/01/01", "2025-02-01", min_n=10)
+        assert none["regions"]["Frontal 1 left"]["thin60"]["percentile"] is None
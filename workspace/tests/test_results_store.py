@@ -0,0 +1,75 @@
+import sqlite3
+
+from tricho_pipeline.core.norm_store import NormStore
+from tricho_pipeline.core.results_store import ResultsStore
+
+def _report(name: str, dob: str, day: str, hairs: int) -> dict:
+    return {
+        "report_metadata": {"name": name, "date_of_birth": dob, "appointment_date": day},
+        "tricho_analysis": [{
+            "location": "Frontal 1 left",
+            "data": {
+                "counts": {"follicles": 10, "hairs": hairs},
+                "classification": {"<30 μm": 0, "30-60 μm": hairs, "60-90 μm": 0, ">90 μm": 0},
+                "density_per_cm2": {"<30 μm": 0.0, "30-60 μm": hairs * 10.0, "60-90 μm": 0.0, ">90 μm": 0.0},
+            },
+        }],
+    }
+
+def test_same_name_different_birthdays_are_separate_patients(tmp_path):
+    with ResultsStore(str(tmp_path / "r.db")) as s:
+        s.record_run(_report("山田太郎", "1980/01/01", "2025/01/10", 5))
+        s.record_run(_report("山田太郎", "1990/02/02", "2025/02/10", 9))
+        assert s.patients("山田太郎") == ["1980-01-01", "1990-02-02"]
+        a = s.history("山田太郎", "1980/01/01")
+        b = s.history("山田太郎", "1990-02-02")
+        assert [r["data"]["counts"]["hairs"] for r in a] == [5]
+        assert [r["data"]["counts"]["hairs"] for r in b] == [9]
+        assert [v["appointment_date"] for v in s.visits("山田太郎", "1990/02/02")] == ["2025-02-10"]
+        visits = list(s.latest_visits())
+    with NormStore(":memory:") as n:
+        assert n.fold_results(visits) == 2
+        # 同じ氏名・同じ診察日でも生年月日が違えば別の来院として数える
+        assert n.fold_visit("山田太郎", "2025-01-10", "1990/02/02", visits[0]["tricho_analysis"])
+        assert not n.fold_visit("山田太郎", "2025-01-10", "1980-01-01", visits[0]["tricho_analysis"])
+
+def test_migrates_store_without_birthday_key(tmp_path):
+    db = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db)
+    conn.executescript("""
+        CREATE TABLE runs(run_id INTEGER PRIMARY KEY AUTOINCREMENT, patient TEXT NOT NULL, name TEXT,
+            date_of_birth TEXT, appointment_date TEXT NOT NULL, pdf_path TEXT, json_dir TEXT, out_root TEXT,
+            created_at TEXT NOT NULL);
+        CREATE INDEX runs_patient_date ON runs(patient, appointment_date, run_id);
+        CREATE TABLE results(run_id INTEGER NOT NULL, patient TEXT NOT NULL, appointment_date TEXT NOT NULL,
+            location TEXT, file TEXT, width_mm REAL, height_mm REAL, area_cm2 REAL, follicles INTEGER,
+            hairs INTEGER, classification TEXT, density_per_cm2 TEXT, error TEXT);
+        CREATE INDEX results_patient_date_loc ON results(patient, appointment_date, location);
+        INSERT INTO runs VALUES(1, '山田太郎', '山田太郎', '1980/01/01', '2025-01-10', NULL, NULL, NULL, 'x');
+        INSERT INTO results VALUES(1, '山田太郎', '2025-01-10', 'Frontal 1 left', NULL, NULL, NULL, NULL,
+            10, 5, '{}', '{}', NULL);
+    """)
+    conn.close()
+    with ResultsStore(db) as s:
+        assert [r["data"]["counts"]["hairs"] for r in s.history("山田太郎", "1980-01-01")] == [5]
+        s.record_run(_report("山田太郎", "1980/01/01", "2025/03/01", 7))
+        assert len(s.history("山田太郎", "1980/01/01")) == 2
+
+def test_same_day_rerun_replaces_earlier_run(tmp_path):
+    with ResultsStore(str(tmp_path / "r.db")) as s:
+        first = s.record_run(_report("佐藤", "1970/05/05", "2025/01/10", 5))
+        second = s.record_run(_report("佐藤", "1970/05/05", "2025/01/10", 8))
+        hist = s.history("佐藤", "1970/05/05")
+        assert [(r["run_id"], r["data"]["counts"]["hairs"]) for r in hist] == [(second, 8)]
+        assert [r["run_id"] for r in s.history("佐藤", "1970/05/05", all_runs=True)] == [first, second]
+        assert [v["run_id"] for v in s.visits("佐藤", "1970/05/05")] == [second]
+        assert [v["tricho_analysis"][0]["run_id"] for v in s.latest_visits()] == [second]
+
+def test_history_before_excludes_current_visit(tmp_path):
+    with ResultsStore(str(tmp_path / "r.db")) as s:
+        s.record_run(_report("佐藤", "1970/05/05", "2025/01/10", 5))
+        s.record_run(_report("佐藤", "1970/05/05", "2025/03/10", 6))
+        s.record_run(_report("佐藤", "1970/05/05", "2025/06/10", 7))
+        assert [r["appointment_date"] for r in s.history("佐藤", "1970/05/05", before="2025-06-10")] == \
+            ["2025-01-10", "2025-03-10"]
+        assert s.history("佐藤", "1970/05/05", before="2025-01-10") == []
@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+import pytest
+
+from tricho_pipeline.analysis.schemes import DEFAULT_SCHEME, parse_scheme
+from tricho_pipeline.analysis.tricho_analyzer import TrichoAnalyzer
+
+pd = pytest.importorskip("pandas")
+
+def _reference(t, score, valid, scheme):
+    """pd.cut(right=False) で 1 ROI 分を数える"""
+    keep = np.ones(len(t), bool)
+    if scheme.filter.valid_only:
+        keep &= valid
+    if scheme.filter.min_score is not None:
+        keep &= np.nan_to_num(score, nan=-math.inf) >= scheme.filter.min_score
+    kept = t[keep]
+    cut = pd.cut(pd.Series(kept), bins=list(scheme.bins), right=False, labels=list(scheme.labels))
+    counts = cut.value_counts(sort=False).reindex(list(scheme.labels)).to_numpy()
+    return counts, int((~keep).sum()), int(len(kept) - counts.sum())
+
+def test_count_schemes_matches_pd_cut():
+    rng = np.random.default_rng(0)
+    sizes = [400, 0, 250]
+    n = sum(sizes)
+    t = rng.gamma(4.0, 12.0, n)
+    t[::37] = np.nan                       # 太さが読めない毛
+    t[5:15] = [0, 30, 60, 90, 10, 150, 160, -1, 29.999999, 90.0]  # 境界ちょうど・範囲外
+    score = rng.uniform(0.3, 1.0, n)
+    score[::11] = np.nan                   # score 欠測は score>= で除外
+    valid = rng.random(n) > 0.1
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    schemes = [DEFAULT_SCHEME, parse_scheme("fine_10um:valid,score>=0.8"), parse_scheme("vellus_terminal:score>=0.5")]
+
+    got = TrichoAnalyzer(schemes=schemes).count_schemes(t, offsets, score, valid)
+
+    for sc, (counts, filtered, out_of_range) in zip(schemes, got):
+        for r, (a, b) in enumerate(zip(offsets[:-1], offsets[1:])):
+            ref_counts, ref_filtered, ref_oor = _reference(t[a:b], score[a:b], valid[a:b], sc)
+            assert counts[r].tolist() == ref_counts.tolist(), (sc.name, r)
+            assert (filtered[r], out_of_range[r]) == (ref_filtered, ref_oor), (sc.name, r)
+
+def test_first_scheme_matches_classification():
+    rng = np.random.default_rng(1)
+    hairs = [{"w": float(w), "score": float(s), "valid": bool(v)}
+             for w, s, v in zip(rng.gamma(4.0, 2.5, 300), rng.uniform(0, 1, 300), rng.random(300) > 0.2)]
+    d = {"location": "x", "ppmm": 188.0, "roi": [[0, 0], [0, 3024], [1005, 3024], [1005, 0]],
+         "hairs": hairs, "follicle_units": []}
+    res = TrichoAnalyzer(schemes=[DEFAULT_SCHEME, parse_scheme("thickness:valid")]).analyze(d)["data"]
+    plain = TrichoAnalyzer().analyze(d)["data"]
+    assert res["classification"] == plain["classification"] == res["schemes"]["thickness"]["classification"]
+    filt = res["schemes"]["thickness:valid"]
+    assert filt["excluded"]["filtered"] == sum(not h["valid"] for h in hairs)
+    assert sum(filt["classification"].values()) + sum(filt["excluded"].values()) == len(hairs)
@@ -0,0 +1,54 @@
+from datetime import date
+
+import numpy as np
+
+from tricho_pipeline.analysis.trend import trend_block
+
+LABELS = ["<30 μm", "30-60 μm", "60-90 μm", ">90 μm"]
+
+def _item(loc: str, counts, density, follicles: int = 10, day: str = None) -> dict:
+    it = {
+        "location": loc,
+        "data": {
+            "counts": {"follicles": follicles, "hairs": sum(counts)},
+            "classification": dict(zip(LABELS, counts)),
+            "density_per_cm2": dict(zip(LABELS, density)),
+        },
+    }
+    if day:
+        it["appointment_date"] = day
+    return it
+
+def test_delta_prev_is_none_for_region_missing_last_time():
+    history = [_item("A", [1, 2, 3, 4], [10, 20, 30, 40], day="2025-01-01")]
+    current = [_item("A", [2, 2, 3, 4], [12, 20, 30, 40]), _item("B", [1, 1, 1, 1], [5, 5, 5, 5])]
+    t = trend_block(history, current, "2025-04-01")
+
+    assert t["visits"] == ["2025-01-01", "2025-04-01"]
+    a, b = t["regions"]["A"], t["regions"]["B"]
+    assert a["delta_prev"]["density_per_cm2"]["<30 μm"] == 2.0
+    assert b["density_per_cm2"]["<30 μm"] == [None, 5.0]
+    assert b["delta_prev"]["density_per_cm2"] == dict.fromkeys(LABELS)
+    assert b["delta_prev"]["thin60"] is None and b["slope_per_year"]["thin60"] is None
+
+def test_current_date_rows_in_history_are_ignored():
+    history = [_item("A", [1, 2, 3, 4], [10, 20, 30, 40], day="2025-04-01")]
+    t = trend_block(history, [_item("A", [2, 2, 3, 4], [12, 20, 30, 40])], "2025-04-01")
+    assert t["visits"] == ["2025-04-01"]
+    assert t["regions"]["A"]["delta_prev"]["thin60"] is None
+
+def test_slope_over_three_visits_matches_least_squares():
+    days = ["2024-01-01", "2024-05-20", "2025-02-10", "2025-09-01"]
+    dens = [100.0, 96.0, 91.0, 80.0]
+    thin = [[2, 3, 5, 10], [3, 3, 5, 9], [3, 4, 6, 7], [5, 5, 4, 6]]
+    items = [_item("A", c, [d, 0, 0, 0]) for c, d in zip(thin, dens)]
+    history = [dict(it, appointment_date=day) for it, day in zip(items[:-1], days[:-1])]
+    t = trend_block(history, items[-1:], days[-1])
+
+    years = np.array([(date.fromisoformat(d) - date.fromisoformat(days[0])).days / 365.25 for d in days])
+    a = t["regions"]["A"]
+    assert a["slope_per_year"]["density_per_cm2"]["<30 μm"] == round(np.polyfit(years, dens, 1)[0], 2)
+    share = [(c[0] + c[1]) / sum(c) for c in thin]
+    assert a["slope_per_year"]["thin60"] == round(np.polyfit(years, share, 1)[0], 4)
+    assert a["delta_first"]["density_per_cm2"]["<30 μm"] == -20.0
+    assert a["delta_prev"]["density_per_cm2"]["<30 μm"] == -11.0
@@ -0,0 +1,33 @@
+import json, os
+
+import numpy as np
+
+from tricho_pipeline.analysis.tricho_analyzer import TrichoAnalyzer
+from tricho_pipeline.analysis.tricho_loader import loads_tricho
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "..", "sample_data", "json", "tricho_0.json")
+
+def _sample() -> dict:
+    with open(SAMPLE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def test_hairs_are_decided_by_array_not_keys():
+    d = _sample()
+    for h in d["hairs"][:5]:
+        del h["cx"], h["cy"]
+    d["hairs"][5].pop("uuid", None)
+    rec = loads_tricho(json.dumps(d))
+
+    assert len(rec.hairs) == len(d["hairs"])
+    assert np.isnan(rec.hairs.cx[:5]).all() and np.isnan(rec.hairs.cy[:5]).all()
+    assert len(rec.follicles) == len(d["follicle_units"])
+    an = TrichoAnalyzer()
+    assert an.analyze(rec) == an.analyze(d)
+
+def test_hair_without_any_known_key_still_counts():
+    d = _sample()
+    d["hairs"].append({"h": 10.0})
+    d["follicle_units"].append({"y": 1.0})
+    rec = loads_tricho(json.dumps(d))
+    assert len(rec.hairs) == len(d["hairs"]) and np.isnan(rec.hairs.w[-1]) and rec.hairs.follicle[-1] == -1
+    assert len(rec.follicles) == len(d["follicle_units"]) and rec.follicles.uuid[-1] == -1